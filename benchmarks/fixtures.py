@@ -0,0 +1,77 @@
+import os
+import random
+import shutil
+import sys
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+
+
+def get_fixture_dir(fixtures_dir: str, grid_size: int, episodes: int, seed: int):
+    """
+    Directory holding a q_table of grid_size trained by self-play for episodes episodes from seed. It is generated
+    once, the training being reproducible for the same seed, and reused by the next runs
+    Returns:
+        (str) absolute path of the directory, Intellect looks up the database in the working directory
+    """
+    fixture_dir = os.path.abspath(os.path.join(fixtures_dir, f'grid{grid_size}_episodes{episodes}_seed{seed}'))
+    if os.path.exists(os.path.join(fixture_dir, Intellect.get_db_path(grid_size))):
+        return fixture_dir
+
+    print(f'Generating the {grid_size}x{grid_size} fixture q_table ({episodes} episodes)', file=sys.stderr, flush=True)
+    tmp_dir = f'{fixture_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    cwd = os.getcwd()
+    engine = Intellect.ENGINE
+    os.chdir(tmp_dir)
+    try:
+        random.seed(seed)
+        Intellect.ENGINE = BitIceBreaker
+        Intellect.train_vs_self(grid_size, episodes, flush_episodes=1000)
+    finally:
+        Intellect.ENGINE = engine
+        os.chdir(cwd)
+    os.replace(tmp_dir, fixture_dir)
+    return fixture_dir
+
+
+def copy_db(fixture_dir: str, grid_size: int, destination_dir: str):
+    """
+    Copies the fixture q_table to destination_dir, e.g. for training on it without changing the fixture
+    """
+    db_path = Intellect.get_db_path(grid_size)
+    shutil.copyfile(os.path.join(fixture_dir, db_path), os.path.join(destination_dir, db_path))
+
+
+def get_games(grid_size: int, num_games: int):
+    """
+    Random games, played until the bear falls. They only depend on the seed of random
+    Returns:
+        (list) (initial game state, moves) of each game
+    """
+    games = []
+    for _ in range(num_games):
+        game_obj = IceBreaker(grid_size)
+        initial_game_state = game_obj.get_game_state()
+        position = BitIceBreaker.get_position(initial_game_state)
+        moves = []
+        while position is not None:
+            move = random.choice(BitIceBreaker.get_possible_moves(position))
+            moves.append(move)
+            position = BitIceBreaker.apply_move(position, move, grid_size)
+        games.append((initial_game_state, moves))
+    return games
+
+
+def get_q_table_states(grid_size: int, num_states: int):
+    """
+    Canonical game states sampled at random from the q_table in the working directory
+    """
+    con = Intellect.get_read_only_db_conn(grid_size)
+    encoded_game_states = [row[0] for row in con.execute(
+        'SELECT DISTINCT game_state FROM q_table ORDER BY game_state')]
+    con.close()
+    return [IceBreaker.decode_game_state(encoded_game_state, grid_size)
+            for encoded_game_state in random.sample(encoded_game_states, min(num_states, len(encoded_game_states)))]
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from benchmarks import suite
+from benchmarks.fixtures import get_fixture_dir
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit}
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """
+    Prints the change of every measurement of current from baseline, flagging the ones worse by more than threshold
+    percent
+    Returns:
+        (list) names of the regressed measurements
+    """
+    if baseline['config'] != current['config']:
+        print('Warning: the baseline was measured with another configuration, the results may not be comparable')
+    regressions = []
+    for name, result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if baseline_result is None:
+            print(f'{name}: {result["value"]:.2f} {result["unit"]} (not in the baseline)')
+            continue
+        change = (result['value'] - baseline_result['value']) / baseline_result['value'] * 100
+        worse_change = -change if result['higher_is_better'] else change
+        flag = ''
+        if worse_change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif -worse_change > threshold:
+            flag = '  improvement'
+        print(f'{name}: {baseline_result["value"]:.2f} -> {result["value"]:.2f} {result["unit"]}'
+              f' ({change:+.1f}%){flag}')
+    for name in sorted(baseline['results'].keys() - current['results'].keys()):
+        print(f'{name}: not measured')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the engines, minimax, q_table lookups, training and the API'
+                                                 ' on fixed seeds and fixture databases.')
+    parser.add_argument('--benchmarks', nargs='+', default=list(suite.BENCHMARKS), choices=list(suite.BENCHMARKS),
+                        help=f'Default: {" ".join(suite.BENCHMARKS)}')
+    parser.add_argument('--output', help='Write the results as JSON to this file instead of printing them')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Compare the results with those of a previous --output, exits with status 1 if any of'
+                             ' them regressed')
+    parser.add_argument('--results', help='With --compare, compare the results of this file instead of running the'
+                                          ' benchmarks')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Percent by which a result has to be worse than the baseline to regress. Default: 10')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of each benchmark, the best of which is kept. Default: 3')
+    parser.add_argument('--fixtures-dir', default='benchmark_fixtures',
+                        help='Directory of the generated fixture databases. Default: benchmark_fixtures')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    parser.add_argument('--fixture-grid-size', type=int, default=4,
+                        help='Grid size of the q_table used by the lookup, training and API benchmarks. Default: 4')
+    parser.add_argument('--fixture-episodes', type=int, default=20000,
+                        help='Self-play episodes the fixture q_table is trained for. Default: 20000')
+    parser.add_argument('--engine-grid-sizes', type=int, nargs='+', default=[4, 5, 6, 7, 8, 9],
+                        help='Default: 4 5 6 7 8 9')
+    parser.add_argument('--engine-games', type=int, default=500, help='Games replayed per grid size. Default: 500')
+    parser.add_argument('--minimax-grid-sizes', type=int, nargs='+', default=[5, 6, 7], help='Default: 5 6 7')
+    parser.add_argument('--minimax-positions', type=int, default=5, help='Positions per grid size. Default: 5')
+    parser.add_argument('--minimax-max-iced', type=int, default=22,
+                        help='Positions are played out until at most this many iced blocks are left. Default: 22')
+    parser.add_argument('--lookup-states', type=int, default=5000, help='Default: 5000')
+    parser.add_argument('--training-episodes', type=int, default=2000, help='Default: 2000')
+    parser.add_argument('--api-requests', type=int, default=2000, help='Default: 2000')
+    parser.add_argument('--api-clients', type=int, default=8, help='Number of concurrent clients. Default: 8')
+    args = parser.parse_args()
+    # the benchmarks run in the fixture directory
+    for path_arg in ('output', 'compare', 'results'):
+        if getattr(args, path_arg):
+            setattr(args, path_arg, os.path.abspath(getattr(args, path_arg)))
+
+    if args.results:
+        if not args.compare:
+            parser.error('--results requires --compare')
+        with open(args.results) as f:
+            report = json.load(f)
+    else:
+        config = {key: value for key, value in vars(args).items()
+                  if key not in ('benchmarks', 'output', 'compare', 'results', 'threshold', 'fixtures_dir')}
+        fixture_dir = get_fixture_dir(args.fixtures_dir, args.fixture_grid_size, args.fixture_episodes, args.seed)
+        os.chdir(fixture_dir)
+        results = suite.run(args.benchmarks, config, args.repeat)
+        report = {'environment': get_environment(), 'config': config,
+                  'results': {name: result.to_dict() for name, result in results.items()}}
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        elif not args.compare:
+            print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,185 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from benchmarks.fixtures import copy_db, get_games, get_q_table_states
+from models.bit_ice_breaker import BitIceBreaker
+from models.intellect import Intellect
+from scripts.benchmark_minimax import get_positions
+from scripts.load_test_api import get_game_states, percentile
+from scripts.optimal_move_api import OptimalMove, OptimalMoveServer
+
+
+class QuietOptimalMove(OptimalMove):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Result:
+    """
+    Measurement of a benchmark, e.g. `Result(1234.5, 'moves/s', higher_is_better=True)`
+    """
+
+    def __init__(self, value: float, unit: str, higher_is_better: bool):
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def is_better_than(self, other):
+        return self.value > other.value if self.higher_is_better else self.value < other.value
+
+    def to_dict(self):
+        return {'value': self.value, 'unit': self.unit, 'higher_is_better': self.higher_is_better}
+
+
+def benchmark_engines(config: dict):
+    """
+    Moves applied per second by each engine, replaying the same random games
+    """
+    results = {}
+    for grid_size in config['engine_grid_sizes']:
+        games = get_games(grid_size, config['engine_games'])
+        num_moves = sum(len(moves) for _, moves in games)
+        for name, engine in Intellect.ENGINES.items():
+            start = time.perf_counter()
+            for initial_game_state, moves in games:
+                position = engine.get_position(initial_game_state)
+                for move in moves:
+                    position = engine.apply_move(position, move, grid_size)
+            elapsed = time.perf_counter() - start
+            results[f'engine.{name}.{grid_size}x{grid_size}.moves_per_second'] = Result(num_moves / elapsed,
+                                                                                        'moves/s', True)
+    return results
+
+
+def benchmark_minimax(config: dict):
+    """
+    Latency of get_minimax_move on the same random positions, each searched with an empty transposition table
+    """
+    results = {}
+    for grid_size in config['minimax_grid_sizes']:
+        latencies = []
+        for game_state in get_positions(grid_size, config['minimax_positions'], config['minimax_max_iced']):
+            Intellect._solver = None
+            start = time.perf_counter()
+            Intellect.get_minimax_move(game_state)
+            latencies.append((time.perf_counter() - start) * 1000)
+        Intellect._solver = None
+        results[f'minimax.{grid_size}x{grid_size}.mean_ms'] = Result(statistics.mean(latencies), 'ms', False)
+        results[f'minimax.{grid_size}x{grid_size}.max_ms'] = Result(max(latencies), 'ms', False)
+    return results
+
+
+def benchmark_lookups(config: dict):
+    """
+    get_optimal_move calls per second, without experimentation, on states of the fixture q_table
+    """
+    grid_size = config['fixture_grid_size']
+    game_states = get_q_table_states(grid_size, config['lookup_states'])
+    con = Intellect.get_read_only_db_conn(grid_size)
+    try:
+        start = time.perf_counter()
+        for game_state in game_states:
+            Intellect.get_optimal_move(con, game_state, 0, learn=False)
+        elapsed = time.perf_counter() - start
+    finally:
+        con.close()
+    return {f'lookup.{grid_size}x{grid_size}.lookups_per_second': Result(len(game_states) / elapsed, 'lookups/s',
+                                                                         True)}
+
+
+def benchmark_training(config: dict):
+    """
+    Self-play episodes per second on a copy of the fixture q_table, storing every episode and in batches
+    """
+    grid_size = config['fixture_grid_size']
+    fixture_dir = os.getcwd()
+    results = {}
+    engine = Intellect.ENGINE
+    Intellect.ENGINE = BitIceBreaker
+    try:
+        for flush_episodes in (0, 1000):
+            with tempfile.TemporaryDirectory(prefix='icebreaker_benchmark_') as tmp_dir:
+                copy_db(fixture_dir, grid_size, tmp_dir)
+                os.chdir(tmp_dir)
+                try:
+                    start = time.perf_counter()
+                    Intellect.train_vs_self(grid_size, config['training_episodes'], flush_episodes=flush_episodes)
+                    elapsed = time.perf_counter() - start
+                finally:
+                    os.chdir(fixture_dir)
+            name = 'flush_every_episode' if flush_episodes == 0 else f'flush_{flush_episodes}'
+            results[f'training.{grid_size}x{grid_size}.{name}.episodes_per_second'] = Result(
+                config['training_episodes'] / elapsed, 'episodes/s', True)
+    finally:
+        Intellect.ENGINE = engine
+    return results
+
+
+def benchmark_api(config: dict):
+    """
+    Throughput and latency of the API serving the fixture q_table without its cache, under concurrent clients
+    """
+    grid_size = config['fixture_grid_size']
+    urls = [f'/?array={game_state}' for game_state in get_game_states(grid_size, config['api_requests'])]
+    httpd = OptimalMoveServer(('127.0.0.1', 0), [grid_size], config['api_clients'], 1, 30, cache_size=0)
+    httpd.RequestHandlerClass = QuietOptimalMove
+    server_thread = threading.Thread(target=httpd.serve_forever)
+    server_thread.start()
+    base_url = f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    def request(url: str):
+        start = time.perf_counter()
+        with urlopen(f'{base_url}{url}') as response:
+            response.read()
+        return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(config['api_clients']) as executor:
+            latencies = sorted(executor.map(request, urls))
+        elapsed = time.perf_counter() - start
+    finally:
+        httpd.shutdown()
+        server_thread.join()
+        httpd.server_close()
+    return {
+        f'api.{grid_size}x{grid_size}.requests_per_second': Result(len(latencies) / elapsed, 'requests/s', True),
+        f'api.{grid_size}x{grid_size}.p50_ms': Result(percentile(latencies, 50) * 1000, 'ms', False),
+        f'api.{grid_size}x{grid_size}.p99_ms': Result(percentile(latencies, 99) * 1000, 'ms', False),
+    }
+
+
+BENCHMARKS = {
+    'engine': benchmark_engines,
+    'minimax': benchmark_minimax,
+    'lookup': benchmark_lookups,
+    'training': benchmark_training,
+    'api': benchmark_api,
+}
+
+
+def run(names: list, config: dict, repeat: int):
+    """
+    Runs the benchmarks in the working directory, which has the fixture q_table. Every repetition is seeded with
+    config['seed'], so that it measures the same work, and the best result of the repetitions is kept
+    Returns:
+        (dict) name of the measurement -> Result
+    """
+    results = {}
+    for name in names:
+        for _ in range(repeat):
+            random.seed(config['seed'])
+            for key, result in BENCHMARKS[name](config).items():
+                if key not in results or result.is_better_than(results[key]):
+                    results[key] = result
+        print(f'{name} benchmark done', file=sys.stderr, flush=True)
+    return results
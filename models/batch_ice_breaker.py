@@ -0,0 +1,193 @@
+import random
+import sqlite3
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('BatchIceBreaker needs numpy, install it with `pip install -r requirements-batch.txt`') from e
+
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+from models.q_table import QTable
+from models.symmetry import Symmetry
+
+
+class BatchIceBreaker:
+    """
+    Plays many games of IceBreaker in lockstep, which needs numpy. The lakes are kept in a
+    (num_games, grid_size, grid_size) array and a vector of moves, one per game, is applied at once.
+
+    The collapse is computed on the whole array: in every 2x2 square whose 2 diagonal blocks are uniced, the other 2
+    blocks collapse, and this is repeated until nothing changes. A game state is always closed under this rule, so the
+    fixpoint is the same as the recursive collapse of IceBreaker._collapse_surrounding_blocks
+    """
+
+    def __init__(self, grid_size: int, num_games: int, rng: np.random.Generator = None):
+        assert 3 < grid_size < 10
+        self.grid_size = grid_size
+        self.num_games = num_games
+        self.rng = rng or np.random.default_rng()
+        self.lakes = np.full((num_games, grid_size, grid_size), IceBreaker.BlockState.ICED.value, dtype=np.int8)
+        # same distribution of the bear block as IceBreaker
+        max_bear_row_index = int(grid_size / 2) - 1
+        max_bear_col_index = int(grid_size / 2) + (grid_size % 2) - 1
+        bear_rows = self.rng.integers(0, max_bear_col_index + 1, num_games)
+        bear_cols = np.where(bear_rows > max_bear_row_index, bear_rows,
+                             self.rng.integers(0, max_bear_col_index + 1, num_games))
+        self.lakes[np.arange(num_games), bear_rows, bear_cols] = IceBreaker.BlockState.BEAR.value
+        self.game_ended = np.zeros(num_games, dtype=bool)
+        # id of the player who won each game, 0 while the game is in progress
+        self.winners = np.zeros(num_games, dtype=np.int8)
+        self.num_moves = np.zeros(num_games, dtype=np.int32)
+        # every game starts with player 1 and each move is played in all the games in progress at once
+        self.current_player_id = 1
+
+    @classmethod
+    def from_game_states(cls, game_states: list, rng: np.random.Generator = None):
+        """
+        Batch starting from the given game states, which should all have the same grid size
+        """
+        grid_size = int(len(game_states[0]) ** 0.5)
+        batch = cls(grid_size, len(game_states), rng)
+        batch.lakes[:] = np.frombuffer(''.join(game_states).encode(), dtype=np.uint8).reshape(
+            batch.lakes.shape) - ord('0')
+        return batch
+
+    def get_game_states(self, game_indices: np.ndarray = None):
+        """
+        Returns:
+            (list) game state string of each game, or of the games at game_indices
+        """
+        lakes = self.lakes if game_indices is None else self.lakes[game_indices]
+        total_indices = self.grid_size ** 2
+        game_states = (lakes.reshape(-1) + ord('0')).astype(np.uint8).tobytes().decode()
+        return [game_states[i:i + total_indices] for i in range(0, len(game_states), total_indices)]
+
+    def get_active_game_indices(self):
+        return np.flatnonzero(~self.game_ended)
+
+    def pick_blocks(self, moves: np.ndarray):
+        """
+        Picks moves[i] in the game i, for every game in progress. A game ends when the picked block is not iced or the
+        collapse reaches the bear, and the player who picked the block loses it
+        """
+        game_indices = self.get_active_game_indices()
+        moves = np.asarray(moves)[game_indices]
+        flat_lakes = self.lakes.reshape(self.num_games, -1)
+        lost = flat_lakes[game_indices, moves] != IceBreaker.BlockState.ICED.value
+        flat_lakes[game_indices[~lost], moves[~lost]] = IceBreaker.BlockState.UNICED.value
+        collapsed_game_indices = game_indices[~lost]
+        lost[~lost] = self._collapse(collapsed_game_indices)
+
+        ended_game_indices = game_indices[lost]
+        self.game_ended[ended_game_indices] = True
+        self.winners[ended_game_indices] = 3 - self.current_player_id
+        self.num_moves[game_indices] += 1
+        self.current_player_id = 3 - self.current_player_id
+
+    def _collapse(self, game_indices: np.ndarray):
+        """
+        Collapses the lakes at game_indices until the fixpoint
+        Returns:
+            (np.ndarray) whether the collapse reached the bear, for each of game_indices. Those lakes are left as they
+            were before the collapse
+        """
+        lakes = self.lakes[game_indices]
+        uniced = lakes == IceBreaker.BlockState.UNICED.value
+        # only the lakes which changed in the last iteration can collapse further
+        changing = np.arange(len(game_indices))
+        while len(changing):
+            changing_uniced = uniced[changing]
+            main_diagonal = changing_uniced[:, :-1, :-1] & changing_uniced[:, 1:, 1:]
+            anti_diagonal = changing_uniced[:, :-1, 1:] & changing_uniced[:, 1:, :-1]
+            collapsed = np.zeros_like(changing_uniced)
+            collapsed[:, :-1, 1:] |= main_diagonal
+            collapsed[:, 1:, :-1] |= main_diagonal
+            collapsed[:, :-1, :-1] |= anti_diagonal
+            collapsed[:, 1:, 1:] |= anti_diagonal
+            collapsed &= ~changing_uniced
+            changed = collapsed.any(axis=(1, 2))
+            uniced[changing] = changing_uniced | collapsed
+            changing = changing[changed]
+
+        lost = (uniced & (lakes == IceBreaker.BlockState.BEAR.value)).any(axis=(1, 2))
+        lakes[uniced] = IceBreaker.BlockState.UNICED.value
+        self.lakes[game_indices[~lost]] = lakes[~lost]
+        return lost
+
+    def play(self, p1, p2):
+        """
+        Plays all the games until they end, p1 and p2 are players having get_moves(batch)
+        Returns:
+            (np.ndarray) id of the winner of each game
+        """
+        while not self.game_ended.all():
+            player = p1 if self.current_player_id == 1 else p2
+            self.pick_blocks(player.get_moves(self))
+        return self.winners
+
+
+class RandomPlayer:
+    """
+    Picks one of the iced blocks uniformly at random, or a losing block if no block is iced
+    """
+
+    def __init__(self, rng: np.random.Generator = None):
+        self.rng = rng or np.random.default_rng()
+
+    def get_moves(self, batch: BatchIceBreaker):
+        iced = batch.lakes.reshape(batch.num_games, -1) == IceBreaker.BlockState.ICED.value
+        return np.argmax(self.rng.random(iced.shape) * iced, axis=1)
+
+
+class PolicyPlayer:
+    """
+    Picks the move returned by policy(game_state), e.g. Intellect.get_tablebase_move or the get method of a dict of
+    precomputed moves, and the move of fallback_player where the policy returns None
+    """
+
+    def __init__(self, policy, fallback_player=None):
+        self.policy = policy
+        self.fallback_player = fallback_player or RandomPlayer()
+
+    def get_moves(self, batch: BatchIceBreaker):
+        moves = self.fallback_player.get_moves(batch)
+        game_indices = batch.get_active_game_indices()
+        for game_index, game_state in zip(game_indices, batch.get_game_states(game_indices)):
+            move = self.policy(game_state)
+            if move is not None:
+                moves[game_index] = move
+        return moves
+
+
+class QTablePlayer:
+    """
+    Picks the same moves as Intellect.get_optimal_move without experimentation, looking up the q_table once per move
+    of the batch
+    """
+
+    def __init__(self, con: sqlite3.Connection | QTable):
+        self.con = con
+
+    def get_moves(self, batch: BatchIceBreaker):
+        moves = np.zeros(batch.num_games, dtype=np.int64)
+        canonical_game_states = {}
+        game_indices = batch.get_active_game_indices()
+        for game_index, game_state in zip(game_indices, batch.get_game_states(game_indices)):
+            tablebase_move = Intellect.get_tablebase_move(game_state)
+            if tablebase_move is not None:
+                moves[game_index] = tablebase_move
+            else:
+                canonical_game_states[game_index] = (game_state, *Symmetry.canonicalize_game_state(game_state))
+
+        best_moves = Intellect.get_best_moves_of_states(
+            self.con, [canonical_game_state for _, canonical_game_state, _ in canonical_game_states.values()])
+        for game_index, (game_state, canonical_game_state, transform) in canonical_game_states.items():
+            _, canonical_moves = best_moves[canonical_game_state]
+            if canonical_moves:
+                moves[game_index] = Symmetry.from_canonical_move(random.choice(canonical_moves), batch.grid_size,
+                                                                 transform)
+            else:
+                moves[game_index] = Intellect.get_optimal_move(self.con, game_state, experimentation=0,
+                                                               learn=False)[1]
+        return moves
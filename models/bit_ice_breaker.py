@@ -0,0 +1,199 @@
+from models.ice_breaker import IceBreaker
+from models.metrics import Metrics
+
+
+class BitIceBreaker(IceBreaker):
+    """
+    Drop-in replacement of IceBreaker which keeps the lake as integer bitmasks. Bit `i` of `iced_mask` is set when the
+    block `i` is iced, and the bear block is tracked by its index. A position is the tuple (iced_mask, bear_index)
+    """
+
+    # grid_size -> (diagonal mask per block, {uniced diagonal blocks mask: adjacent blocks to collapse} per block)
+    _collapse_tables = {}
+    # block state byte -> '1' if the block is iced else '0'
+    _ICED_DIGITS = bytes.maketrans(b'\x00\x01\x02', b'010')
+
+    def __init__(self, grid_size: int, bear_index: int = None):
+        super().__init__(grid_size, bear_index)
+        self.iced_mask, self.bear_index = self.get_position(self.get_game_state())
+
+    def pick_block(self, game_state: str, block_index: int):
+        if self.game_ended:
+            return
+        self.current_player.move_per_state.append([game_state, block_index])
+        start = Metrics.start()
+        iced_mask = self.register_uniced_mask(self.iced_mask, self.bear_index, block_index, self.grid_size)
+        if iced_mask == -1:
+            # replay the move on the lake_array so that it ends up exactly how IceBreaker would leave it
+            IceBreaker.register_uniced_block(self.lake_array, block_index, self.grid_size)
+            self.game_ended = True
+        else:
+            for uniced_block_index in self.get_block_indices(self.iced_mask ^ iced_mask):
+                self.lake_array[uniced_block_index] = self.BlockState.UNICED.value
+            self.iced_mask = iced_mask
+        if start is not None:
+            Metrics.observe_since('engine_seconds', start, engine=type(self).__name__)
+        if self.current_player.id != self.p1.id:
+            self.current_player = self.p1
+        else:
+            self.current_player = self.p2
+        if self.game_ended:
+            self.winner = self.current_player
+
+    @classmethod
+    def get_position(cls, game_state: str):
+        iced_mask = int(game_state[::-1].replace(str(cls.BlockState.BEAR.value), str(cls.BlockState.UNICED.value)), 2)
+        return iced_mask, game_state.index(str(cls.BlockState.BEAR.value))
+
+    @classmethod
+    def get_position_from_lake_array(cls, lake_array: list):
+        """
+        Same as get_position(game_state) for the lake_array of the game_state, converted in one pass
+        """
+        block_states = bytes(lake_array)
+        return (int(block_states.translate(cls._ICED_DIGITS)[::-1], 2),
+                block_states.index(cls.BlockState.BEAR.value))
+
+    @classmethod
+    def get_game_state_from_position(cls, position: tuple, grid_size: int):
+        iced_mask, bear_index = position
+        game_state = format(iced_mask, f'0{grid_size ** 2}b')[::-1]
+        return f'{game_state[:bear_index]}{cls.BlockState.BEAR.value}{game_state[bear_index + 1:]}'
+
+    @classmethod
+    def get_possible_moves(cls, position: tuple):
+        return cls.get_block_indices(position[0])
+
+    @classmethod
+    def apply_move(cls, position: tuple, block_index: int, grid_size: int):
+        start = Metrics.start()
+        iced_mask = cls.register_uniced_mask(position[0], position[1], block_index, grid_size)
+        if start is not None:
+            Metrics.observe_since('engine_seconds', start, engine=cls.__name__)
+        if iced_mask == -1:
+            return None
+        return iced_mask, position[1]
+
+    @staticmethod
+    def get_block_indices(mask: int):
+        """
+        Returns the indices of set bits in ascending order
+        """
+        block_indices = []
+        while mask:
+            lowest_bit = mask & -mask
+            block_indices.append(lowest_bit.bit_length() - 1)
+            mask ^= lowest_bit
+        return block_indices
+
+    @classmethod
+    def register_uniced_block(cls, lake_array: list, block_index: int, grid_size: int = None):
+        """
+        Same as IceBreaker.register_uniced_block, but the collapse is computed on bitmasks. lake_array is converted to a
+        position on every call, so a caller playing many moves should convert it once with get_position and use
+        apply_move instead
+        """
+        if not grid_size:
+            grid_size = int(len(lake_array) ** 0.5)
+        iced_mask, bear_index = cls.get_position_from_lake_array(lake_array)
+        new_iced_mask = cls.register_uniced_mask(iced_mask, bear_index, block_index, grid_size)
+        if new_iced_mask == -1:
+            return IceBreaker.register_uniced_block(lake_array, block_index, grid_size)
+        for uniced_block_index in cls.get_block_indices(iced_mask ^ new_iced_mask):
+            lake_array[uniced_block_index] = cls.BlockState.UNICED.value
+
+    @classmethod
+    def _analyze_moves(cls, game_state: str):
+        grid_size = int(len(game_state) ** 0.5)
+        losing_moves, footprints = cls.analyze_mask(*cls.get_position(game_state), grid_size)
+        return tuple(losing_moves), footprints
+
+    @classmethod
+    def analyze_mask(cls, iced_mask: int, bear_index: int, grid_size: int):
+        """
+        Same as IceBreaker.analyze_moves on a bitmask position, without keeping the result. Only the blocks having a
+        uniced diagonal block can collapse others, so the collapse of the other blocks is not computed
+        Returns:
+            (list, dict) moves which collapse the bear in ascending order, and the mask of the blocks uniced by every
+            other move, in ascending order of the moves. The new iced_mask of a move is `iced_mask ^ footprint`
+        """
+        diagonal_masks, _ = cls._get_collapse_tables(grid_size)
+        uniced_mask = ~(iced_mask | (1 << bear_index))
+        losing_moves = []
+        footprints = {}
+        for block_index in cls.get_block_indices(iced_mask):
+            if not diagonal_masks[block_index] & uniced_mask:
+                footprints[block_index] = 1 << block_index
+                continue
+            new_iced_mask = cls.register_uniced_mask(iced_mask, bear_index, block_index, grid_size)
+            if new_iced_mask == -1:
+                losing_moves.append(block_index)
+            else:
+                footprints[block_index] = iced_mask ^ new_iced_mask
+        return losing_moves, footprints
+
+    @classmethod
+    def register_uniced_mask(cls, iced_mask: int, bear_index: int, block_index: int, grid_size: int):
+        """
+        Registers the block_index as uniced and collapses the surrounding blocks. Collapsing a block can only make more
+        blocks collapse, so the blocks left iced, and whether the bear collapses, do not depend on the order in which
+        the blocks are collapsed, and the result is always the same as the list engine
+        Returns:
+            (int) -1 if game ended otherwise the new iced_mask
+        """
+        diagonal_masks, collapse_tables = cls._get_collapse_tables(grid_size)
+        block_bit = 1 << block_index
+        if not iced_mask & block_bit:
+            return -1
+        iced_mask ^= block_bit
+        bear_bit = 1 << bear_index
+        pending = [block_index]
+        while pending:
+            uniced_block_index = pending.pop()
+            for adjacent_block_index in collapse_tables[uniced_block_index][
+                    diagonal_masks[uniced_block_index] & ~(iced_mask | bear_bit)]:
+                adjacent_block_bit = 1 << adjacent_block_index
+                if iced_mask & adjacent_block_bit:
+                    iced_mask ^= adjacent_block_bit
+                    pending.append(adjacent_block_index)
+                elif adjacent_block_bit == bear_bit:
+                    return -1
+        return iced_mask
+
+    @classmethod
+    def _get_collapse_tables(cls, grid_size: int):
+        """
+        For every block, precompute the mask of its diagonal blocks, and for every combination of uniced diagonal
+        blocks, the common adjacent blocks which should be collapsed (in the order IceBreaker collapses them)
+        """
+        if grid_size in cls._collapse_tables:
+            return cls._collapse_tables[grid_size]
+
+        diagonal_masks = []
+        collapse_tables = []
+        for block_index in range(grid_size ** 2):
+            row = int(block_index / grid_size)
+            col = block_index % grid_size
+            diagonals = []
+            for current_row in [r for r in (row - 1, row + 1) if 0 <= r < grid_size]:
+                for current_col in [c for c in (col - 1, col + 1) if 0 <= c < grid_size]:
+                    diagonal_block_index = (current_row * grid_size) + current_col
+                    adjacent_block_indices = ((current_row * grid_size) + col, (row * grid_size) + current_col)
+                    diagonals.append((1 << diagonal_block_index, adjacent_block_indices))
+
+            collapse_table = {}
+            for combination in range(1 << len(diagonals)):
+                uniced_diagonal_mask = 0
+                adjacent_block_indices = []
+                for i, (diagonal_block_bit, adjacent_pair) in enumerate(diagonals):
+                    if not combination >> i & 1:
+                        continue
+                    uniced_diagonal_mask |= diagonal_block_bit
+                    adjacent_block_indices += [a for a in adjacent_pair if a not in adjacent_block_indices]
+                collapse_table[uniced_diagonal_mask] = tuple(adjacent_block_indices)
+
+            diagonal_masks.append(sum(diagonal_block_bit for diagonal_block_bit, _ in diagonals))
+            collapse_tables.append(collapse_table)
+
+        cls._collapse_tables[grid_size] = (diagonal_masks, collapse_tables)
+        return cls._collapse_tables[grid_size]
@@ -0,0 +1,154 @@
+import itertools
+import random
+import statistics
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+
+
+class Evaluation:
+    """
+    Plays the bot without experimentation against minimax like Intellect.test_optimal_vs_minimax, with the episodes
+    spread across a pool of workers processes.
+
+    Episodes cycle through every combination of initial bear block, rotation of the grid seen by minimax and player
+    moving first, so that a whole number of cycles covers them evenly. Episode `i` plays the combination `i` modulo the
+    cycle length, with random seeded from seed and `i`.
+
+    Episodes are submitted in tasks of whole cycles, which are the same whatever the number of workers. The minimax
+    transposition table is cleared at the start of every task and kept between its episodes, since its entries are
+    exact, so the results do not depend on the workers. With target_width, the evaluation stops after the first task
+    completing the results of the episodes before it, in order, for which the confidence interval of the win rate is at
+    most target_width wide, so that a run with the same seed stops at the same episode
+    """
+
+    ROTATIONS = (-1, 0, 1, 2)
+    # read-only connection of the worker process, kept between the tasks
+    _con = None
+
+    def __init__(self, grid_size: int, workers: int = 1, seed: int = 0, confidence: float = 0.95,
+                 cycles_per_task: int = 1):
+        assert workers > 0 and 0 < confidence < 1 and cycles_per_task > 0
+        self.grid_size = grid_size
+        self.workers = workers
+        self.seed = seed
+        self.confidence = confidence
+        self.cycle = list(itertools.product(IceBreaker.get_initial_bear_indices(grid_size), self.ROTATIONS,
+                                            (True, False)))
+        self.episodes_per_task = len(self.cycle) * cycles_per_task
+        # standard normal quantile of the two-sided confidence
+        self.z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+    def get_episode(self, episode_index: int):
+        """
+        Returns:
+            (int, int, bool) initial bear block, rotation of the grid seen by minimax and whether the bot moves first
+        """
+        return self.cycle[episode_index % len(self.cycle)]
+
+    def run(self, max_episodes: int, target_width: float = None):
+        """
+        Plays at most max_episodes episodes, rounded up to whole cycles
+        Returns:
+            (dict) report of get_report on the episodes played
+        """
+        # checks the schema of the database, which the workers only read
+        Intellect.get_db_conn(self.grid_size).close()
+        engine = next(name for name, engine in Intellect.ENGINES.items() if engine is Intellect.ENGINE)
+        num_tasks = -(-max_episodes // self.episodes_per_task)
+        # task index -> results of its episodes, see _play_episodes
+        task_results = {}
+        wins = episodes = 0
+        completed_tasks = 0
+        stopped_early = False
+        with ProcessPoolExecutor(self.workers) as executor:
+            pending = {}
+            next_task_index = 0
+            while completed_tasks < num_tasks and not stopped_early:
+                # a few tasks in advance so that no worker waits for the results to be checked
+                while len(pending) < self.workers * 2 and next_task_index < num_tasks:
+                    first_episode = next_task_index * self.episodes_per_task
+                    pending[executor.submit(self._play_episodes, self.grid_size, engine, self.seed,
+                                            self._get_task_episodes(first_episode))] = next_task_index
+                    next_task_index += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_results[pending.pop(future)] = future.result()
+                while completed_tasks in task_results and not stopped_early:
+                    results = task_results[completed_tasks]
+                    wins += sum(won for _, won in results)
+                    episodes += len(results)
+                    completed_tasks += 1
+                    if target_width is not None and completed_tasks < num_tasks:
+                        lower, upper = self.get_interval(wins, episodes)
+                        stopped_early = upper - lower <= target_width
+            for future in pending:
+                future.cancel()
+
+        played = [result for task_index in range(completed_tasks) for result in task_results[task_index]]
+        return self.get_report(played, stopped_early)
+
+    def _get_task_episodes(self, first_episode: int):
+        return [(episode_index, *self.get_episode(episode_index))
+                for episode_index in range(first_episode, first_episode + self.episodes_per_task)]
+
+    @classmethod
+    def _play_episodes(cls, grid_size: int, engine: str, seed: int, episodes: list):
+        """
+        Runs in the worker processes
+        Returns:
+            (list) (episode, whether the bot won) of each of episodes
+        """
+        Intellect.ENGINE = Intellect.ENGINES[engine]
+        if cls._con is None:
+            cls._con = Intellect.get_read_only_db_conn(grid_size)
+        results = []
+        Intellect.get_solver().clear()
+        for episode_index, bear_index, rotation, optimal_first in episodes:
+            random.seed(f'{seed}_{episode_index}')
+            won = Intellect.play_vs_minimax(cls._con, grid_size, optimal_first, rotation, bear_index, learn=False)
+            results.append(((episode_index, bear_index, rotation, optimal_first), won))
+        return results
+
+    def get_interval(self, wins: int, games: int):
+        """
+        Wilson score interval of the win rate, which unlike the normal approximation stays within [0, 1] and is
+        reliable for win rates close to 0 or 1
+        Returns:
+            (float, float) lower and upper bound
+        """
+        if not games:
+            return 0.0, 1.0
+        win_rate = wins / games
+        z_squared = self.z ** 2
+        center = (win_rate + (z_squared / (2 * games))) / (1 + (z_squared / games))
+        half_width = (self.z / (1 + (z_squared / games))) * \
+            ((win_rate * (1 - win_rate) / games) + (z_squared / (4 * games ** 2))) ** 0.5
+        return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+    def get_report(self, results: list, stopped_early: bool = False):
+        """
+        Returns:
+            (dict) win rate and its confidence interval, overall, per initial bear block and per player moving first
+        """
+        def summarize(won: list):
+            lower, upper = self.get_interval(sum(won), len(won))
+            return {'episodes': len(won), 'wins': sum(won), 'win_rate': sum(won) / len(won) if won else 0.0,
+                    'lower': lower, 'upper': upper}
+
+        by_bear_index = {}
+        by_first = {}
+        for (_, bear_index, _, optimal_first), won in results:
+            by_bear_index.setdefault(bear_index, []).append(won)
+            by_first.setdefault('bot first' if optimal_first else 'minimax first', []).append(won)
+        return {
+            'grid_size': self.grid_size,
+            'seed': self.seed,
+            'confidence': self.confidence,
+            'stopped_early': stopped_early,
+            **summarize([won for _, won in results]),
+            'by_bear_index': {bear_index: summarize(won) for bear_index, won in sorted(by_bear_index.items())},
+            'by_first': {first: summarize(won) for first, won in sorted(by_first.items())},
+        }
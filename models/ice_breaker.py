@@ -1,7 +1,11 @@
 import random
+import types
 
 from enum import IntEnum
 
+from models.metrics import Metrics
+from models.move_cache import MoveCache
+
 
 class IceBreaker:
 
@@ -10,35 +14,81 @@ class IceBreaker:
         ICED = 1
         BEAR = 2
 
+    # number of states whose analyze_moves result is kept
+    MOVE_ANALYSIS_CACHE_SIZE = 10000
+    # game state -> analyze_moves result, shared by the engines as the result does not depend on them
+    _move_analyses = MoveCache(MOVE_ANALYSIS_CACHE_SIZE, ttl=0)
+
     class Player:
 
         def __init__(self, player_id: int):
             self.id = player_id
             self.move_per_state = []
 
-    def __init__(self, grid_size: int):
+    def __init__(self, grid_size: int, bear_index: int = None):
+        """
+        The bear is placed at bear_index, otherwise at random in the top left quarter of the grid, which covers every
+        placement up to rotations and reflections
+        """
         assert 3 < grid_size < 10
         self.grid_size = grid_size
         self.game_ended = False
         self.lake_array = [self.BlockState.ICED.value] * (grid_size ** 2)
-        max_bear_row_index = int(grid_size / 2) - 1
-        # for odd grid size, max_bear_col_index will be 1 greater than max_bear_row_index
-        max_bear_col_index = int(grid_size / 2) + (grid_size % 2) - 1
-        bear_row = random.randint(0, max_bear_col_index)
-        if bear_row > max_bear_row_index:
-            bear_col = bear_row  # bear at the center of odd grid size
+        if bear_index is None:
+            max_bear_row_index = int(grid_size / 2) - 1
+            # for odd grid size, max_bear_col_index will be 1 greater than max_bear_row_index
+            max_bear_col_index = int(grid_size / 2) + (grid_size % 2) - 1
+            bear_row = random.randint(0, max_bear_col_index)
+            if bear_row > max_bear_row_index:
+                bear_col = bear_row  # bear at the center of odd grid size
+            else:
+                bear_col = random.randint(0, max_bear_col_index)
+            bear_index = (bear_row * grid_size) + bear_col
         else:
-            bear_col = random.randint(0, max_bear_col_index)
-        bear_index = (bear_row * grid_size) + bear_col
+            assert bear_index in self.get_initial_bear_indices(grid_size)
         self.lake_array[bear_index] = self.BlockState.BEAR.value
         self.p1 = self.Player(1)
         self.p2 = self.Player(2)
         self.current_player = self.p1
         self.winner = None
 
+    @classmethod
+    def get_initial_bear_indices(cls, grid_size: int):
+        """
+        Returns:
+            (list) blocks the bear can be placed on at the start of a game
+        """
+        max_bear_row_index = int(grid_size / 2) - 1
+        max_bear_col_index = int(grid_size / 2) + (grid_size % 2) - 1
+        bear_indices = [(bear_row * grid_size) + bear_col for bear_row in range(max_bear_row_index + 1)
+                        for bear_col in range(max_bear_col_index + 1)]
+        if grid_size % 2:
+            bear_indices.append((max_bear_col_index * grid_size) + max_bear_col_index)
+        return bear_indices
+
     def get_game_state(self):
         return ''.join(map(str, self.lake_array))
 
+    @classmethod
+    def encode_game_state(cls, game_state: str):
+        """
+        Packs game_state into `(bear_index << number of blocks) | iced_mask` as big-endian bytes, where bit `i` of
+        iced_mask is set when block `i` is iced. That is 3 bytes for a 4x4 grid and 11 bytes for a 9x9 grid
+        """
+        total_indices = len(game_state)
+        bear = str(cls.BlockState.BEAR.value)
+        iced_mask = int(game_state[::-1].replace(bear, str(cls.BlockState.UNICED.value)), 2)
+        key = (game_state.index(bear) << total_indices) | iced_mask
+        return key.to_bytes((total_indices + 14) // 8, 'big')
+
+    @classmethod
+    def decode_game_state(cls, encoded_game_state: bytes, grid_size: int):
+        total_indices = grid_size ** 2
+        key = int.from_bytes(encoded_game_state, 'big')
+        bear_index = key >> total_indices
+        game_state = format(key & ((1 << total_indices) - 1), f'0{total_indices}b')[::-1]
+        return f'{game_state[:bear_index]}{cls.BlockState.BEAR.value}{game_state[bear_index + 1:]}'
+
     def pretty_print(self):
         [print(self.lake_array[i * self.grid_size:(i + 1) * self.grid_size]) for i in range(self.grid_size)]
         print(f"Game Ended: {self.game_ended}")
@@ -47,8 +97,11 @@ class IceBreaker:
         if self.game_ended:
             return
         self.current_player.move_per_state.append([game_state, block_index])
+        start = Metrics.start()
         if self.register_uniced_block(self.lake_array, block_index, self.grid_size) == -1:
             self.game_ended = True
+        if start is not None:
+            Metrics.observe_since('engine_seconds', start, engine=type(self).__name__)
         if self.current_player.id != self.p1.id:
             self.current_player = self.p1
         else:
@@ -56,6 +109,62 @@ class IceBreaker:
         if self.game_ended:
             self.winner = self.current_player
 
+    @classmethod
+    def get_position(cls, game_state: str):
+        """
+        Returns the position which get_possible_moves and apply_move work on. For IceBreaker it is the lake_array
+        """
+        return list(map(int, game_state))
+
+    @classmethod
+    def get_possible_moves(cls, position: list):
+        return [block_index for block_index, block_state in enumerate(position)
+                if block_state == cls.BlockState.ICED.value]
+
+    @classmethod
+    def apply_move(cls, position: list, block_index: int, grid_size: int):
+        """
+        Returns the new position after picking block_index, or None if it ends the game. position is not modified
+        """
+        start = Metrics.start()
+        lake_array = list(position)
+        game_ended = cls.register_uniced_block(lake_array, block_index, grid_size) == -1
+        if start is not None:
+            Metrics.observe_since('engine_seconds', start, engine=cls.__name__)
+        return None if game_ended else lake_array
+
+    @classmethod
+    def analyze_moves(cls, game_state: str):
+        """
+        Plays every move of game_state in one pass. The result of the last MOVE_ANALYSIS_CACHE_SIZE states is kept for
+        every engine, and shared read-only by the calls
+        Returns:
+            (tuple, mappingproxy) moves which collapse the bear in ascending order, and for every other move the blocks
+            it unices, itself included, as a mask whose bit `i` is set when block `i` is uniced
+        """
+        analysis = IceBreaker._move_analyses.get(game_state)
+        if analysis is None:
+            losing_moves, footprints = cls._analyze_moves(game_state)
+            analysis = losing_moves, types.MappingProxyType(footprints)
+            IceBreaker._move_analyses.put(game_state, analysis)
+        return analysis
+
+    @classmethod
+    def _analyze_moves(cls, game_state: str):
+        grid_size = int(len(game_state) ** 0.5)
+        lake_array = cls.get_position(game_state)
+        losing_moves = []
+        footprints = {}
+        for block_index in cls.get_possible_moves(lake_array):
+            new_lake_array = list(lake_array)
+            if cls.register_uniced_block(new_lake_array, block_index, grid_size) == -1:
+                losing_moves.append(block_index)
+            else:
+                footprints[block_index] = sum(1 << i for i, (block_state, new_block_state)
+                                              in enumerate(zip(lake_array, new_lake_array))
+                                              if block_state != new_block_state)
+        return tuple(losing_moves), footprints
+
     @classmethod
     def register_uniced_block(cls, lake_array: list, block_index: int, grid_size: int = None):
         """
@@ -122,6 +231,9 @@ class IceBreaker:
                     adjacent_iced_block_indices.append(adjacent_block_index)
 
         for adjacent_block_index in adjacent_iced_block_indices:
+            if lake_array[adjacent_block_index] == cls.BlockState.UNICED.value:
+                # already collapsed by the blocks collapsed before it
+                continue
             if cls.register_uniced_block(lake_array, adjacent_block_index, grid_size) == -1:
                 return -1
 
@@ -1,29 +1,277 @@
+import functools
+import itertools
+import os
 import random
 import sqlite3
+import time
+
+from concurrent.futures import ProcessPoolExecutor
 
 from models.ice_breaker import IceBreaker
+from models.q_table import QTable
+from models.bit_ice_breaker import BitIceBreaker
+from models.mcts import MCTS
+from models.metrics import Metrics
+from models.parallel_solver import ParallelSolver
+from models.policy import Policy
+from models.shard_router import ShardRouter
+from models.solver import Solver
+from models.symmetry import Symmetry
+from models.tablebase import Tablebase
+from models.trajectory_log import TrajectoryLog
 
 
 class Intellect:
 
     GUARANTEED_LOSS = -99999999
+    # version of the database schema stored in q_meta, 2 stores game states encoded by IceBreaker.encode_game_state,
+    # 3 has no guaranteed losses left from the collapse rule which ended the game on blocks collapsed twice in a
+    # cascade, 4 stores the last update time of the q_table rows
+    SCHEMA_VERSION = 4
+    ENGINES = {'list': IceBreaker, 'bit': BitIceBreaker}
+    # game engine used for simulating moves, BitIceBreaker gives the same results but is faster
+    ENGINE = IceBreaker
+    # branches of get_optimal_move which explore, storing the guaranteed losses of the state they find
+    EXPLORATION_BRANCHES = ('unattempted', 'least games', 'attempted')
+    # milliseconds a Monte Carlo tree search takes when no budget is given
+    MCTS_BUDGET_MS = 100
+    # transposition table solver shared by all minimax searches of this process
+    _solver = None
+    # workers -> process pool shared by the parallel minimax searches of this process
+    _minimax_executors = {}
+
+    # grid_size -> Tablebase, or None if the tablebase of the grid size has not been generated
+    _tablebases = {}
+    # grid_size -> read-only connection of this process giving the priors of get_mcts_move_with_q_table, None if the
+    # grid size has no database
+    _mcts_connections = {}
+    # read-only connection of a train_vs_self_parallel worker process, and the q_table of the round it is playing
+    _training_connection = None
+    _training_q_table = None
+    _training_round = None
+
+    @classmethod
+    def get_solver(cls):
+        if cls._solver is None:
+            cls._solver = Solver()
+        return cls._solver
+
+    @classmethod
+    def get_minimax_executor(cls, workers: int):
+        if workers not in cls._minimax_executors:
+            cls._minimax_executors[workers] = ProcessPoolExecutor(workers)
+        return cls._minimax_executors[workers]
+
+    @classmethod
+    def get_tablebase(cls, grid_size: int):
+        if grid_size not in cls._tablebases:
+            path = Tablebase.get_path(grid_size)
+            cls._tablebases[grid_size] = Tablebase(path) if os.path.exists(path) else None
+        return cls._tablebases[grid_size]
+
+    @classmethod
+    def get_tablebase_move(cls, game_state: str):
+        """
+        Returns:
+            (int|None) best move of game_state if it is in the tablebase of its grid size
+        """
+        tablebase = cls.get_tablebase(int(len(game_state) ** 0.5))
+        if tablebase is None:
+            return None
+        result = tablebase.lookup(game_state)
+        return None if result is None else result[1]
 
     @classmethod
     def get_db_conn(cls, grid_size: int):
-        con = sqlite3.connect(f'icebreaker{grid_size}_bot.db')
+        """
+        Returns:
+            (sqlite3.Connection|ShardRouter) connection to the database of grid_size, or a ShardRouter if its q_table is
+            sharded (see reshard_q_table), which the methods of Intellect use the same way
+        """
+        db_path = cls.get_db_path(grid_size)
+        con = sqlite3.connect(db_path)
         con.executescript("""
-            CREATE TABLE IF NOT EXISTS q_table (
-                game_state TEXT NOT NULL,
-                block_index INTEGER NOT NULL,
-                num_wins INTEGER NOT NULL,
-                num_games INTEGER NOT NULL,
-                PRIMARY KEY (game_state, block_index)
-            );
             CREATE TABLE IF NOT EXISTS q_meta (property TEXT PRIMARY KEY NOT NULL, property_val INTEGER NOT NULL);
             PRAGMA journal_mode = WAL;
             PRAGMA synchronous = NORMAL;
         """)
-        return con
+        layout = ShardRouter.get_layout(con)
+        if layout is None:
+            con.execute(ShardRouter.Q_TABLE_DDL.format(schema='main'))
+        schema_version = cls._get_schema_version(con)
+        if schema_version != cls.SCHEMA_VERSION:
+            con.close()
+            raise RuntimeError(f'Database of grid size {grid_size} has schema version {schema_version}, run'
+                               f' `python -m scripts.migrate_db {grid_size}` to migrate it to {cls.SCHEMA_VERSION}')
+        if layout is None:
+            return con
+        return ShardRouter(con, db_path, grid_size, *layout, cls.GUARANTEED_LOSS)
+
+    @classmethod
+    def _get_schema_version(cls, con: sqlite3.Connection):
+        """
+        Databases created before the schema version was stored are version 1, and new databases are marked with the
+        current version
+        """
+        row = con.execute("SELECT property_val FROM q_meta WHERE property = 'schema_version'").fetchone()
+        if row is not None:
+            return row[0]
+        if con.execute('SELECT 1 FROM q_table LIMIT 1').fetchone() is not None:
+            return 1
+        with con:
+            con.execute("INSERT INTO q_meta (property, property_val) VALUES ('schema_version', ?)",
+                        (cls.SCHEMA_VERSION,))
+        return cls.SCHEMA_VERSION
+
+    @classmethod
+    def migrate_db(cls, grid_size: int):
+        """
+        Migrates the database of grid_size to SCHEMA_VERSION, one schema version at a time
+        Returns:
+            (dict) schema version -> number of q_table rows changed by the migration to it, empty if the database is
+            already migrated
+        """
+        db_path = cls.get_db_path(grid_size)
+        con = sqlite3.connect(db_path)
+        schema_version = cls._get_schema_version(con)
+        migrated_rows = {}
+        if schema_version == 1:
+            migrated_rows[2] = cls._migrate_q_table_keys(con)
+            schema_version = 2
+        if schema_version == 2:
+            migrated_rows[3] = cls._remove_invalid_guaranteed_losses(con, db_path, grid_size)
+            schema_version = 3
+        if schema_version == 3:
+            migrated_rows[4] = cls._add_last_updated(con, db_path)
+        if migrated_rows:
+            with con:
+                con.execute("INSERT INTO q_meta (property, property_val) VALUES ('schema_version', ?)"
+                            ' ON CONFLICT (property) DO UPDATE SET property_val = excluded.property_val',
+                            (cls.SCHEMA_VERSION,))
+            con.execute('VACUUM')
+            con.execute('ANALYZE')
+        con.close()
+        return migrated_rows
+
+    @classmethod
+    def _migrate_q_table_keys(cls, con: sqlite3.Connection):
+        """
+        Migration of a database of schema version 1, whose game states are stored as text. The q_table is rebuilt with
+        the game states encoded by IceBreaker.encode_game_state, and with no update times
+        Returns:
+            (int) number of q_table rows migrated
+        """
+        with con:
+            con.execute('BEGIN')
+            con.execute('ALTER TABLE q_table RENAME TO q_table_v1')
+            con.execute(ShardRouter.Q_TABLE_DDL.format(schema='main'))
+            con.executemany(ShardRouter.COPY_SQL,
+                            ((IceBreaker.encode_game_state(game_state), block_index, num_wins, num_games, 0)
+                             for game_state, block_index, num_wins, num_games in con.execute(
+                                'SELECT game_state, block_index, num_wins, num_games FROM q_table_v1')))
+            num_rows = con.execute('SELECT COUNT(*) FROM q_table').fetchone()[0]
+            con.execute('DROP TABLE q_table_v1')
+            con.execute("INSERT INTO q_meta (property, property_val) VALUES ('schema_version', 2)"
+                        ' ON CONFLICT (property) DO UPDATE SET property_val = excluded.property_val')
+        return num_rows
+
+    @classmethod
+    def _remove_invalid_guaranteed_losses(cls, con: sqlite3.Connection, db_path: str, grid_size: int):
+        """
+        Migration of a database of schema version 2. A collapse cascade reaching a block which it had already collapsed
+        used to end the game, so the guaranteed losses of such moves were stored although the game goes on. Every
+        guaranteed loss is a move which collapses the bear right away, so the ones which don't with the current rule
+        are deleted, and the moves will be explored again. The other rows are not affected, as the moves which didn't
+        end the game collapsed the same blocks. A sharded q_table is migrated shard by shard
+        Returns:
+            (int) number of q_table rows deleted
+        """
+        num_rows = 0
+        for table in cls._connect_q_tables(con, db_path):
+            invalid_rows = []
+            for game_state, block_index in table.execute(
+                    f'SELECT game_state, block_index FROM q_table WHERE num_wins = {cls.GUARANTEED_LOSS}'):
+                losing_moves = BitIceBreaker.analyze_moves(IceBreaker.decode_game_state(game_state, grid_size))[0]
+                if block_index not in losing_moves:
+                    invalid_rows.append((game_state, block_index))
+            with table:
+                table.executemany('DELETE FROM q_table WHERE game_state = ? AND block_index = ?', invalid_rows)
+            num_rows += len(invalid_rows)
+            if table is not con:
+                table.close()
+        return num_rows
+
+    @classmethod
+    def _add_last_updated(cls, con: sqlite3.Connection, db_path: str):
+        """
+        Migration of a database of schema version 3, whose q_table rows have no update time. They are given the update
+        time 0, so compact_q_table takes them for the oldest. A sharded q_table is migrated shard by shard
+        Returns:
+            (int) number of q_table rows given an update time
+        """
+        num_rows = 0
+        for table in cls._connect_q_tables(con, db_path):
+            cls._add_last_updated_column(table)
+            num_rows += table.execute('SELECT COUNT(*) FROM q_table').fetchone()[0]
+            if table is not con:
+                table.close()
+        return num_rows
+
+    @classmethod
+    def _add_last_updated_column(cls, con: sqlite3.Connection, schema: str = 'main'):
+        """
+        Adds the last_updated column to the q_table of schema unless it has it, e.g. the q_table rebuilt by the
+        migration from schema version 1
+        """
+        if 'last_updated' not in [row[1] for row in con.execute(f'PRAGMA {schema}.table_info(q_table)')]:
+            with con:
+                con.execute(f'ALTER TABLE {schema}.q_table ADD COLUMN last_updated INTEGER NOT NULL DEFAULT 0')
+
+    @classmethod
+    def _connect_q_tables(cls, con: sqlite3.Connection, db_path: str):
+        """
+        Returns:
+            (list) con if its q_table is not sharded, else new connections to each of its shards
+        """
+        layout = ShardRouter.get_layout(con)
+        if layout is None:
+            return [con]
+        return [ShardRouter.connect_shard(ShardRouter.get_shard_path(db_path, shard_index))
+                for shard_index in range(layout[1])]
+
+    @classmethod
+    def get_read_only_db_conn(cls, grid_size: int, check_same_thread: bool = True, memory_shards: int = 0):
+        """
+        Connection which can only read the database, the database should already be created by get_db_conn. If its
+        q_table is sharded, a read-only ShardRouter instead, which copies its first memory_shards shards into memory
+        """
+        db_path = cls.get_db_path(grid_size)
+        con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=check_same_thread)
+        layout = ShardRouter.get_layout(con)
+        if layout is None:
+            return con
+        return ShardRouter(con, db_path, grid_size, *layout, cls.GUARANTEED_LOSS, read_only=True,
+                           check_same_thread=check_same_thread, memory_shards=memory_shards)
+
+    @classmethod
+    def get_db_path(cls, grid_size: int):
+        return f'icebreaker{grid_size}_bot.db'
+
+    @classmethod
+    def get_db_file_paths(cls, grid_size: int):
+        """
+        Returns:
+            (list) path of the database of grid_size, followed by those of its shard files if its q_table is sharded
+        """
+        db_path = cls.get_db_path(grid_size)
+        if not os.path.exists(db_path):
+            return [db_path]
+        con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        layout = ShardRouter.get_layout(con)
+        con.close()
+        if layout is None:
+            return [db_path]
+        return [db_path] + [ShardRouter.get_shard_path(db_path, shard_index) for shard_index in range(layout[1])]
 
     @classmethod
     def _game_state_info(cls, game_state: str):
@@ -108,18 +356,406 @@ class Intellect:
             return total_indices - 1 - optimal_move
 
     @classmethod
-    def get_optimal_move(cls, con: sqlite3.Connection, game_state: str, experimentation: int):
+    def canonicalize_q_table(cls, grid_size: int):
+        """
+        One-off migration of a database created before the states were canonicalized. Rows of q_table which become the
+        same canonical (game_state, block_index) are merged by adding their wins and games, and a guaranteed loss stays
+        a guaranteed loss, keeping the latest update time. q_meta properties of equivalent initial states are merged
+        the same way
+        Returns:
+            (int, int) number of q_table rows before and after the migration
+        """
+        con = cls.get_db_conn(grid_size)
+        if isinstance(con, ShardRouter):
+            con.close()
+            raise RuntimeError(f'The q_table of grid size {grid_size} is sharded, run'
+                               f' `python -m scripts.shard_db {grid_size} --shards 1` before canonicalizing it')
+        q_table = {}
+        rows = con.execute('SELECT game_state, block_index, num_wins, num_games, last_updated FROM q_table').fetchall()
+        for encoded_game_state, block_index, num_wins, num_games, last_updated in rows:
+            key = Symmetry.canonicalize_move(IceBreaker.decode_game_state(encoded_game_state, grid_size), block_index)
+            if key in q_table:
+                last_updated = max(last_updated, q_table[key][2])
+            if num_wins == cls.GUARANTEED_LOSS or q_table.get(key, [0])[0] == cls.GUARANTEED_LOSS:
+                q_table[key] = [cls.GUARANTEED_LOSS, -cls.GUARANTEED_LOSS, last_updated]
+            elif key in q_table:
+                q_table[key][0] += num_wins
+                q_table[key][1] += num_games
+                q_table[key][2] = last_updated
+            else:
+                q_table[key] = [num_wins, num_games, last_updated]
+
+        q_meta = {}
+        for prop, property_val in con.execute('SELECT property, property_val FROM q_meta').fetchall():
+            game_state, _, suffix = prop.partition('_')
+            if len(game_state) == grid_size ** 2 and game_state.isdigit():
+                prop = f'{Symmetry.canonicalize_game_state(game_state)[0]}_{suffix}'
+            q_meta[prop] = q_meta.get(prop, 0) + property_val
+
+        with con:
+            con.execute('DELETE FROM q_table')
+            con.executemany(ShardRouter.COPY_SQL,
+                            [(IceBreaker.encode_game_state(game_state), block_index, *row)
+                             for (game_state, block_index), row in q_table.items()])
+            con.execute('DELETE FROM q_meta')
+            con.executemany('INSERT INTO q_meta (property, property_val) VALUES (?, ?)', q_meta.items())
+        con.execute('VACUUM')
+        con.close()
+        return len(rows), len(q_table)
+
+    @classmethod
+    def reshard_q_table(cls, grid_size: int, shard_key: str = 'iced', shard_count: int = 1):
+        """
+        Moves q_table to shard_count shard files partitioned by shard_key (see ShardRouter), or back into the database
+        file itself with shard_count 1. The rows of a sharded q_table are first gathered into the database file, and
+        split again into freshly written shard files. Each step is committed along with the layout it leaves in q_meta,
+        so an interrupted migration leaves a usable database. The rows keep their update times
+        Returns:
+            (list) number of q_table rows of each shard, or of the database file with shard_count 1
+        """
+        assert shard_key in ShardRouter.SHARD_KEYS and shard_count >= 1
+        db_path = cls.get_db_path(grid_size)
+        con = cls.get_db_conn(grid_size)
+        if isinstance(con, ShardRouter):
+            router = con
+            con = router.con
+            with con:
+                con.execute('BEGIN')
+                con.execute(ShardRouter.Q_TABLE_DDL.format(schema='main'))
+                con.executemany(ShardRouter.COPY_SQL, router.iter_rows(ordered=True))
+                con.execute("DELETE FROM q_meta WHERE property IN ('shard_key', 'shard_count')")
+            for shard_index, shard in enumerate(router.shards):
+                shard.close()
+                ShardRouter.remove_shard(ShardRouter.get_shard_path(db_path, shard_index))
+
+        if shard_count == 1:
+            rows_per_shard = [con.execute('SELECT COUNT(*) FROM q_table').fetchone()[0]]
+        else:
+            con.create_function('shard_index', 1, functools.partial(
+                ShardRouter.get_shard_index, grid_size=grid_size, shard_key=shard_key, shard_count=shard_count),
+                deterministic=True)
+            rows_per_shard = []
+            for shard_index in range(shard_count):
+                path = ShardRouter.get_shard_path(db_path, shard_index)
+                # left over by an interrupted migration
+                ShardRouter.remove_shard(path)
+                shard = ShardRouter.connect_shard(path)
+                with shard:
+                    shard.executemany(
+                        ShardRouter.COPY_SQL,
+                        con.execute('SELECT game_state, block_index, num_wins, num_games, last_updated FROM q_table'
+                                    ' WHERE shard_index(game_state) = ? ORDER BY game_state, block_index',
+                                    (shard_index,)))
+                rows_per_shard.append(shard.execute('SELECT COUNT(*) FROM q_table').fetchone()[0])
+                shard.close()
+            with con:
+                con.execute('BEGIN')
+                con.execute('DROP TABLE q_table')
+                con.executemany('INSERT INTO q_meta (property, property_val) VALUES (?, ?)'
+                                ' ON CONFLICT (property) DO UPDATE SET property_val = excluded.property_val',
+                                [('shard_key', ShardRouter.SHARD_KEYS.index(shard_key)), ('shard_count', shard_count)])
+        con.execute('VACUUM')
+        con.close()
+        return rows_per_shard
+
+    @classmethod
+    def compact_q_table(cls, grid_size: int, min_games: int = 0, memory_budget: int = None, keep_recent_rows: int = 0,
+                        archive_path: str = None, vacuum: bool = True, lookup_samples: int = 1000, shards: list = None):
+        """
+        Deletes the q_table rows played in fewer than min_games games, mostly states visited once while experimenting,
+        then runs VACUUM and ANALYZE unless vacuum is False. Guaranteed losses are always kept. With memory_budget,
+        min_games is raised to the lowest threshold which brings the size of q_table and its index under memory_budget
+        bytes, if any does.
+
+        The keep_recent_rows rows updated last are kept whatever their games, along with those updated in the same
+        millisecond as the last of them, to give new states the chance to be played again. With archive_path, the
+        deleted rows are added to the q_table of that database instead of being lost
+
+        A sharded q_table is compacted shard by shard, keeping the keep_recent_rows rows updated last of each. With
+        shards, only the shards of these indices are compacted, e.g. the late-game shards holding most of the rows,
+        and memory_budget then bounds their own size
+        Returns:
+            (dict) min_games used, rows deleted, and get_q_table_stats before and after, the lookups being timed on the
+            same states
+        """
+        con = cls.get_db_conn(grid_size)
+        if isinstance(con, ShardRouter):
+            tables = con.shards if shards is None else [con.shards[shard_index] for shard_index in shards]
+            lookup_keys = [row[0] for shard in con.shards for row in shard.execute(
+                'SELECT game_state FROM q_table ORDER BY random() LIMIT ?', (lookup_samples,))]
+            lookup_keys = random.sample(lookup_keys, min(lookup_samples, len(lookup_keys)))
+        else:
+            assert shards is None, f'The q_table of grid size {grid_size} is not sharded'
+            tables = [con]
+            lookup_keys = [row[0] for row in con.execute('SELECT game_state FROM q_table ORDER BY random() LIMIT ?',
+                                                         (lookup_samples,))]
+        before = cls.get_q_table_stats(con, lookup_keys)
+        kept_since = [cls._get_kept_since(table, keep_recent_rows) for table in tables]
+        if memory_budget is not None:
+            stats = before if shards is None else cls._get_tables_stats(tables)
+            min_games = max(min_games, cls._get_min_games_for_budget(list(zip(tables, kept_since)), stats,
+                                                                     memory_budget))
+
+        condition = f'num_games < :min_games AND num_wins != {cls.GUARANTEED_LOSS} AND last_updated < :kept_since'
+        deleted_rows = 0
+        for table, table_kept_since in zip(tables, kept_since):
+            params = {'min_games': min_games, 'kept_since': table_kept_since}
+            if archive_path is not None:
+                table.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+                table.execute(ShardRouter.Q_TABLE_DDL.format(schema='archive'))
+                # archived before the rows had update times
+                cls._add_last_updated_column(table, 'archive')
+            with table:
+                if archive_path is not None:
+                    table.execute('INSERT INTO archive.q_table'
+                                  ' (game_state, block_index, num_wins, num_games, last_updated)'
+                                  ' SELECT game_state, block_index, num_wins, num_games, last_updated FROM q_table'
+                                  f' WHERE {condition}'
+                                  + ShardRouter.ADD_ON_CONFLICT_SQL.format(guaranteed_loss=cls.GUARANTEED_LOSS), params)
+                deleted_rows += table.execute(f'DELETE FROM q_table WHERE {condition}', params).rowcount
+            if archive_path is not None:
+                table.execute('DETACH DATABASE archive')
+            if vacuum:
+                table.execute('VACUUM')
+                table.execute('ANALYZE')
+        after = cls.get_q_table_stats(con, lookup_keys)
+        con.close()
+        return {'min_games': min_games, 'deleted_rows': deleted_rows, 'before': before, 'after': after}
+
+    @classmethod
+    def _get_kept_since(cls, con: sqlite3.Connection, keep_recent_rows: int):
+        """
+        Returns:
+            (int|float) update time from which compact_q_table keeps the rows of con: that of the keep_recent_rows-th
+            row updated last, 0 if there are fewer rows, or inf with keep_recent_rows 0
+        """
+        if not keep_recent_rows:
+            return float('inf')
+        row = con.execute('SELECT last_updated FROM q_table ORDER BY last_updated DESC LIMIT 1 OFFSET ?',
+                          (keep_recent_rows - 1,)).fetchone()
+        return 0 if row is None else row[0]
+
+    @classmethod
+    def _get_min_games_for_budget(cls, tables: list, stats: dict, memory_budget: int):
+        """
+        Assumes every row takes the same share of the size of q_table and its index
+        Args:
+            tables: (connection, update time from which the rows are kept) of the q_tables to compact
+        """
+        if not stats['rows'] or stats['table_bytes'] is None:
+            return 0
+        row_bytes = (stats['table_bytes'] + stats['index_bytes']) / stats['rows']
+        excess_rows = stats['rows'] - int(memory_budget / row_bytes)
+        rows_per_games = {}
+        for con, kept_since in tables:
+            for num_games, num_rows in con.execute(
+                    f'SELECT num_games, COUNT(*) FROM q_table WHERE num_wins != {cls.GUARANTEED_LOSS}'
+                    ' AND last_updated < ? GROUP BY num_games', (kept_since,)):
+                rows_per_games[num_games] = rows_per_games.get(num_games, 0) + num_rows
+        min_games = 0
+        for num_games, num_rows in sorted(rows_per_games.items()):
+            if excess_rows <= 0:
+                break
+            min_games = num_games + 1
+            excess_rows -= num_rows
+        return min_games
+
+    @classmethod
+    def get_q_table_stats(cls, con: sqlite3.Connection | ShardRouter, lookup_keys: list = ()):
+        """
+        Returns:
+            (dict) rows, guaranteed losses, bytes of the database file, of q_table and of its index (None if SQLite is
+            built without the dbstat table), and mean microseconds to look up the states of lookup_keys, in the fastest
+            of 3 passes. Those of a sharded q_table are summed over its shards, with the database file
+        """
+        if isinstance(con, ShardRouter):
+            stats = cls._get_tables_stats(con.shards)
+            stats['file_bytes'] += cls._get_file_bytes(con.con)
+            get_rows = con.get_rows
+        else:
+            stats = cls._get_tables_stats([con])
+
+            def get_rows(key: bytes):
+                return con.execute('SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = ?',
+                                   (key,)).fetchall()
+        lookup_us = None
+        if lookup_keys:
+            for _ in range(3):
+                start = time.perf_counter()
+                for key in lookup_keys:
+                    get_rows(key)
+                elapsed_us = (time.perf_counter() - start) / len(lookup_keys) * 1000000
+                lookup_us = elapsed_us if lookup_us is None else min(lookup_us, elapsed_us)
+        return {**stats, 'lookup_us': lookup_us}
+
+    @classmethod
+    def _get_tables_stats(cls, cons: list):
+        """
+        Returns:
+            (dict) rows, guaranteed losses and bytes of get_q_table_stats, summed over the q_table of each of cons
+        """
+        stats = {'rows': 0, 'guaranteed_losses': 0, 'file_bytes': 0, 'table_bytes': 0, 'index_bytes': 0}
+        for con in cons:
+            rows, guaranteed_losses = con.execute(
+                f'SELECT COUNT(*), COUNT(*) FILTER (WHERE num_wins = {cls.GUARANTEED_LOSS}) FROM q_table').fetchone()
+            stats['rows'] += rows
+            stats['guaranteed_losses'] += guaranteed_losses
+            stats['file_bytes'] += cls._get_file_bytes(con)
+            if stats['table_bytes'] is None:
+                continue
+            try:
+                sizes = dict(con.execute("SELECT name, SUM(pgsize) FROM dbstat WHERE name IN"
+                                         " (SELECT name FROM sqlite_master WHERE tbl_name = 'q_table') GROUP BY name"))
+                stats['table_bytes'] += sizes.pop('q_table', 0)
+                stats['index_bytes'] += sum(sizes.values())
+            except sqlite3.OperationalError:
+                stats['table_bytes'] = stats['index_bytes'] = None
+        return stats
+
+    @classmethod
+    def _get_file_bytes(cls, con: sqlite3.Connection):
+        return con.execute('PRAGMA page_count').fetchone()[0] * con.execute('PRAGMA page_size').fetchone()[0]
+
+    @classmethod
+    def get_optimal_move(cls, con: sqlite3.Connection | QTable | None, game_state: str, experimentation: int,
+                         learn: bool = True, fallback: str = None):
         """
         First, see if the game_state exists in the q_table or not. If it does then check possible moves that we already
         have attempted. From all attempted moves, get the moves with the highest win rate or the least games.
         Now depending on the chance of experimentation, either return one of the move with the highest win rate, or
         return the move which has not been attempted or has been attempted the least time
 
-        Note: when experimenting, function will check whether this unattempted move will result in loss or not, if it
-        will then learn this and try another unattempted move
+        Note: when experimenting, the moves are first analyzed by IceBreaker.analyze_moves, so that no move which
+        results in loss right away is picked unless every move does. The unattempted ones are learnt at once
+
+        The q_table is looked up with the canonical game state, and the returned move is mapped back onto game_state.
+        With learn=False the guaranteed losses found while experimenting are not stored, e.g. for read-only connections.
+        Without con, the state is treated as not in the q_table
+
+        Without experimentation, the game_state is first looked up in the tablebase, whose moves are exact. A state
+        without any attempted move which is not a guaranteed loss is explored, or with fallback='mcts' searched by
+        get_mcts_move with the q_table as priors unless experimenting
+        """
+        if experimentation == 0:
+            tablebase_move = cls.get_tablebase_move(game_state)
+            if tablebase_move is not None:
+                if Metrics.enabled:
+                    Metrics.increment('decisions_total', branch='tablebase')
+                return 'tablebase', tablebase_move
+        grid_size = int(len(game_state) ** 0.5)
+        game_state, transform = Symmetry.canonicalize_game_state(game_state)
+        attempted_moves, moves_with_highest_win_rate, moves_with_least_games = cls._rank_moves(
+            cls._get_q_rows(con, game_state))
+
+        if moves_with_highest_win_rate[1]:
+            experimenting = random.randint(1, 100) <= experimentation
+        elif fallback == 'mcts':
+            experimenting = experimentation != 0 and random.randint(1, 100) <= experimentation
+        else:
+            experimenting = True
+
+        new_learnings = []
+        if experimenting:
+            attempted_moves_set = set(attempted_moves)
+            if len(attempted_moves_set) < game_state.count(str(IceBreaker.BlockState.ICED.value)):
+                # the analysis does not depend on the engine, and is much faster on bitmasks. Playing every move costs
+                # more than trying random moves until one doesn't lose, which slows the self-play of the grids whose
+                # states have many moves and rarely repeat, 6x6 and up, but every losing move is learnt at once
+                losing_moves, footprints = BitIceBreaker.analyze_moves(game_state)
+            else:
+                # every move has been attempted, so the losing ones are already known
+                losing_moves, footprints = (), {}
+            if learn and losing_moves:
+                encoded_game_state = IceBreaker.encode_game_state(game_state)
+                new_learnings = [(encoded_game_state, losing_move, cls.GUARANTEED_LOSS, -cls.GUARANTEED_LOSS)
+                                 for losing_move in losing_moves if losing_move not in attempted_moves_set]
+            # check if there are blocks which are not yet tried
+            unattempted_moves = [block_index for block_index in footprints if block_index not in attempted_moves_set]
+            if unattempted_moves:
+                log_message = 'unattempted'
+                move = random.choice(unattempted_moves)
+            elif moves_with_least_games[1]:
+                log_message = 'least games'
+                move = random.choice(moves_with_least_games[1])
+            elif attempted_moves:
+                # every move results in loss
+                log_message = 'attempted'
+                move = int(random.choice(attempted_moves))
+            else:
+                log_message = 'unattempted'
+                move = random.choice(losing_moves)
+        elif moves_with_highest_win_rate[1]:
+            log_message = 'optimal'
+            move = int(random.choice(moves_with_highest_win_rate[1]))
+        else:
+            log_message = 'mcts'
+            move = cls.get_mcts_move(game_state, con=con)[0]
+
+        if new_learnings and learn:
+            cls._insert_guaranteed_losses(con, new_learnings)
+        if Metrics.enabled:
+            Metrics.increment('decisions_total', branch=log_message)
+        return log_message, Symmetry.from_canonical_move(move, grid_size, transform)
+
+    @classmethod
+    def get_best_moves(cls, con: sqlite3.Connection | QTable, canonical_game_state: str):
+        """
+        Returns:
+            (float, list) highest win rate of canonical_game_state and the moves having it, the moves are empty if no
+            move has been attempted except the guaranteed losses
+        """
+        return cls._rank_moves(cls._get_q_rows(con, canonical_game_state))[1]
+
+    @classmethod
+    def get_best_moves_of_states(cls, con: sqlite3.Connection | ShardRouter | QTable, canonical_game_states: list):
+        """
+        Same as get_best_moves for many states, querying the q_table once per MAX_QUERY_STATES states
+        Returns:
+            (dict) canonical game state -> (highest win rate, moves having it)
+        """
+        encoded_game_states = {game_state: IceBreaker.encode_game_state(game_state)
+                               for game_state in canonical_game_states}
+        rows = {encoded_game_state: [] for encoded_game_state in encoded_game_states.values()}
+        start = Metrics.start()
+        if isinstance(con, QTable):
+            rows = {encoded_game_state: con.get_rows(encoded_game_state) for encoded_game_state in rows}
+        elif isinstance(con, ShardRouter):
+            rows = con.get_rows_of_states(list(rows))
+        else:
+            unique_game_states = list(rows)
+            for i in range(0, len(unique_game_states), ShardRouter.MAX_QUERY_STATES):
+                chunk = unique_game_states[i:i + ShardRouter.MAX_QUERY_STATES]
+                for encoded_game_state, block_index, num_wins, num_games in con.execute(
+                        'SELECT game_state, block_index, num_wins, num_games FROM q_table'
+                        f' WHERE game_state IN ({", ".join("?" * len(chunk))}) ORDER BY game_state, block_index',
+                        chunk):
+                    rows[encoded_game_state].append((block_index, num_wins, num_games))
+        if start is not None:
+            Metrics.observe_since('q_table_lookup_seconds', start, query='batch')
+        return {game_state: cls._rank_moves(rows[encoded_game_state])[1]
+                for game_state, encoded_game_state in encoded_game_states.items()}
+
+    @classmethod
+    def _get_q_rows(cls, con: sqlite3.Connection | ShardRouter | QTable | None, game_state: str):
+        if con is None:
+            return []
+        start = Metrics.start()
+        encoded_game_state = IceBreaker.encode_game_state(game_state)
+        if isinstance(con, (QTable, ShardRouter)):
+            rows = con.get_rows(encoded_game_state)
+        else:
+            rows = con.execute('SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = :game_state',
+                               {'game_state': encoded_game_state}).fetchall()
+        if start is not None:
+            Metrics.observe_since('q_table_lookup_seconds', start, query='state')
+        return rows
+
+    @classmethod
+    def _rank_moves(cls, res: list):
+        """
+        Returns:
+            (list, list, list) attempted moves, [highest win rate, moves having it], [least games, moves having it]
         """
-        res = con.execute('SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = :game_state',
-                          {'game_state': game_state}).fetchall()
         attempted_moves = []
         moves_with_highest_win_rate = [-1, []]
         moves_with_least_games = [-1, []]
@@ -138,142 +774,382 @@ class Intellect:
                 moves_with_least_games = [num_games, [move]]
             elif moves_with_least_games[0] == num_games:
                 moves_with_least_games[1].append(move)
+        return attempted_moves, moves_with_highest_win_rate, moves_with_least_games
 
-        new_learnings = []
-        if not moves_with_highest_win_rate[1] or random.randint(1, 100) <= experimentation:
-            # check if there are blocks which are not yet tried
-            unattempted_moves = [block_index for block_index, block_state in enumerate(game_state)
-                                 if int(block_state) == IceBreaker.BlockState.ICED.value
-                                 and block_index not in attempted_moves]
-            i = 0
-            grid_size = int(len(game_state) ** 0.5)
-            while i < 15 and (unattempted_moves or moves_with_least_games[1]):
-                if unattempted_moves:
-                    log_message = 'unattempted'
-                    random_index = random.randint(0, len(unattempted_moves) - 1)
-                    move = unattempted_moves.pop(random_index)
-                elif moves_with_least_games[1]:
-                    log_message = 'least games'
-                    random_index = random.randint(0, len(moves_with_least_games[1]) - 1)
-                    move = moves_with_least_games[1].pop(random_index)
-                lake_array = list(map(int, game_state))
-                if IceBreaker.register_uniced_block(lake_array, move, grid_size) == -1:
-                    new_learnings.append((game_state, move, cls.GUARANTEED_LOSS, -cls.GUARANTEED_LOSS))
-                else:
-                    break
-                i += 1
-            else:
-                if attempted_moves:
-                    log_message = 'attempted'
-                    move = int(random.choice(attempted_moves))
-        else:
-            if moves_with_highest_win_rate[1]:
-                log_message = 'optimal'
-                move = int(random.choice(moves_with_highest_win_rate[1]))
-            else:
-                log_message = 'minimax'
-                move = cls.get_minimax_move(game_state)
-
-        if new_learnings:
-            with con:
-                con.executemany(
-                    'INSERT OR IGNORE INTO q_table (game_state, block_index, num_wins, num_games) VALUES (?, ?, ?, ?)',
-                    new_learnings
-                )
-        return log_message, move
+    @classmethod
+    def _insert_guaranteed_losses(cls, con: sqlite3.Connection | ShardRouter | QTable, new_learnings: list):
+        if isinstance(con, QTable):
+            con.insert_or_ignore(new_learnings)
+            return
+        with con:
+            if isinstance(con, ShardRouter):
+                con.insert_or_ignore(new_learnings)
+                return
+            con.executemany(ShardRouter.INSERT_SQL + ' ON CONFLICT DO NOTHING', new_learnings)
 
     @classmethod
-    def train_vs_self(cls, grid_size: int = 5, num_episodes: int = 50000, experimentation: int = 40):
+    def train_vs_self(cls, grid_size: int = 5, num_episodes: int = 50000, experimentation: int = 40,
+                      flush_episodes: int = 0, flush_seconds: float = 0, trajectory_log: TrajectoryLog = None):
         """
         For given number of episodes, make 2 bots play against each other while keeping track of q_table data. And then
         store data in q_table and q_meta table
+
+        If flush_episodes or flush_seconds is given, q_table is kept in memory and the data is stored in batches. With
+        trajectory_log, the episodes are appended to it instead, see _get_training_q_table
+        """
+        db_con = cls.get_db_conn(grid_size)
+        con = cls._get_training_q_table(db_con, flush_episodes, flush_seconds, trajectory_log)
+        try:
+            for ep in range(num_episodes):
+                game_obj, explored_plies = cls._play_vs_self(con, grid_size, experimentation)
+                cls._record_episode(con, game_obj, experimentation, trajectory_log=trajectory_log,
+                                    explored_plies=explored_plies)
+        finally:
+            if con is not db_con and trajectory_log is None:
+                con.flush()
+        db_con.execute('PRAGMA optimize')
+        db_con.close()
+
+    @classmethod
+    def train_vs_self_parallel(cls, grid_size: int = 5, num_episodes: int = 50000, experimentation: int = 40,
+                               workers: int = 2, episodes_per_task: int = 1000, seed: int = None,
+                               trajectory_log: TrajectoryLog = None):
+        """
+        Same as train_vs_self, but the episodes are played by a pool of worker processes. Each task plays
+        episodes_per_task episodes against the q_table as it was at the start of the round and returns what it has
+        learned. Once all workers are done, their learnings are merged into the database, and the next round starts.
+        Every worker opens the database once, and keeps the rows it has looked up until the round is over. Every task
+        is seeded from seed, so for the same seed and workers the training is reproducible
+
+        With trajectory_log, the tasks return their episodes instead, which are appended to it and the database is not
+        changed
         """
         con = cls.get_db_conn(grid_size)
+        engine = next(name for name, engine in cls.ENGINES.items() if engine is cls.ENGINE)
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        task_index = 0
+        round_index = 0
+        remaining_episodes = num_episodes
+        with ProcessPoolExecutor(workers, initializer=cls._init_train_vs_self_worker,
+                                 initargs=(grid_size, engine)) as executor:
+            while remaining_episodes > 0:
+                tasks = []
+                for _ in range(workers):
+                    task_episodes = min(episodes_per_task, remaining_episodes)
+                    if task_episodes <= 0:
+                        break
+                    remaining_episodes -= task_episodes
+                    tasks.append(executor.submit(Metrics.collect, Metrics.enabled, cls._train_vs_self_task,
+                                                 round_index, grid_size, task_episodes, experimentation,
+                                                 seed + task_index, trajectory_log is not None))
+                    task_index += 1
+                learnings = []
+                for task in tasks:
+                    (learning, trajectories), snapshot = task.result()
+                    if trajectory_log is None:
+                        learnings.append(learning)
+                    for bear_index, moves, winner_id, explored_plies in trajectories:
+                        trajectory_log.append(bear_index, moves, winner_id, experimentation,
+                                              explored_plies=explored_plies)
+                    if snapshot is not None:
+                        Metrics.merge(snapshot)
+                start = Metrics.start()
+                with con:
+                    for pending_q_table, pending_q_meta in learnings:
+                        QTable.upsert(con, cls.GUARANTEED_LOSS, pending_q_table, pending_q_meta)
+                Metrics.observe_since('commit_seconds', start)
+                round_index += 1
+        con.execute('PRAGMA optimize')
+        con.close()
+
+    @classmethod
+    def _init_train_vs_self_worker(cls, grid_size: int, engine: str):
+        cls.ENGINE = cls.ENGINES[engine]
+        cls._training_connection = cls.get_read_only_db_conn(grid_size)
+        cls._training_q_table = None
+        cls._training_round = None
+
+    @classmethod
+    def _train_vs_self_task(cls, round_index: int, grid_size: int, num_episodes: int, experimentation: int, seed: int,
+                            log_trajectories: bool = False):
+        """
+        Plays in a worker process set up by _init_train_vs_self_worker. The rows looked up by the previous tasks of
+        round_index are reused, the rows learned by them are not
+        Returns:
+            ((dict, dict)|None, list) pending q_table and q_meta updates, None when log_trajectories, and the
+            trajectories of the episodes (see _get_trajectory) and their plies explored if log_trajectories
+        """
+        random.seed(seed)
+        if cls._training_round != round_index:
+            cls._training_q_table = QTable(cls._training_connection, cls.GUARANTEED_LOSS, flush_episodes=0,
+                                           flush_seconds=0)
+            cls._training_round = round_index
+        q_table = cls._training_q_table
+        q_table.reset()
+        trajectories = []
         for ep in range(num_episodes):
-            game_obj = IceBreaker(grid_size)
-            init_state = game_obj.get_game_state()
-            game_state = init_state
-            while not game_obj.game_ended:
-                _, chosen_block = cls.get_optimal_move(con, game_state, experimentation)
-                game_obj.pick_block(game_state, chosen_block)
-                game_state = game_obj.get_game_state()
+            game_obj, explored_plies = cls._play_vs_self(q_table, grid_size, experimentation)
+            q_table.add_episode(*cls._get_episode_data(game_obj, experimentation))
+            if log_trajectories:
+                trajectories.append((*cls._get_trajectory(game_obj), explored_plies))
+            Metrics.increment('episodes_total')
+        if log_trajectories:
+            return None, trajectories
+        return (q_table.pending_q_table, q_table.pending_q_meta), trajectories
+
+    @classmethod
+    def _play_vs_self(cls, con: sqlite3.Connection | QTable, grid_size: int, experimentation: int):
+        """
+        Plays one episode of the bot against itself
+        Returns:
+            (IceBreaker, list) the finished game, and the plies whose move was picked by exploring
+        """
+        game_obj = cls.ENGINE(grid_size)
+        game_state = game_obj.get_game_state()
+        explored_plies = []
+        while not game_obj.game_ended:
+            log_message, chosen_block = cls.get_optimal_move(con, game_state, experimentation)
+            if log_message in cls.EXPLORATION_BRANCHES:
+                explored_plies.append(len(game_obj.p1.move_per_state) + len(game_obj.p2.move_per_state))
+            game_obj.pick_block(game_state, chosen_block)
+            game_state = game_obj.get_game_state()
+        return game_obj, explored_plies
+
+    @classmethod
+    def _get_episode_data(cls, game_obj: IceBreaker, experimentation: int, optimal_player_id: int = 0):
+        """
+        Both players of a self-play game learn from it, otherwise only the player of optimal_player_id which played
+        against minimax
+        Returns:
+            (list, list) rows to upsert into q_table and q_meta properties to increment for the finished game_obj
+        """
+        init_state = Symmetry.canonicalize_game_state(game_obj.p1.move_per_state[0][0])[0]
+        if not optimal_player_id:
             p1_won = game_obj.winner.id == game_obj.p1.id
             insert_vals = cls._get_data_for_q_table(game_obj.p1.move_per_state, p1_won)
             insert_vals += cls._get_data_for_q_table(game_obj.p2.move_per_state, not p1_won)
 
-            with con:
-                con.executemany(
-                    'INSERT INTO q_table (game_state, block_index, num_wins, num_games) VALUES (?, ?, ?, ?)'
-                    ' ON CONFLICT (game_state, block_index) DO UPDATE SET num_wins = num_wins + excluded.num_wins,'
-                    f' num_games = num_games + excluded.num_games WHERE excluded.num_wins != {cls.GUARANTEED_LOSS}',
-                    insert_vals
-                )
-                properties_to_increment = [(f'{init_state}_{experimentation}_games',)]
-                if p1_won:
-                    properties_to_increment.append((f'{init_state}_{experimentation}_wins',))
-                con.executemany('INSERT INTO q_meta (property, property_val) VALUES (?, 1)'
-                                ' ON CONFLICT (property) DO UPDATE SET property_val = property_val + 1',
-                                properties_to_increment)
+            properties_to_increment = [(f'{init_state}_{experimentation}_games',)]
+            if p1_won:
+                properties_to_increment.append((f'{init_state}_{experimentation}_wins',))
+            return insert_vals, properties_to_increment
+
+        optimal_won = game_obj.winner.id == optimal_player_id
+        if game_obj.p1.id == optimal_player_id:
+            insert_vals = cls._get_data_for_q_table(game_obj.p1.move_per_state, optimal_won)
+        else:
+            insert_vals = cls._get_data_for_q_table(game_obj.p2.move_per_state, optimal_won)
+
+        properties_to_increment = [(f'{init_state}_{experimentation}_p{optimal_player_id}_games',)]
+        if optimal_won:
+            properties_to_increment.append((f'{init_state}_{experimentation}_p{optimal_player_id}_wins',))
+        return insert_vals, properties_to_increment
+
+    @staticmethod
+    def _get_moves_per_state(game_obj: IceBreaker):
+        """
+        Returns:
+            (list) (game_state, move) of both players of game_obj in the order they were played
+        """
+        return [move_per_state for moves in itertools.zip_longest(game_obj.p1.move_per_state,
+                                                                  game_obj.p2.move_per_state)
+                for move_per_state in moves if move_per_state is not None]
+
+    @classmethod
+    def _get_trajectory(cls, game_obj: IceBreaker):
+        """
+        Returns:
+            (int, list, int) initial bear block, moves of both players in the order they were played, and id of the
+            winner of the finished game_obj
+        """
+        moves_per_state = cls._get_moves_per_state(game_obj)
+        bear_index = moves_per_state[0][0].index(str(IceBreaker.BlockState.BEAR.value))
+        return bear_index, [move for _, move in moves_per_state], game_obj.winner.id
+
+    @classmethod
+    def _get_explored_guaranteed_losses(cls, game_obj: IceBreaker, explored_plies: list):
+        """
+        Returns:
+            (list) rows of the guaranteed losses which get_optimal_move stored while exploring the plies explored_plies
+            of the finished game_obj. Those are every losing move of the states, as a losing move already attempted has
+            a guaranteed loss row
+        """
+        moves_per_state = cls._get_moves_per_state(game_obj)
+        rows = []
+        for ply in explored_plies:
+            canonical_game_state = Symmetry.canonicalize_game_state(moves_per_state[ply][0])[0]
+            encoded_game_state = IceBreaker.encode_game_state(canonical_game_state)
+            rows += [(encoded_game_state, losing_move, cls.GUARANTEED_LOSS, -cls.GUARANTEED_LOSS)
+                     for losing_move in BitIceBreaker.analyze_moves(canonical_game_state)[0]]
+        return rows
+
+    @classmethod
+    def _replay_trajectory(cls, grid_size: int, bear_index: int, moves: list):
+        """
+        Returns:
+            (IceBreaker) the game of the trajectory, played again
+        """
+        game_obj = cls.ENGINE(grid_size, bear_index)
+        for move in moves:
+            game_obj.pick_block(game_obj.get_game_state(), move)
+        assert game_obj.game_ended, 'The trajectory does not end the game'
+        return game_obj
+
+    @classmethod
+    def _record_episode(cls, con: sqlite3.Connection | QTable, game_obj: IceBreaker, experimentation: int,
+                        optimal_player_id: int = 0, trajectory_log: TrajectoryLog = None, explored_plies: list = ()):
+        if trajectory_log is not None:
+            trajectory_log.append(*cls._get_trajectory(game_obj), experimentation, optimal_player_id, explored_plies)
+        cls._save_episode(con, *cls._get_episode_data(game_obj, experimentation, optimal_player_id))
+
+    @classmethod
+    def aggregate_trajectory_logs(cls, grid_size: int, paths: list, chunk_episodes: int = 100000):
+        """
+        Folds the episodes of the trajectory log files paths into q_table and q_meta, with the same rows and guaranteed
+        losses as if the training had stored them. The episodes are replayed, so the rows follow the current
+        canonicalization of the states, e.g. for a fresh database. The guaranteed losses the training found while
+        exploring are those of the states of the plies explored, which are analyzed again
+
+        The number of episodes of each file folded so far is kept in q_meta, so aggregating a file again only folds its
+        new episodes. The episodes are merged in memory chunk_episodes at a time, and each chunk is written in order of
+        the q_table key in one transaction along with the progress of the file
+        Returns:
+            (int, int) episodes folded and q_table rows written
+        """
+        con = cls.get_db_conn(grid_size)
+        total_episodes = total_rows = 0
+        for path in paths:
+            assert TrajectoryLog.get_grid_size(path) == grid_size, f'{path} is not a log of grid size {grid_size}'
+            progress_property = f'trajectory_log_{os.path.basename(path)}'
+            row = con.execute('SELECT property_val FROM q_meta WHERE property = ?', (progress_property,)).fetchone()
+            folded_episodes = 0 if row is None else row[0]
+            episodes = itertools.islice(TrajectoryLog.read(path), folded_episodes, None)
+            while chunk := list(itertools.islice(episodes, chunk_episodes)):
+                pending_q_table = {}
+                pending_q_meta = {}
+                for bear_index, moves, _, experimentation, optimal_player_id, explored_plies in chunk:
+                    game_obj = cls._replay_trajectory(grid_size, bear_index, moves)
+                    insert_vals, properties_to_increment = cls._get_episode_data(game_obj, experimentation,
+                                                                                 optimal_player_id)
+                    insert_vals += cls._get_explored_guaranteed_losses(game_obj, explored_plies)
+                    # merged the same way as the pending rows of QTable.add_episode
+                    for game_state, block_index, num_wins, num_games in insert_vals:
+                        pending = pending_q_table.get((game_state, block_index))
+                        if pending is None:
+                            pending_q_table[(game_state, block_index)] = [num_wins, num_games]
+                        elif num_wins != cls.GUARANTEED_LOSS and pending[0] != cls.GUARANTEED_LOSS:
+                            pending[0] += num_wins
+                            pending[1] += num_games
+                    for (prop,) in properties_to_increment:
+                        pending_q_meta[prop] = pending_q_meta.get(prop, 0) + 1
+                folded_episodes += len(chunk)
+                pending_q_meta[progress_property] = 0
+                start = Metrics.start()
+                with con:
+                    QTable.upsert(con, cls.GUARANTEED_LOSS, dict(sorted(pending_q_table.items())), pending_q_meta)
+                    con.execute('UPDATE q_meta SET property_val = ? WHERE property = ?',
+                                (folded_episodes, progress_property))
+                Metrics.observe_since('commit_seconds', start)
+                total_episodes += len(chunk)
+                total_rows += len(pending_q_table)
         con.execute('PRAGMA optimize')
         con.close()
+        return total_episodes, total_rows
 
     @classmethod
-    def train_vs_minimax(cls, grid_size: int = 5, num_episodes: int = 50000, experimentation: int = 40):
+    def train_vs_minimax(cls, grid_size: int = 5, num_episodes: int = 50000, experimentation: int = 40,
+                         flush_episodes: int = 0, flush_seconds: float = 0, minimax_workers: int = 1,
+                         trajectory_log: TrajectoryLog = None, opponent: str = 'minimax', mcts_budget_ms: float = None):
         """
         For given number of episodes, make ML bot play against minimax bot while keeping track of q_table data. And then
         store data in q_table and q_meta table
+
+        If flush_episodes or flush_seconds is given, q_table is kept in memory and the data is stored in batches. With
+        minimax_workers, the minimax moves are searched in parallel by a shared pool of that many processes. With
+        trajectory_log, the episodes are appended to it instead, see _get_training_q_table
+
+        With opponent='mcts', the bot plays against get_mcts_move searching mcts_budget_ms milliseconds per move
+        instead, which unlike minimax is fast on the larger grids. Its search has no priors, so that it does not learn
+        from the q_table it trains
         """
-        con = cls.get_db_conn(grid_size)
-        for ep in range(num_episodes):
-            rotation = random.choice([-1, 0, 1, 2])
-            game_obj = IceBreaker(grid_size)
-            init_state = game_obj.get_game_state()
-            game_state = init_state
-            if ep < (num_episodes / 2):
-                optimal_player_id = game_obj.p1.id
-            else:
-                optimal_player_id = game_obj.p2.id
-            while not game_obj.game_ended:
-                if game_obj.current_player.id == optimal_player_id:
-                    _, chosen_block = cls.get_optimal_move(con, game_state, experimentation)
-                else:
-                    sanitized_game_state = cls.sanitize_game_state(game_state, rotation)
-                    chosen_block = cls.get_minimax_move(sanitized_game_state)
-                    chosen_block = cls.sanitize_move(sanitized_game_state, chosen_block, rotation)
-                game_obj.pick_block(game_state, chosen_block)
+        db_con = cls.get_db_conn(grid_size)
+        con = cls._get_training_q_table(db_con, flush_episodes, flush_seconds, trajectory_log)
+        try:
+            for ep in range(num_episodes):
+                rotation = random.choice([-1, 0, 1, 2])
+                game_obj = cls.ENGINE(grid_size)
                 game_state = game_obj.get_game_state()
-            optimal_won = game_obj.winner.id == optimal_player_id
-            if game_obj.p1.id == optimal_player_id:
-                insert_vals = cls._get_data_for_q_table(game_obj.p1.move_per_state, optimal_won)
-            else:
-                insert_vals = cls._get_data_for_q_table(game_obj.p2.move_per_state, optimal_won)
+                if ep < (num_episodes / 2):
+                    optimal_player_id = game_obj.p1.id
+                else:
+                    optimal_player_id = game_obj.p2.id
+                explored_plies = []
+                while not game_obj.game_ended:
+                    if game_obj.current_player.id == optimal_player_id:
+                        log_message, chosen_block = cls.get_optimal_move(con, game_state, experimentation)
+                        if log_message in cls.EXPLORATION_BRANCHES:
+                            explored_plies.append(len(game_obj.p1.move_per_state) + len(game_obj.p2.move_per_state))
+                    elif opponent == 'mcts':
+                        chosen_block = cls.get_mcts_move(game_state, mcts_budget_ms)[0]
+                    else:
+                        sanitized_game_state = cls.sanitize_game_state(game_state, rotation)
+                        chosen_block = cls.get_minimax_move(sanitized_game_state, minimax_workers)
+                        chosen_block = cls.sanitize_move(sanitized_game_state, chosen_block, rotation)
+                    game_obj.pick_block(game_state, chosen_block)
+                    game_state = game_obj.get_game_state()
+                cls._record_episode(con, game_obj, experimentation, optimal_player_id, trajectory_log, explored_plies)
+        finally:
+            if con is not db_con and trajectory_log is None:
+                con.flush()
+        db_con.execute('PRAGMA optimize')
+        db_con.close()
 
-            with con:
-                con.executemany(
-                    'INSERT INTO q_table (game_state, block_index, num_wins, num_games) VALUES (?, ?, ?, ?)'
-                    ' ON CONFLICT (game_state, block_index) DO UPDATE SET num_wins = num_wins + excluded.num_wins,'
-                    f' num_games = num_games + excluded.num_games WHERE excluded.num_wins != {cls.GUARANTEED_LOSS}',
-                    insert_vals
-                )
-                properties_to_increment = [(f'{init_state}_{experimentation}_p{optimal_player_id}_games',)]
-                if optimal_won:
-                    properties_to_increment.append((f'{init_state}_{experimentation}_p{optimal_player_id}_wins',))
-                con.executemany('INSERT INTO q_meta (property, property_val) VALUES (?, 1)'
-                                ' ON CONFLICT (property) DO UPDATE SET property_val = property_val + 1',
-                                properties_to_increment)
-        con.execute('PRAGMA optimize')
-        con.close()
+    @classmethod
+    def _get_training_q_table(cls, con: sqlite3.Connection, flush_episodes: int, flush_seconds: float,
+                              trajectory_log: TrajectoryLog = None):
+        """
+        With trajectory_log, the bot learns from its episodes in memory while training, but the database is only
+        updated by aggregate_trajectory_logs. The guaranteed losses found while experimenting are not stored either, but
+        found again from the plies explored which are logged with the episodes. The memory is bounded like the one of a
+        flushed q_table, see QTable
+        """
+        if trajectory_log is not None:
+            return QTable(con, cls.GUARANTEED_LOSS, flush_episodes=0, flush_seconds=0, store=False)
+        if flush_episodes or flush_seconds:
+            return QTable(con, cls.GUARANTEED_LOSS, flush_episodes, flush_seconds)
+        return con
+
+    @classmethod
+    def _save_episode(cls, con: sqlite3.Connection | ShardRouter | QTable, insert_vals: list,
+                      properties_to_increment: list):
+        Metrics.increment('episodes_total')
+        if isinstance(con, QTable):
+            con.add_episode(insert_vals, properties_to_increment)
+            return
+        start = Metrics.start()
+        with con:
+            if isinstance(con, ShardRouter):
+                con.upsert(insert_vals)
+            else:
+                con.executemany(ShardRouter.get_upsert_sql(cls.GUARANTEED_LOSS), insert_vals)
+            con.executemany('INSERT INTO q_meta (property, property_val) VALUES (?, 1)'
+                            ' ON CONFLICT (property) DO UPDATE SET property_val = property_val + 1',
+                            properties_to_increment)
+        Metrics.observe_since('commit_seconds', start)
 
     @classmethod
     def _get_data_for_q_table(cls, move_per_state: list, p_won: bool):
         """
         Increment the total games count for each state, and if p has won then also increment the wins. If p has lost
-        then mark the last move as guaranteed loss
+        then mark the last move as guaranteed loss. States and moves are stored canonicalized, and the states encoded
         """
         last_move_index = len(move_per_state) - 1
         insert_data = []
         wins = int(p_won)
         for i, (game_state, p_move) in enumerate(move_per_state):
+            game_state, p_move = Symmetry.canonicalize_move(game_state, p_move)
+            game_state = IceBreaker.encode_game_state(game_state)
             if i == last_move_index and not p_won:
                 insert_data.append((game_state, p_move, cls.GUARANTEED_LOSS, -cls.GUARANTEED_LOSS))
             else:
@@ -282,77 +1158,218 @@ class Intellect:
         return insert_data
 
     @classmethod
-    def test_optimal_vs_minimax(cls, grid_size: int, num_episodes: int = 10000, optimal_first: bool = True):
+    def test_optimal_vs_minimax(cls, grid_size: int, num_episodes: int = 10000, optimal_first: bool = True,
+                                minimax_workers: int = 1):
+        """
+        Plays num_episodes games of the bot against minimax, see models/evaluation.py for evaluating in parallel with
+        confidence intervals
+        Returns:
+            (int) games won by the bot
+        """
         con = cls.get_db_conn(grid_size)
         wins = 0
+        for ep in range(num_episodes):
+            wins += cls.play_vs_minimax(con, grid_size, optimal_first, random.choice([-1, 0, 1, 2]),
+                                        minimax_workers=minimax_workers)
+
+        con.close()
+        return wins
+
+    @classmethod
+    def play_vs_minimax(cls, con: sqlite3.Connection, grid_size: int, optimal_first: bool, rotation: int,
+                        bear_index: int = None, learn: bool = True, minimax_workers: int = 1):
+        """
+        Plays one game of the bot, without experimentation, against minimax which sees the grid rotated by rotation
+        Returns:
+            (bool) whether the bot won
+        """
+        game_obj = cls.ENGINE(grid_size, bear_index)
+        game_state = game_obj.get_game_state()
+        while not game_obj.game_ended:
+            if bool(game_obj.current_player.id == game_obj.p1.id) == optimal_first:
+                log_msg, chosen_block = cls.get_optimal_move(con, game_state, 0, learn)
+            else:
+                sanitized_game_state = cls.sanitize_game_state(game_state, rotation)
+                chosen_block = cls.get_minimax_move(sanitized_game_state, minimax_workers)
+                chosen_block = cls.sanitize_move(sanitized_game_state, chosen_block, rotation)
+            game_obj.pick_block(game_state, chosen_block)
+            game_state = game_obj.get_game_state()
+        return bool(game_obj.winner.id == game_obj.p1.id) == optimal_first
+
+    @classmethod
+    def export_policy(cls, grid_size: int, path: str = None):
+        """
+        Scans the q_table once and writes the best moves of every state, as get_best_moves returns them, to a Policy
+        file. States whose every attempted move is a guaranteed loss are left out
+        Returns:
+            (int, int) number of states in the q_table and in the policy
+        """
+        con = cls.get_db_conn(grid_size)
+        num_game_states = 0
+
+        def get_records():
+            nonlocal num_game_states
+            if isinstance(con, ShardRouter):
+                q_rows = con.iter_rows(ordered=True)
+            else:
+                q_rows = con.execute('SELECT game_state, block_index, num_wins, num_games FROM q_table'
+                                     ' ORDER BY game_state, block_index')
+            # rows are in the order of the primary key, so the rows of a state come one after another
+            for encoded_game_state, rows in itertools.groupby(q_rows, key=lambda row: row[0]):
+                num_game_states += 1
+                win_rate, moves = cls._rank_moves([row[1:4] for row in rows])[1]
+                if moves:
+                    yield encoded_game_state, win_rate, moves
+
+        num_records = Policy.write(path or Policy.get_path(grid_size), grid_size, get_records())
+        con.close()
+        return num_game_states, num_records
+
+    @classmethod
+    def get_policy_coverage(cls, policy: Policy, num_episodes: int = 1000, minimax_workers: int = 1):
+        """
+        Plays num_episodes games of the policy against minimax like test_optimal_vs_minimax, the policy moving first in
+        half of them. Where the policy has no move, the tablebase or else a random move which does not lose right away
+        is played
+        Returns:
+            (int, int, int) states of the policy player answered by the policy, all states of the policy player, and
+            games won by the policy player
+        """
+        answered = total = wins = 0
         for ep in range(num_episodes):
             rotation = random.choice([-1, 0, 1, 2])
-            game_obj = IceBreaker(grid_size)
+            game_obj = cls.ENGINE(policy.grid_size)
             game_state = game_obj.get_game_state()
+            policy_player_id = game_obj.p1.id if ep < (num_episodes / 2) else game_obj.p2.id
             while not game_obj.game_ended:
-                if bool(game_obj.current_player.id == game_obj.p1.id) == optimal_first:
-                    log_msg, chosen_block = cls.get_optimal_move(con, game_state, 0)
+                if game_obj.current_player.id == policy_player_id:
+                    chosen_block = policy.get_move(game_state)
+                    total += 1
+                    if chosen_block is None:
+                        chosen_block = cls.get_optimal_move(None, game_state, 0, learn=False)[1]
+                    else:
+                        answered += 1
                 else:
                     sanitized_game_state = cls.sanitize_game_state(game_state, rotation)
-                    chosen_block = cls.get_minimax_move(sanitized_game_state)
+                    chosen_block = cls.get_minimax_move(sanitized_game_state, minimax_workers)
                     chosen_block = cls.sanitize_move(sanitized_game_state, chosen_block, rotation)
                 game_obj.pick_block(game_state, chosen_block)
                 game_state = game_obj.get_game_state()
-            if bool(game_obj.winner.id == game_obj.p1.id) == optimal_first:
+            if game_obj.winner.id == policy_player_id:
                 wins += 1
+        return answered, total, wins
 
-        con.close()
-        return wins
+    @classmethod
+    def get_minimax_move(cls, game_state: str, workers: int = 1, executor: ProcessPoolExecutor = None,
+                         split_depth: int = 1, deadline: float = None):
+        """
+        Returns the move from the tablebase, otherwise a winning move found by the solver, if there is any
+
+        With more than 1 worker, the positions split_depth moves below game_state are solved in parallel, at most
+        workers at a time, by executor or else by a pool of workers processes shared by the calls, unless game_state is
+        small enough to be solved faster here (see ParallelSolver.is_worth_splitting). With deadline, a
+        time.monotonic() value, the search is stopped at the deadline and raises TimeoutError
+        """
+        tablebase_move = cls.get_tablebase_move(game_state)
+        if tablebase_move is not None:
+            return tablebase_move
+        cls._get_budget_ms_before(None, deadline)
+        start = Metrics.start()
+        if workers > 1 and ParallelSolver.is_worth_splitting(game_state):
+            parallel_solver = ParallelSolver(executor or cls.get_minimax_executor(workers), workers, split_depth)
+            move = parallel_solver.get_best_move(game_state, None if deadline is None else deadline - time.monotonic())
+            Metrics.observe_since('minimax_seconds', start, search='parallel')
+            return move
+        solver = cls.get_solver()
+        nodes = solver.nodes
+        result = solver.get_best_move(game_state, stop=None if deadline is None else
+                                      lambda: time.monotonic() >= deadline)
+        Metrics.observe_since('minimax_seconds', start, search='exact')
+        Metrics.increment('minimax_nodes_total', solver.nodes - nodes, search='exact')
+        if result is None:
+            raise TimeoutError('Minimax search timed out')
+        return result[0]
+
+    @classmethod
+    def get_minimax_move_within(cls, game_state: str, budget_ms: float, deadline: float = None):
+        """
+        Same as get_minimax_move, but the solver searches with iterative deepening for about budget_ms milliseconds,
+        and no longer than until deadline
+        Returns:
+            (int|None, int|None, bool) best move found, depth searched (None if the move is from the tablebase) and
+            whether the result of the move is proven
+        """
+        tablebase_move = cls.get_tablebase_move(game_state)
+        if tablebase_move is not None:
+            return tablebase_move, None, True
+        budget_ms = cls._get_budget_ms_before(budget_ms, deadline)
+        start = Metrics.start()
+        solver = cls.get_solver()
+        nodes = solver.nodes
+        move, _, depth, proven = solver.get_best_move_within(game_state, budget_ms)
+        Metrics.observe_since('minimax_seconds', start, search='budget')
+        Metrics.increment('minimax_nodes_total', solver.nodes - nodes, search='budget')
+        return move, depth, proven
+
+    @staticmethod
+    def _get_budget_ms_before(budget_ms: float | None, deadline: float | None):
+        """
+        Returns:
+            (float|None) budget_ms cut to the milliseconds left until deadline, if any
+        Raises:
+            TimeoutError if deadline has passed, e.g. while the search was waiting for a process
+        """
+        if deadline is None:
+            return budget_ms
+        remaining_ms = (deadline - time.monotonic()) * 1000
+        if remaining_ms <= 0:
+            raise TimeoutError('Search timed out before it started')
+        return remaining_ms if budget_ms is None else min(budget_ms, remaining_ms)
 
     @classmethod
-    def get_minimax_move(cls, game_state: str):
+    def get_mcts_move(cls, game_state: str, budget_ms: float = None, max_rollouts: int = None,
+                      con: sqlite3.Connection | QTable | None = None, deadline: float = None):
+        """
+        Returns the move from the tablebase, otherwise the move found by Monte Carlo tree search within budget_ms
+        milliseconds (MCTS_BUDGET_MS if neither it nor max_rollouts is given) or max_rollouts rollouts, and no longer
+        than until deadline. With con, the q_table gives the priors of the search, see MCTS
+        Returns:
+            (int|None, int, float|None, bool) move, rollouts played, win rate of the move (None if the move is from the
+            tablebase) and whether its result is proven
+        """
+        tablebase_move = cls.get_tablebase_move(game_state)
+        if tablebase_move is not None:
+            return tablebase_move, 0, None, True
+        if budget_ms is None and max_rollouts is None:
+            budget_ms = cls.MCTS_BUDGET_MS
+        budget_ms = cls._get_budget_ms_before(budget_ms, deadline)
+        start = Metrics.start()
+        mcts = MCTS(None if con is None else functools.partial(cls._get_mcts_priors, con))
+        result = mcts.get_best_move(game_state, budget_ms, max_rollouts)
+        Metrics.observe_since('mcts_seconds', start)
+        Metrics.increment('mcts_rollouts_total', result[1])
+        return result
+
+    @classmethod
+    def get_mcts_move_with_q_table(cls, game_state: str, budget_ms: float = None, deadline: float = None):
+        """
+        get_mcts_move with the q_table of the grid size as priors, if it has a database, through a read-only
+        connection kept open by the process, e.g. a minimax process of the API
+        """
         grid_size = int(len(game_state) ** 0.5)
-        possible_moves = [block_index for block_index, block_state in enumerate(game_state)
-                          if int(block_state) == IceBreaker.BlockState.ICED.value]
-
-        best_score = -10000000
-        best_move = None
-        for possible_move in possible_moves:
-            lake_array = list(map(int, game_state))
-            score = cls._alpha_beta_minimax(lake_array, possible_move, grid_size, 10000000, 10000000, -10000000, True)
-            if score > best_score:
-                best_score = score
-                best_move = possible_move
-        return best_move
-
-    @classmethod
-    def _alpha_beta_minimax(cls, lake_array: list, picked_move: int, grid_size: int, depth: int, alpha: int, beta: int,
-                            maximizing_player: bool):
-        if depth == 0 or IceBreaker.register_uniced_block(lake_array, picked_move, grid_size) == -1:
-            return cls._static_evaluation(maximizing_player, True)
-        possible_moves = [block_index for block_index, block_state in enumerate(lake_array)
-                          if block_state == IceBreaker.BlockState.ICED.value]
-        if maximizing_player:
-            best_score = -10000000
-        else:
-            best_score = 10000000
-        for possible_move in possible_moves:
-            test_lake_array = list(lake_array)
-            score = cls._alpha_beta_minimax(test_lake_array, possible_move, grid_size, depth - 1, alpha, beta,
-                                            not maximizing_player)
-            if maximizing_player:
-                best_score = max(best_score, score)
-                alpha = max(alpha, score)
-            else:
-                best_score = min(best_score, score)
-                beta = min(beta, score)
-            if beta <= alpha:
-                break
-        return best_score
+        if grid_size not in cls._mcts_connections:
+            cls._mcts_connections[grid_size] = cls.get_read_only_db_conn(grid_size) \
+                if os.path.exists(cls.get_db_path(grid_size)) else None
+        return cls.get_mcts_move(game_state, budget_ms, con=cls._mcts_connections[grid_size], deadline=deadline)
 
     @classmethod
-    def _static_evaluation(cls, maximizing_player, game_over):
-        if game_over:
-            if maximizing_player:
-                return -40
-            else:
-                return 40
-        if maximizing_player:
-            return 10
-        else:
-            return -10
+    def _get_mcts_priors(cls, con: sqlite3.Connection | QTable, game_state: str):
+        """
+        Returns:
+            (dict) move -> (num_wins, num_games) of the q_table rows of game_state, None for the guaranteed losses
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        canonical_game_state, transform = Symmetry.canonicalize_game_state(game_state)
+        return {Symmetry.from_canonical_move(block_index, grid_size, transform):
+                None if num_wins == cls.GUARANTEED_LOSS else (num_wins, num_games)
+                for block_index, num_wins, num_games in cls._get_q_rows(con, canonical_game_state)}
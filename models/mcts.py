@@ -0,0 +1,174 @@
+import math
+import random
+import time
+
+from models.bit_ice_breaker import BitIceBreaker
+
+
+class MCTS:
+    """
+    Monte Carlo tree search with UCT selection on the bitmask positions of BitIceBreaker. A rollout plays random moves
+    which do not collapse the bear, until a player has none left and loses.
+
+    priors, if given, returns the known results of the moves of a game state, {move: (num_wins, num_games)}, or
+    {move: None} for a guaranteed loss. The results are counted as at most max_prior_games visits of the move, so that
+    the rollouts can still overturn them, and the guaranteed losses are pruned without being searched.
+
+    Positions are proven once known to be won or lost, as in MCTS-Solver: a position is won when one of its moves
+    leaves the opponent in a lost position, and lost when it has no move which does not collapse the bear, or all of
+    them leave the opponent in a won position
+    """
+
+    EXPLORATION = 1.4
+    MAX_PRIOR_GAMES = 20
+
+    def __init__(self, priors=None, exploration: float = EXPLORATION, max_prior_games: int = MAX_PRIOR_GAMES,
+                 rng: random.Random = None):
+        self.priors = priors
+        self.exploration = exploration
+        self.max_prior_games = max_prior_games
+        # the module by default, so that random.seed makes the search reproducible like the rest of the training
+        self.rng = rng or random
+        self.rollouts = 0
+
+    def get_best_move(self, game_state: str, budget_ms: float = None, max_rollouts: int = None):
+        """
+        Searches game_state until budget_ms milliseconds or max_rollouts rollouts are spent, or its result is proven
+        Returns:
+            (int|None, int, float|None, bool) most visited move (None if there is no iced block), number of rollouts,
+            win rate of the move and whether its result is proven
+        """
+        assert budget_ms is not None or max_rollouts is not None
+        grid_size = int(len(game_state) ** 0.5)
+        iced_mask, bear_index = BitIceBreaker.get_position(game_state)
+        deadline = None if budget_ms is None else time.perf_counter() + (budget_ms / 1000)
+        root = _Node(None, iced_mask)
+        self.rollouts = 0
+        while root.result is None:
+            if max_rollouts is not None and self.rollouts >= max_rollouts:
+                break
+            if deadline is not None and self.rollouts and time.perf_counter() >= deadline:
+                break
+            self._iterate(root, bear_index, grid_size)
+
+        if not root.children:
+            # every move collapses the bear
+            move = next(iter(BitIceBreaker.get_block_indices(iced_mask)), None)
+            return move, self.rollouts, 0.0, root.result is not None
+        if root.result == 1:
+            best_child = next(child for child in root.children if child.result == -1)
+        else:
+            best_child = max(root.children, key=lambda child: (child.result != 1, child.visits))
+        win_rate = best_child.wins / best_child.visits if best_child.visits else None
+        if best_child.result is not None:
+            win_rate = float(best_child.result == -1)
+        return best_child.move, self.rollouts, win_rate, best_child.result is not None
+
+    def _iterate(self, root, bear_index: int, grid_size: int):
+        node = root
+        path = [root]
+        while node.result is None and node.children is not None:
+            node = self._select(node)
+            path.append(node)
+        if node.result is None:
+            self._expand(node, bear_index, grid_size)
+
+        # a proven position counts as a rollout with its result
+        self.rollouts += 1
+        if node.result is None:
+            to_move_wins = self._rollout(node.iced_mask, bear_index, grid_size)
+        else:
+            to_move_wins = node.result == 1
+            self._propagate_result(path)
+
+        # the wins of a node are those of the player who moved into it
+        for visited_node in reversed(path):
+            visited_node.visits += 1
+            if visited_node is not node:
+                visited_node.child_visits += 1
+            if not to_move_wins:
+                visited_node.wins += 1
+            to_move_wins = not to_move_wins
+
+    def _select(self, node):
+        log_visits = math.log(node.child_visits + 1)
+        best_child = None
+        best_value = -math.inf
+        for child in node.children:
+            if child.result == 1:
+                continue
+            if child.result == -1 or not child.visits:
+                return child
+            value = (child.wins / child.visits) + (self.exploration * math.sqrt(log_visits / child.visits))
+            if value > best_value:
+                best_child = child
+                best_value = value
+        return best_child
+
+    def _expand(self, node, bear_index: int, grid_size: int):
+        priors = {}
+        if self.priors is not None:
+            priors = self.priors(BitIceBreaker.get_game_state_from_position((node.iced_mask, bear_index), grid_size))
+        node.children = []
+        for move, footprint in BitIceBreaker.analyze_mask(node.iced_mask, bear_index, grid_size)[1].items():
+            if move in priors and priors[move] is None:
+                continue
+            child = _Node(move, node.iced_mask ^ footprint)
+            prior = priors.get(move)
+            if prior is not None and prior[1] > 0:
+                num_wins, num_games = prior
+                child.visits = min(num_games, self.max_prior_games)
+                child.wins = child.visits * num_wins / num_games
+                node.child_visits += child.visits
+            node.children.append(child)
+        if not node.children:
+            node.result = -1
+
+    def _propagate_result(self, path: list):
+        for i in range(len(path) - 1, 0, -1):
+            node = path[i]
+            parent = path[i - 1]
+            if parent.result is not None:
+                return
+            if node.result == -1:
+                parent.result = 1
+            elif all(child.result == 1 for child in parent.children):
+                parent.result = -1
+            else:
+                return
+
+    def _rollout(self, iced_mask: int, bear_index: int, grid_size: int):
+        """
+        Returns:
+            (bool) whether the player to move wins the random game
+        """
+        to_move_wins = True
+        while True:
+            moves = BitIceBreaker.get_block_indices(iced_mask)
+            while moves:
+                move = moves.pop(self.rng.randrange(len(moves)))
+                child_iced_mask = BitIceBreaker.register_uniced_mask(iced_mask, bear_index, move, grid_size)
+                if child_iced_mask != -1:
+                    iced_mask = child_iced_mask
+                    break
+            else:
+                return not to_move_wins
+            to_move_wins = not to_move_wins
+
+
+class _Node:
+    """
+    Position of the search tree. wins and visits are those of the move into the position, from the point of view of
+    the player who made it. result is 1 if the position is won for the player to move, -1 if lost, None until proven
+    """
+
+    __slots__ = ('move', 'iced_mask', 'children', 'wins', 'visits', 'child_visits', 'result')
+
+    def __init__(self, move, iced_mask: int):
+        self.move = move
+        self.iced_mask = iced_mask
+        self.children = None
+        self.wins = 0
+        self.visits = 0
+        self.child_visits = 0
+        self.result = None
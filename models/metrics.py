@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+
+
+class Metrics:
+    """
+    Counters and latency histograms of this process, recorded only while Metrics.enabled is set so that they cost a
+    single attribute check otherwise. Metrics are identified by name and optional labels, e.g.
+    `Metrics.increment('decisions_total', branch='optimal')`.
+
+    Work done in other processes is recorded by running it through Metrics.collect there, and merging the returned
+    snapshot with Metrics.merge
+    """
+
+    enabled = False
+    # upper bounds in seconds of the histogram buckets, the last bucket has no upper bound
+    BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+               0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    PREFIX = 'icebreaker_'
+
+    _lock = threading.Lock()
+    # (name, labels) -> value
+    _counters = {}
+    # (name, labels) -> [bucket counts, sum, count]
+    _histograms = {}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._counters = {}
+            cls._histograms = {}
+
+    @classmethod
+    def increment(cls, name: str, value: int = 1, **labels):
+        if not cls.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with cls._lock:
+            cls._counters[key] = cls._counters.get(key, 0) + value
+
+    @classmethod
+    def start(cls):
+        """
+        Returns:
+            (float|None) start time to pass to observe_since, None if metrics are disabled
+        """
+        return time.perf_counter() if cls.enabled else None
+
+    @classmethod
+    def observe_since(cls, name: str, start: float | None, **labels):
+        if start is not None:
+            cls.observe(name, time.perf_counter() - start, **labels)
+
+    @classmethod
+    def observe(cls, name: str, seconds: float, **labels):
+        if not cls.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with cls._lock:
+            histogram = cls._histograms.get(key)
+            if histogram is None:
+                histogram = cls._histograms[key] = [[0] * (len(cls.BUCKETS) + 1), 0, 0]
+            histogram[0][bisect.bisect_left(cls.BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @classmethod
+    def get_counter(cls, name: str, **labels):
+        with cls._lock:
+            return cls._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @classmethod
+    def get_snapshot(cls):
+        """
+        Returns:
+            (dict) copy of the metrics which can be sent to another process and merged there
+        """
+        with cls._lock:
+            return {
+                'counters': dict(cls._counters),
+                'histograms': {key: [list(buckets), total, count]
+                               for key, (buckets, total, count) in cls._histograms.items()},
+            }
+
+    @classmethod
+    def merge(cls, snapshot: dict):
+        if not cls.enabled:
+            return
+        with cls._lock:
+            for key, value in snapshot['counters'].items():
+                cls._counters[key] = cls._counters.get(key, 0) + value
+            for key, (buckets, total, count) in snapshot['histograms'].items():
+                histogram = cls._histograms.get(key)
+                if histogram is None:
+                    histogram = cls._histograms[key] = [[0] * (len(cls.BUCKETS) + 1), 0, 0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], buckets)]
+                histogram[1] += total
+                histogram[2] += count
+
+    @classmethod
+    def collect(cls, enabled: bool, function, *args):
+        """
+        Runs function in a worker process with the metrics of the calling process enabled or not
+        Returns:
+            (any, dict|None) result of function, and the snapshot of the metrics it recorded if enabled
+        """
+        cls.enabled = enabled
+        cls.reset()
+        result = function(*args)
+        return result, cls.get_snapshot() if enabled else None
+
+    @classmethod
+    def get_summary(cls):
+        """
+        Returns:
+            (dict) counters, and count, sum, mean and approximate 50th and 99th percentiles of the histograms, keyed by
+            name and labels, e.g. `decisions_total{branch="optimal"}`
+        """
+        snapshot = cls.get_snapshot()
+        summary = {'counters': {}, 'histograms': {}}
+        for (name, labels), value in sorted(snapshot['counters'].items()):
+            summary['counters'][cls._format_name(name, labels)] = value
+        for (name, labels), (buckets, total, count) in sorted(snapshot['histograms'].items()):
+            summary['histograms'][cls._format_name(name, labels)] = {
+                'count': count,
+                'sum': total,
+                'mean': total / count if count else 0,
+                'p50': cls._get_percentile(buckets, count, 0.5),
+                'p99': cls._get_percentile(buckets, count, 0.99),
+            }
+        return summary
+
+    @classmethod
+    def get_prometheus_text(cls):
+        """
+        Returns:
+            (str) metrics in the Prometheus text exposition format
+        """
+        snapshot = cls.get_snapshot()
+        lines = []
+        previous_name = None
+        for (name, labels), value in sorted(snapshot['counters'].items()):
+            if name != previous_name:
+                lines.append(f'# TYPE {cls.PREFIX}{name} counter')
+                previous_name = name
+            lines.append(f'{cls.PREFIX}{cls._format_name(name, labels)} {value}')
+        for (name, labels), (buckets, total, count) in sorted(snapshot['histograms'].items()):
+            if name != previous_name:
+                lines.append(f'# TYPE {cls.PREFIX}{name} histogram')
+                previous_name = name
+            cumulative = 0
+            for upper_bound, bucket_count in zip(cls.BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket_count
+                lines.append(f'{cls.PREFIX}{cls._format_name(f"{name}_bucket", labels + (("le", upper_bound),))}'
+                             f' {cumulative}')
+            lines.append(f'{cls.PREFIX}{cls._format_name(f"{name}_sum", labels)} {total}')
+            lines.append(f'{cls.PREFIX}{cls._format_name(f"{name}_count", labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _format_name(name: str, labels: tuple):
+        if not labels:
+            return name
+        return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
+
+    @classmethod
+    def _get_percentile(cls, buckets: list, count: int, percentile: float):
+        """
+        Upper bound of the bucket holding the percentile, None if it is in the last bucket
+        """
+        cumulative = 0
+        for upper_bound, bucket_count in zip(cls.BUCKETS + (None,), buckets):
+            cumulative += bucket_count
+            if count and cumulative >= percentile * count:
+                return upper_bound
+        return None
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+from models.symmetry import Symmetry
+
+
+class OpeningBook:
+    """
+    Moves of the opening states of a grid size kept in memory: the canonical initial states of every bear block
+    IceBreaker can start with, and the states reachable from them in up to plies moves which don't collapse the bear.
+
+    The q_table moves are the best moves of get_best_moves, loaded along with the version of the database they were
+    read from, and only served while the database has that version. They are reloaded at most once every
+    reload_seconds, so that a database being trained is not read again on every change. The minimax moves are only
+    added once proven, so they stay exact whatever the database
+    """
+
+    def __init__(self, grid_size: int, plies: int = 2, reload_seconds: float = 0):
+        self.grid_size = grid_size
+        self.game_states = self.get_opening_states(grid_size, plies)
+        self.reload_seconds = reload_seconds
+        # (version of the database, canonical game state -> moves having the highest win rate), replaced as a whole so
+        # that the moves are never read with the version of others
+        self.q_table_moves = (None, {})
+        self.loading = False
+        # time.monotonic() at which the last load started
+        self.load_started = None
+        # canonical game state -> proven minimax move
+        self.minimax_moves = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_opening_states(grid_size: int, plies: int):
+        """
+        Returns:
+            (list) canonical opening states, ply by ply
+        """
+        frontier = []
+        for bear_index in IceBreaker.get_initial_bear_indices(grid_size):
+            game_state = Symmetry.canonicalize_game_state(IceBreaker(grid_size, bear_index).get_game_state())[0]
+            if game_state not in frontier:
+                frontier.append(game_state)
+        game_states = list(frontier)
+        seen = set(frontier)
+        for _ in range(plies):
+            next_frontier = []
+            for game_state in frontier:
+                iced_mask, bear_index = BitIceBreaker.get_position(game_state)
+                for footprint in BitIceBreaker.analyze_mask(iced_mask, bear_index, grid_size)[1].values():
+                    child_game_state = Symmetry.canonicalize_game_state(BitIceBreaker.get_game_state_from_position(
+                        (iced_mask ^ footprint, bear_index), grid_size))[0]
+                    if child_game_state not in seen:
+                        seen.add(child_game_state)
+                        next_frontier.append(child_game_state)
+            game_states += next_frontier
+            frontier = next_frontier
+        return game_states
+
+    def get_q_table_moves(self, canonical_game_state: str, version):
+        """
+        Returns:
+            (list|None) best moves of canonical_game_state, None if it is not in the book or the book was loaded from
+            another version of the database
+        """
+        q_table_version, q_table_moves = self.q_table_moves
+        if version != q_table_version:
+            return None
+        return q_table_moves.get(canonical_game_state)
+
+    def should_load(self, version):
+        """
+        Returns:
+            (bool) whether the q_table moves are not of version and the caller should load them, which only one caller
+            is told to do at a time, and not until reload_seconds after the last load started
+        """
+        with self.lock:
+            if version == self.q_table_moves[0] or self.loading or (
+                    self.load_started is not None and time.monotonic() - self.load_started < self.reload_seconds):
+                return False
+            self.loading = True
+            return True
+
+    def load_q_table_moves(self, con, version):
+        """
+        Loads the q_table moves from con, which has to be read after version was taken, so that the moves are never
+        older than it
+        """
+        with self.lock:
+            self.load_started = time.monotonic()
+        try:
+            q_table_moves = {game_state: moves for game_state, (_, moves) in
+                             Intellect.get_best_moves_of_states(con, self.game_states).items() if moves}
+            self.q_table_moves = (version, q_table_moves)
+        finally:
+            with self.lock:
+                self.loading = False
+
+    def get_stats(self):
+        return {
+            'game_states': len(self.game_states),
+            'q_table_moves': len(self.q_table_moves[1]),
+            'minimax_moves': len(self.minimax_moves),
+        }
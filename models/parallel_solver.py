@@ -0,0 +1,218 @@
+import mmap
+import os
+import tempfile
+import time
+
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.solver import Solver
+
+
+class ParallelSolver:
+    """
+    Solves a game state by splitting its game tree at split_depth plies below the root. The positions at the split
+    depth are solved by the processes of executor, at most `workers` at a time, and their results are combined here:
+    a position is won as soon as one of its moves leaves the opponent in a lost position, and lost once all of them
+    leave the opponent in a won position.
+
+    Positions reached by several move orders are solved once, and their result is shared by all of them. Once the
+    result of a position is known, the searches of the positions below it are stopped, so a win found by one worker
+    stops the others. The workers poll a file with one flag byte per position, which works with any pool
+    """
+
+    # positions with at most this many iced blocks are solved in a few milliseconds by Solver, less than the processes
+    # take to split them
+    MIN_ICED_BLOCKS = 28
+    # solver of the worker process, kept between the tasks so that its transposition table is reused
+    _solver = None
+
+    def __init__(self, executor: Executor, workers: int, split_depth: int = 1):
+        assert workers > 0 and split_depth > 0
+        self.executor = executor
+        self.workers = workers
+        self.split_depth = split_depth
+
+    @classmethod
+    def is_worth_splitting(cls, game_state: str):
+        return game_state.count(str(BitIceBreaker.BlockState.ICED.value)) > cls.MIN_ICED_BLOCKS
+
+    def get_best_move(self, game_state: str, timeout: float = None):
+        """
+        Same as Solver.get_best_move without exact
+        Returns:
+            (int|None) a winning move if there is one, otherwise a move which does not lose right away if there is one
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        iced_mask, bear_index = BitIceBreaker.get_position(game_state)
+        leaves = {}
+        root = self._expand(iced_mask, bear_index, grid_size, self.split_depth, None, None, leaves)
+        self._resolve_expanded(root)
+        leaves = list(leaves.values())
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        flags_fd, flags_path = tempfile.mkstemp(prefix='icebreaker_split_')
+        try:
+            os.write(flags_fd, bytes(max(len(leaves), 1)))
+            flags = mmap.mmap(flags_fd, 0)
+            try:
+                self._solve_leaves(root, leaves, flags, flags_path, deadline)
+            finally:
+                # stops the searches still running
+                flags[:] = b'\x01' * len(flags)
+                flags.close()
+        finally:
+            os.close(flags_fd)
+            os.remove(flags_path)
+
+        if root.win:
+            return next(child.move for child in root.children if child.win is False)
+        if root.children:
+            return root.children[0].move
+        # every move collapses the bear
+        return next(iter(BitIceBreaker.get_block_indices(iced_mask)), None)
+
+    def _solve_leaves(self, root, leaves: list, flags: mmap.mmap, flags_path: str, deadline: float):
+        pending = {}
+        next_leaf_index = 0
+        while root.win is None:
+            while len(pending) < self.workers and next_leaf_index < len(leaves):
+                leaf = leaves[next_leaf_index]
+                next_leaf_index += 1
+                if not leaf.is_resolved():
+                    pending[self.executor.submit(self._solve_leaf, leaf.game_state, flags_path, leaf.index)] = leaf
+            if not pending:
+                # every leaf is solved or stopped
+                break
+
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                for future in pending:
+                    future.cancel()
+                raise TimeoutError('Parallel minimax search timed out')
+            for future in done:
+                leaf = pending.pop(future)
+                win = future.result()
+                if win is None:
+                    continue
+                for node in leaf.nodes:
+                    if not node.is_resolved():
+                        self._resolve(node, win, flags)
+
+        for future in pending:
+            future.cancel()
+
+    @classmethod
+    def _solve_leaf(cls, game_state: str, flags_path: str, leaf_index: int):
+        """
+        Runs in the worker processes
+        Returns:
+            (bool|None) whether game_state is won for the player to move, None if the search was stopped
+        """
+        if cls._solver is None:
+            cls._solver = Solver()
+        try:
+            with open(flags_path, 'rb') as f:
+                flags = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            # the search is over and its flags removed, e.g. a task which started after the timeout
+            return None
+        try:
+            if flags[leaf_index]:
+                return None
+            result = cls._solver.get_best_move(game_state, stop=lambda: flags[leaf_index])
+        finally:
+            flags.close()
+        return None if result is None else Solver.is_win(result[1])
+
+    def _expand(self, iced_mask: int, bear_index: int, grid_size: int, depth: int, move, parent, leaves: dict):
+        node = _Node(move, parent)
+        if depth == 0:
+            leaf = leaves.get(iced_mask)
+            if leaf is None:
+                leaf = leaves[iced_mask] = _Leaf(
+                    BitIceBreaker.get_game_state_from_position((iced_mask, bear_index), grid_size), len(leaves))
+            leaf.nodes.append(node)
+            node.leaf = leaf
+            return node
+
+        children = []
+        for child_move, footprint in BitIceBreaker.analyze_mask(iced_mask, bear_index, grid_size)[1].items():
+            child_iced_mask = iced_mask ^ footprint
+            children.append((child_iced_mask.bit_count(), child_move, child_iced_mask))
+        # the smallest subtrees first, as in Solver._move_order
+        children.sort()
+        if not children:
+            node.win = False
+        for _, child_move, child_iced_mask in children:
+            node.children.append(self._expand(child_iced_mask, bear_index, grid_size, depth - 1, child_move, node,
+                                              leaves))
+        return node
+
+    def _resolve_expanded(self, node):
+        """
+        Propagates the results of the positions which are lost because every move collapses the bear
+        """
+        for child in node.children:
+            self._resolve_expanded(child)
+        if node.win is None and node.children and all(child.win is not None for child in node.children):
+            node.win = not all(child.win for child in node.children)
+        elif node.win is None and any(child.win is False for child in node.children):
+            node.win = True
+
+    def _resolve(self, node, win: bool, flags: mmap.mmap):
+        node.win = win
+        self._stop_leaves(node, flags)
+        parent = node.parent
+        if parent is None or parent.win is not None:
+            return
+        if not win:
+            self._resolve(parent, True, flags)
+        elif all(child.win for child in parent.children):
+            self._resolve(parent, False, flags)
+
+    def _stop_leaves(self, node, flags: mmap.mmap):
+        if node.leaf is not None and node.leaf.is_resolved():
+            flags[node.leaf.index] = 1
+        for child in node.children:
+            self._stop_leaves(child, flags)
+
+
+class _Node:
+    """
+    Position of the split game tree. win is whether the position is won for the player to move, None until known
+    """
+
+    __slots__ = ('move', 'parent', 'children', 'win', 'leaf')
+
+    def __init__(self, move, parent):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.win = None
+        self.leaf = None
+
+    def is_resolved(self):
+        node = self
+        while node is not None:
+            if node.win is not None:
+                return True
+            node = node.parent
+        return False
+
+
+class _Leaf:
+    """
+    Position at the split depth, solved once for all the nodes reaching it. index is its flag byte
+    """
+
+    __slots__ = ('game_state', 'index', 'nodes')
+
+    def __init__(self, game_state: str, index: int):
+        self.game_state = game_state
+        self.index = index
+        self.nodes = []
+
+    def is_resolved(self):
+        return all(node.is_resolved() for node in self.nodes)
@@ -0,0 +1,107 @@
+import bisect
+import mmap
+import os
+import random
+import struct
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.symmetry import Symmetry
+
+
+class Policy:
+    """
+    Best moves of the q_table exported to a read-only memory-mapped file, keyed by canonical game state.
+    File format: header (magic, grid_size, key size, number of records) followed by records sorted by key. A record is
+    the key, i.e. the canonical game state encoded by IceBreaker.encode_game_state, the highest win rate as a
+    big-endian float, and the mask of the moves having it (bit `i` is set for the block `i`)
+
+    The key of every FENCE_RECORDS-th record is kept in memory. A lookup binary searches them, and then finds the key in
+    the FENCE_RECORDS records following the fence
+    """
+
+    MAGIC = b'ICEPL1'
+    HEADER = struct.Struct('>6sBBI')
+    WIN_RATE = struct.Struct('>f')
+    FENCE_RECORDS = 8
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.grid_size, self.key_size, self.num_records = self.HEADER.unpack_from(self.data)
+        assert magic == self.MAGIC, f'{path} is not a policy'
+        self.moves_size = self.get_moves_size(self.grid_size)
+        self.record_size = self.key_size + self.WIN_RATE.size + self.moves_size
+        self._fences = [self.data[offset:offset + self.key_size]
+                        for offset in range(self.HEADER.size, self.HEADER.size + (self.num_records * self.record_size),
+                                            self.FENCE_RECORDS * self.record_size)]
+
+    @classmethod
+    def get_path(cls, grid_size: int):
+        return f'icebreaker{grid_size}_policy.bin'
+
+    @classmethod
+    def get_moves_size(cls, grid_size: int):
+        return ((grid_size ** 2) + 7) // 8
+
+    def close(self):
+        self.data.close()
+
+    def get_best_moves(self, canonical_game_state: str):
+        """
+        Same as Intellect.get_best_moves
+        Returns:
+            (float, list) highest win rate of canonical_game_state and the moves having it, the moves are empty if
+            canonical_game_state is not in the policy
+        """
+        key = BitIceBreaker.encode_game_state(canonical_game_state)
+        fence_index = bisect.bisect_right(self._fences, key) - 1
+        if fence_index < 0:
+            return -1, []
+        block_offset = self.HEADER.size + (fence_index * self.FENCE_RECORDS * self.record_size)
+        block = self.data[block_offset:block_offset + (self.FENCE_RECORDS * self.record_size)]
+        offset = block.find(key)
+        # the key can also match bytes spanning other fields, which are not at the start of a record
+        while offset != -1 and offset % self.record_size:
+            offset = block.find(key, offset + 1)
+        if offset == -1:
+            return -1, []
+        offset += self.key_size
+        win_rate, = self.WIN_RATE.unpack_from(block, offset)
+        moves_mask = int.from_bytes(block[offset + self.WIN_RATE.size:offset + self.WIN_RATE.size + self.moves_size],
+                                    'big')
+        return win_rate, BitIceBreaker.get_block_indices(moves_mask)
+
+    def get_move(self, game_state: str):
+        """
+        Returns:
+            (int|None) one of the best moves of game_state picked at random, None if it is not in the policy
+        """
+        canonical_game_state, transform = Symmetry.canonicalize_game_state(game_state)
+        _, moves = self.get_best_moves(canonical_game_state)
+        if not moves:
+            return None
+        return Symmetry.from_canonical_move(random.choice(moves), self.grid_size, transform)
+
+    @classmethod
+    def write(cls, path: str, grid_size: int, records):
+        """
+        Writes records, (encoded canonical game state, win rate, moves) sorted by encoded game state, to path
+        Returns:
+            (int) number of records
+        """
+        key_size = (grid_size ** 2 + 14) // 8
+        moves_size = cls.get_moves_size(grid_size)
+        num_records = 0
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, grid_size, key_size, 0))
+            for key, win_rate, moves in records:
+                assert len(key) == key_size
+                f.write(key)
+                f.write(cls.WIN_RATE.pack(win_rate))
+                f.write(sum(1 << move for move in moves).to_bytes(moves_size, 'big'))
+                num_records += 1
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, grid_size, key_size, num_records))
+        os.replace(f'{path}.tmp', path)
+        return num_records
+
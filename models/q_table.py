@@ -0,0 +1,154 @@
+import sqlite3
+import time
+
+from models.metrics import Metrics
+from models.shard_router import ShardRouter
+
+
+class QTable:
+    """
+    In-memory cache of q_table and q_meta used while training. Lookups and updates are served from memory, and the
+    updates are written to the database in batches every flush_episodes episodes or flush_seconds seconds (whichever
+    comes first, 0 disables the limit). The database ends up the same as if every episode was committed on its own
+
+    The rows of a state are loaded from the database the first time the state is looked up or updated, so that only
+    the states played are kept in memory. Once more than max_states states without pending updates are cached, they
+    are evicted at the end of the episode, as they can be loaded again (0 disables the limit). The states with pending
+    updates are kept until they are flushed. The database must not be changed by others while the cache is in use
+
+    With store=False the updates are only learnt in memory and never written to the database, e.g. when the episodes
+    are logged instead. The whole cache is then evicted once it holds more than max_states states, so the updates of
+    the evicted states are forgotten
+    """
+
+    MAX_STATES = 1000000
+
+    def __init__(self, con: sqlite3.Connection | ShardRouter, guaranteed_loss: int, flush_episodes: int = 1000,
+                 flush_seconds: float = 0, max_states: int = None, store: bool = True):
+        self.con = con
+        self.guaranteed_loss = guaranteed_loss
+        self.flush_episodes = flush_episodes
+        self.flush_seconds = flush_seconds
+        self.max_states = self.MAX_STATES if max_states is None else max_states
+        self.store = store
+        # encoded game_state -> {block_index: [num_wins, num_games]}, including the pending updates
+        self.q_table = {}
+        # (game_state, block_index) -> [num_wins, num_games] not yet written to the database
+        self.pending_q_table = {}
+        # game states having pending updates, which are never evicted
+        self.pending_game_states = set()
+        # property -> increment not yet written to the database
+        self.pending_q_meta = {}
+        self.pending_episodes = 0
+        self.last_flush = time.monotonic()
+
+    def _get_moves(self, game_state: bytes):
+        moves = self.q_table.get(game_state)
+        if moves is None:
+            if isinstance(self.con, ShardRouter):
+                rows = self.con.get_rows(game_state)
+            else:
+                rows = self.con.execute('SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = ?',
+                                        (game_state,))
+            moves = self.q_table[game_state] = {block_index: [num_wins, num_games]
+                                                for block_index, num_wins, num_games in rows}
+        return moves
+
+    def get_rows(self, game_state: bytes):
+        """
+        Same rows as `SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = ?`
+        """
+        moves = self._get_moves(game_state)
+        if not moves:
+            return []
+        return [(block_index, num_wins, num_games) for block_index, (num_wins, num_games) in sorted(moves.items())]
+
+    def insert_or_ignore(self, rows: list):
+        """
+        Same as `INSERT OR IGNORE INTO q_table`
+        """
+        for game_state, block_index, num_wins, num_games in rows:
+            moves = self._get_moves(game_state)
+            if block_index not in moves:
+                moves[block_index] = [num_wins, num_games]
+                self._add_pending(game_state, block_index, num_wins, num_games)
+
+    def add_episode(self, rows: list, properties_to_increment: list):
+        """
+        Same as upserting rows into q_table, where a guaranteed loss never updates an existing row, and incrementing
+        the q_meta properties. Flushes if the batch is due
+        """
+        for game_state, block_index, num_wins, num_games in rows:
+            moves = self._get_moves(game_state)
+            if block_index not in moves:
+                moves[block_index] = [num_wins, num_games]
+            elif num_wins != self.guaranteed_loss:
+                moves[block_index][0] += num_wins
+                moves[block_index][1] += num_games
+            else:
+                continue
+            self._add_pending(game_state, block_index, num_wins, num_games)
+        if self.store:
+            for (prop,) in properties_to_increment:
+                self.pending_q_meta[prop] = self.pending_q_meta.get(prop, 0) + 1
+
+        self.pending_episodes += 1
+        if (self.flush_episodes and self.pending_episodes >= self.flush_episodes) or \
+                (self.flush_seconds and time.monotonic() - self.last_flush >= self.flush_seconds):
+            self.flush()
+        if self.max_states and len(self.q_table) - len(self.pending_game_states) > self.max_states:
+            self.q_table = {game_state: self.q_table[game_state] for game_state in self.pending_game_states}
+
+    def _add_pending(self, game_state: bytes, block_index: int, num_wins: int, num_games: int):
+        if not self.store:
+            return
+        pending = self.pending_q_table.get((game_state, block_index))
+        if pending is None:
+            self.pending_q_table[(game_state, block_index)] = [num_wins, num_games]
+            self.pending_game_states.add(game_state)
+        elif pending[0] != self.guaranteed_loss:
+            pending[0] += num_wins
+            pending[1] += num_games
+
+    def flush(self):
+        """
+        Writes the pending updates to the database in a single transaction
+        """
+        start = Metrics.start()
+        with self.con:
+            self.upsert(self.con, self.guaranteed_loss, self.pending_q_table, self.pending_q_meta)
+        Metrics.observe_since('commit_seconds', start)
+        self.pending_q_table = {}
+        self.pending_game_states = set()
+        self.pending_q_meta = {}
+        self.pending_episodes = 0
+        self.last_flush = time.monotonic()
+
+    def reset(self):
+        """
+        Drops the pending updates without writing them, the cache is then the same as the database again
+        """
+        for game_state in self.pending_game_states:
+            self.q_table.pop(game_state, None)
+        self.pending_q_table = {}
+        self.pending_game_states = set()
+        self.pending_q_meta = {}
+        self.pending_episodes = 0
+
+    @staticmethod
+    def upsert(con: sqlite3.Connection | ShardRouter, guaranteed_loss: int, pending_q_table: dict,
+               pending_q_meta: dict):
+        """
+        Adds pending updates to the database, the caller is responsible for committing them
+        """
+        rows = [(game_state, block_index, num_wins, num_games)
+                for (game_state, block_index), (num_wins, num_games) in pending_q_table.items()]
+        if isinstance(con, ShardRouter):
+            con.upsert(rows)
+        else:
+            con.executemany(ShardRouter.get_upsert_sql(guaranteed_loss), rows)
+        con.executemany(
+            'INSERT INTO q_meta (property, property_val) VALUES (?, ?)'
+            ' ON CONFLICT (property) DO UPDATE SET property_val = property_val + excluded.property_val',
+            pending_q_meta.items()
+        )
@@ -0,0 +1,224 @@
+import heapq
+import os
+import sqlite3
+
+
+class ShardRouter:
+    """
+    q_table partitioned across shard files by a deterministic key of the encoded game state, while q_meta and the
+    layout stay in the main database file. The shard key is either 'iced', the number of iced blocks, so that every
+    shard holds a phase of the game with the openings in shard 0, or 'bear', the bear block.
+
+    Lookups and updates are routed to the shard of each game state, and served the same way as QTable does, so that
+    Intellect takes a ShardRouter wherever it takes a connection. Statements on q_meta go to the main database file.
+    Every shard has its own WAL and write lock, so writers of different shards never wait for each other, and a shard
+    can be compacted on its own. Committing commits the shards one after another, then the main file, so a crash in
+    between may keep the rows of some shards without the q_meta counts of their episodes
+
+    A read-only router can copy its first memory_shards shards into memory, e.g. the opening shard which every game
+    looks up, they are then not refreshed by the training until the router is opened again
+
+    The schema of q_table and the statements writing it are defined here for Intellect and QTable as well, as the
+    shards have the same q_table as an unsharded database file
+    """
+
+    SHARD_KEYS = ('iced', 'bear')
+    # max number of states in a single `IN (...)` query, SQLite limits the number of variables of a statement
+    MAX_QUERY_STATES = 900
+    # q_table of a database file or shard, schema being 'main' or the name of an attached database. last_updated is the
+    # unix time in milliseconds of the last insert or update of the row, 0 for the rows written before it was stored
+    Q_TABLE_DDL = """
+        CREATE TABLE IF NOT EXISTS {schema}.q_table (
+            game_state BLOB NOT NULL,
+            block_index INTEGER NOT NULL,
+            num_wins INTEGER NOT NULL,
+            num_games INTEGER NOT NULL,
+            last_updated INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (game_state, block_index)
+        )
+    """
+    # inserts (game_state, block_index, num_wins, num_games) rows, updated now
+    INSERT_SQL = ('INSERT INTO q_table (game_state, block_index, num_wins, num_games, last_updated)'
+                  " VALUES (?, ?, ?, ?, CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))")
+    # inserts (game_state, block_index, num_wins, num_games, last_updated) rows copied from another q_table
+    COPY_SQL = 'INSERT INTO q_table (game_state, block_index, num_wins, num_games, last_updated) VALUES (?, ?, ?, ?, ?)'
+    # ends an insert into q_table, adding the wins and games of a row to those of the existing row, which a guaranteed
+    # loss never updates
+    ADD_ON_CONFLICT_SQL = (' ON CONFLICT (game_state, block_index) DO UPDATE SET'
+                           ' num_wins = num_wins + excluded.num_wins, num_games = num_games + excluded.num_games,'
+                           ' last_updated = max(last_updated, excluded.last_updated)'
+                           ' WHERE excluded.num_wins != {guaranteed_loss}')
+
+    def __init__(self, con: sqlite3.Connection, db_path: str, grid_size: int, shard_key: str, shard_count: int,
+                 guaranteed_loss: int, read_only: bool = False, check_same_thread: bool = True,
+                 memory_shards: int = 0):
+        assert shard_key in self.SHARD_KEYS
+        self.con = con
+        self.grid_size = grid_size
+        self.shard_key = shard_key
+        self.guaranteed_loss = guaranteed_loss
+        self.shards = []
+        for shard_index in range(shard_count):
+            path = self.get_shard_path(db_path, shard_index)
+            if not read_only:
+                self.shards.append(self.connect_shard(path))
+                continue
+            shard_con = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=check_same_thread)
+            if shard_index < memory_shards:
+                memory_con = sqlite3.connect(':memory:', check_same_thread=check_same_thread)
+                shard_con.backup(memory_con)
+                shard_con.close()
+                shard_con = memory_con
+            self.shards.append(shard_con)
+
+    @staticmethod
+    def connect_shard(path: str):
+        con = sqlite3.connect(path)
+        con.execute(ShardRouter.Q_TABLE_DDL.format(schema='main'))
+        con.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+        """)
+        return con
+
+    @classmethod
+    def get_upsert_sql(cls, guaranteed_loss: int):
+        """
+        Returns:
+            (str) statement upserting (game_state, block_index, num_wins, num_games) rows into q_table, where a
+            guaranteed loss never updates an existing row
+        """
+        return cls.INSERT_SQL + cls.ADD_ON_CONFLICT_SQL.format(guaranteed_loss=guaranteed_loss)
+
+    @staticmethod
+    def remove_shard(path: str):
+        """
+        Deletes the shard file at path along with its WAL, if any
+        """
+        for file_path in (path, f'{path}-wal', f'{path}-shm'):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    @staticmethod
+    def get_layout(con: sqlite3.Connection):
+        """
+        Returns:
+            (str, int)|None shard key and number of shards recorded in q_meta, None if q_table is not sharded
+        """
+        layout = dict(con.execute("SELECT property, property_val FROM q_meta"
+                                  " WHERE property IN ('shard_key', 'shard_count')").fetchall())
+        if layout.get('shard_count', 1) <= 1:
+            return None
+        return ShardRouter.SHARD_KEYS[layout['shard_key']], layout['shard_count']
+
+    @staticmethod
+    def get_shard_path(db_path: str, shard_index: int):
+        return f'{os.path.splitext(db_path)[0]}.shard{shard_index}.db'
+
+    @staticmethod
+    def get_shard_index(game_state: bytes, grid_size: int, shard_key: str, shard_count: int):
+        """
+        Shard of an encoded game state, see IceBreaker.encode_game_state
+        """
+        total_indices = grid_size ** 2
+        key = int.from_bytes(game_state, 'big')
+        if shard_key == 'bear':
+            return (key >> total_indices) % shard_count
+        # the blocks are all iced but the bear at the start, so the phases run from 0 to shard_count - 1
+        return (total_indices - 1 - (key & ((1 << total_indices) - 1)).bit_count()) * shard_count // total_indices
+
+    def get_shard(self, game_state: bytes):
+        return self.shards[self.get_shard_index(game_state, self.grid_size, self.shard_key, len(self.shards))]
+
+    def get_rows(self, game_state: bytes):
+        """
+        Same rows as `SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = ?`
+        """
+        return self.get_shard(game_state).execute(
+            'SELECT block_index, num_wins, num_games FROM q_table WHERE game_state = ?', (game_state,)).fetchall()
+
+    def get_rows_of_states(self, game_states: list):
+        """
+        Returns:
+            (dict) encoded game state -> same rows as get_rows, querying each shard once per MAX_QUERY_STATES states
+        """
+        rows = {game_state: [] for game_state in game_states}
+        for shard, shard_game_states in self._group_by_shard(rows, lambda game_state: game_state):
+            for i in range(0, len(shard_game_states), self.MAX_QUERY_STATES):
+                chunk = shard_game_states[i:i + self.MAX_QUERY_STATES]
+                for game_state, block_index, num_wins, num_games in shard.execute(
+                        'SELECT game_state, block_index, num_wins, num_games FROM q_table'
+                        f' WHERE game_state IN ({", ".join("?" * len(chunk))}) ORDER BY game_state, block_index',
+                        chunk):
+                    rows[game_state].append((block_index, num_wins, num_games))
+        return rows
+
+    def iter_rows(self, ordered: bool = False):
+        """
+        Yields the (game_state, block_index, num_wins, num_games, last_updated) rows of every shard, in the order of the
+        primary key of q_table if ordered
+        """
+        queries = [shard.execute('SELECT game_state, block_index, num_wins, num_games, last_updated FROM q_table'
+                                 + (' ORDER BY game_state, block_index' if ordered else '')) for shard in self.shards]
+        if ordered:
+            yield from heapq.merge(*queries)
+        else:
+            for query in queries:
+                yield from query
+
+    def insert_or_ignore(self, rows: list):
+        """
+        Same as `INSERT OR IGNORE INTO q_table`, the caller is responsible for committing
+        """
+        for shard, shard_rows in self._group_by_shard(rows, lambda row: row[0]):
+            shard.executemany(self.INSERT_SQL + ' ON CONFLICT DO NOTHING', shard_rows)
+
+    def upsert(self, rows: list):
+        """
+        Same as upserting rows into q_table, where a guaranteed loss never updates an existing row. The caller is
+        responsible for committing
+        """
+        for shard, shard_rows in self._group_by_shard(rows, lambda row: row[0]):
+            shard.executemany(self.get_upsert_sql(self.guaranteed_loss), shard_rows)
+
+    def _group_by_shard(self, items, get_game_state):
+        """
+        Returns:
+            (list) (shard connection, items of the shard) of the shards having any of items, in the order of items
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(self.get_shard_index(get_game_state(item), self.grid_size, self.shard_key,
+                                                   len(self.shards)), []).append(item)
+        return [(self.shards[shard_index], shard_items) for shard_index, shard_items in groups.items()]
+
+    def execute(self, *args):
+        return self.con.execute(*args)
+
+    def executemany(self, *args):
+        return self.con.executemany(*args)
+
+    def commit(self):
+        for shard in self.shards:
+            shard.commit()
+        self.con.commit()
+
+    def rollback(self):
+        for shard in self.shards:
+            shard.rollback()
+        self.con.rollback()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
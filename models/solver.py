@@ -0,0 +1,316 @@
+import time
+
+from models.bit_ice_breaker import BitIceBreaker
+
+
+class _SearchStopped(Exception):
+    pass
+
+
+class Solver:
+    """
+    Solves game states exactly with a negamax alpha-beta search backed by a transposition table.
+    Scores are from the perspective of the player to move: positive means a guaranteed win and negative a guaranteed
+    loss. Wins closer to the current position score higher, and losses further away score higher. The transposition
+    table stores exact scores as well as lower and upper bounds found by searches with a narrower window
+
+    get_best_move_within searches with iterative deepening until a time or node budget runs out. Positions at the depth
+    limit are scored by _static_evaluation, whose scores are much smaller than the scores of guaranteed wins and losses
+    """
+
+    WIN = 1000
+    # scores of _static_evaluation are within (-MAX_HEURISTIC, MAX_HEURISTIC)
+    MAX_HEURISTIC = 100
+    # the stop callback of get_best_move is called every this many nodes
+    STOP_CHECK_NODES = 1024
+
+    EXACT = 0
+    LOWER_BOUND = 1
+    UPPER_BOUND = 2
+
+    REPLACEMENT_POLICIES = ('depth', 'always')
+
+    def __init__(self, table_size: int = 1000003, replacement: str = 'depth'):
+        """
+        table_size is the number of entries in the transposition table, preferably a prime number as the slot of a
+        position is its key modulo table_size. With `depth` replacement an entry is only replaced by a position which
+        has at least as many iced blocks (so a bigger subtree), with `always` the newest position always wins
+        """
+        assert table_size > 0
+        assert replacement in self.REPLACEMENT_POLICIES
+        self.table_size = table_size
+        self.replacement = replacement
+        self.table = [None] * table_size
+        self.nodes = 0
+        self._root_move = None
+        # best move per position found by the previous iteration of get_best_move_within
+        self._iteration_moves = {}
+        self._deadline = None
+        self._max_nodes = None
+        self._evaluated_leaf = False
+        self._stop = None
+
+    def clear(self):
+        self.table = [None] * self.table_size
+        self.nodes = 0
+
+    @classmethod
+    def is_win(cls, score: int):
+        return score > 0
+
+    @classmethod
+    def is_proven(cls, score: int):
+        """
+        Whether score is a guaranteed win or loss rather than a score of _static_evaluation
+        """
+        return abs(score) >= cls.MAX_HEURISTIC
+
+    def get_best_move(self, game_state: str, exact: bool = False, stop=None):
+        """
+        Searches the game tree of game_state once. By default the search only proves whether the position is won or
+        lost, which is much cheaper, and the returned move is a winning move if there is one. With exact, the returned
+        move wins the fastest or loses the slowest and the score is exact. If stop is given, it is called every
+        STOP_CHECK_NODES nodes and the search is abandoned once it returns True
+        Returns:
+            (int|None, int)|None best move (None if there is no iced block) and its score, None if stopped
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        iced_mask, bear_index = BitIceBreaker.get_position(game_state)
+        self._root_move = None
+        if exact:
+            alpha, beta = -self.WIN - 1, self.WIN + 1
+        else:
+            # scores are never 0, so a null window around 0 is enough to know who wins
+            alpha, beta = -1, 1
+        self._stop = stop
+        try:
+            score = self._negamax(iced_mask, bear_index, grid_size, 0, alpha, beta)
+        except _SearchStopped:
+            return None
+        finally:
+            self._stop = None
+        return self._root_move, score
+
+    def get_best_move_within(self, game_state: str, budget_ms: float = None, max_nodes: int = None):
+        """
+        Searches game_state with iterative deepening until budget_ms milliseconds or max_nodes nodes are spent, or the
+        result is proven. Each iteration searches the best moves of the previous iteration first. The first iteration
+        always completes, so there is a move even with a tiny budget
+        Returns:
+            (int|None, int, int, bool) best move of the last completed iteration (None if there is no iced block), its
+            score, the depth of that iteration and whether the score is a guaranteed win or loss
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        iced_mask, bear_index = BitIceBreaker.get_position(game_state)
+        if not iced_mask:
+            return None, -self.WIN, 0, True
+
+        self._iteration_moves = {}
+        deadline = None if budget_ms is None else time.monotonic() + (budget_ms / 1000)
+        max_nodes = None if max_nodes is None else self.nodes + max_nodes
+        best_move, best_score, best_depth, proven = None, 0, 0, False
+        for depth in range(1, iced_mask.bit_count() + 1):
+            if depth > 1:
+                self._deadline, self._max_nodes = deadline, max_nodes
+            self._root_move = None
+            self._evaluated_leaf = False
+            try:
+                score = self._search(iced_mask, bear_index, grid_size, 0, depth, -self.WIN - 1, self.WIN + 1)
+            except _SearchStopped:
+                break
+            best_move, best_score, best_depth = self._root_move, score, depth
+            # without any position scored by _static_evaluation, the whole game tree has been searched
+            proven = self.is_proven(score) or not self._evaluated_leaf
+            if proven:
+                break
+        self._deadline = self._max_nodes = None
+        self._iteration_moves = {}
+        return best_move, best_score, best_depth, proven
+
+    def get_move_results(self, game_state: str):
+        """
+        Returns:
+            (dict) for each possible move, True if the move is a guaranteed win otherwise False
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        iced_mask, bear_index = BitIceBreaker.get_position(game_state)
+        move_results = {}
+        for move in BitIceBreaker.get_block_indices(iced_mask):
+            child_iced_mask = BitIceBreaker.register_uniced_mask(iced_mask, bear_index, move, grid_size)
+            if child_iced_mask == -1:
+                move_results[move] = False
+            else:
+                # scores are never 0, so a null window around 0 is enough to know who wins
+                move_results[move] = self._negamax(child_iced_mask, bear_index, grid_size, 1, -1, 1) < 0
+        return move_results
+
+    def _negamax(self, iced_mask: int, bear_index: int, grid_size: int, ply: int, alpha: int, beta: int):
+        self.nodes += 1
+        if self._stop is not None and self.nodes % self.STOP_CHECK_NODES == 0 and self._stop():
+            raise _SearchStopped()
+        total_indices = grid_size ** 2
+        key = iced_mask | (bear_index << total_indices) | (grid_size << (total_indices + 7))
+        original_alpha = alpha
+
+        tt_move = None
+        entry = self._probe(key)
+        if entry is not None:
+            _, value, flag, tt_move, _ = entry
+            value = self._score_from_table(value, ply)
+            if flag == self.EXACT:
+                if ply == 0:
+                    self._root_move = tt_move
+                return value
+            if flag == self.LOWER_BOUND:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                if ply == 0:
+                    self._root_move = tt_move
+                return value
+
+        # picking a block which collapses the bear loses right now, which is the worst possible score
+        best_score = -(self.WIN - ply)
+        best_move = None
+        losing_moves, footprints = BitIceBreaker.analyze_mask(iced_mask, bear_index, grid_size)
+        if losing_moves:
+            best_move = losing_moves[0]
+        children = []
+        for move, footprint in footprints.items():
+            child_iced_mask = iced_mask ^ footprint
+            children.append((self._move_order(move, child_iced_mask, bear_index, grid_size, tt_move), move,
+                             child_iced_mask))
+        children.sort()
+
+        for _, move, child_iced_mask in children:
+            score = -self._negamax(child_iced_mask, bear_index, grid_size, ply + 1, -beta, -alpha)
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = self.UPPER_BOUND
+        elif best_score >= beta:
+            flag = self.LOWER_BOUND
+        else:
+            flag = self.EXACT
+        self._store(key, self._score_to_table(best_score, ply), flag, best_move, iced_mask.bit_count())
+        if ply == 0:
+            self._root_move = best_move
+        return best_score
+
+    def _search(self, iced_mask: int, bear_index: int, grid_size: int, ply: int, depth: int, alpha: int, beta: int):
+        """
+        Same as _negamax but stops at depth and scores those positions with _static_evaluation. Only the guaranteed
+        results of the transposition table are used, and nothing is stored in it
+        """
+        self.nodes += 1
+        if (self._deadline is not None and time.monotonic() >= self._deadline) or \
+                (self._max_nodes is not None and self.nodes >= self._max_nodes):
+            raise _SearchStopped()
+        total_indices = grid_size ** 2
+        key = iced_mask | (bear_index << total_indices) | (grid_size << (total_indices + 7))
+
+        tt_move = self._iteration_moves.get(key)
+        entry = self._probe(key)
+        if entry is not None:
+            _, value, flag, tt_move, _ = entry
+            value = self._score_from_table(value, ply)
+            if flag == self.EXACT:
+                if ply == 0:
+                    self._root_move = tt_move
+                return value
+            if flag == self.LOWER_BOUND:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                if ply == 0:
+                    self._root_move = tt_move
+                return value
+
+        if depth == 0:
+            score = self._static_evaluation(iced_mask, bear_index, grid_size, ply)
+            if not self.is_proven(score):
+                self._evaluated_leaf = True
+            return score
+
+        best_score = -(self.WIN - ply)
+        best_move = None
+        losing_moves, footprints = BitIceBreaker.analyze_mask(iced_mask, bear_index, grid_size)
+        if losing_moves:
+            best_move = losing_moves[0]
+        children = []
+        for move, footprint in footprints.items():
+            child_iced_mask = iced_mask ^ footprint
+            children.append((self._move_order(move, child_iced_mask, bear_index, grid_size, tt_move), move,
+                             child_iced_mask))
+        children.sort()
+
+        for _, move, child_iced_mask in children:
+            score = -self._search(child_iced_mask, bear_index, grid_size, ply + 1, depth - 1, -beta, -alpha)
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        self._iteration_moves[key] = best_move
+        if ply == 0:
+            self._root_move = best_move
+        return best_score
+
+    @classmethod
+    def _static_evaluation(cls, iced_mask: int, bear_index: int, grid_size: int, ply: int):
+        """
+        Scores a position without searching it. If every move collapses the bear the position is lost. Otherwise the
+        score is based on the parity of the safe moves: if the players only picked blocks which collapse nothing else,
+        the player to move would pick the last one when their number is odd
+        """
+        safe_moves = len(BitIceBreaker.analyze_mask(iced_mask, bear_index, grid_size)[1])
+        if not safe_moves:
+            return -(cls.WIN - ply)
+        return 50 if safe_moves % 2 else -50
+
+    def _move_order(self, move: int, child_iced_mask: int, bear_index: int, grid_size: int, tt_move: int):
+        """
+        Best move from the transposition table first, then the moves already known to leave the opponent in a lost
+        position, and then the moves which leave the fewest iced blocks
+        """
+        if move == tt_move:
+            return 0, 0
+        total_indices = grid_size ** 2
+        entry = self._probe(child_iced_mask | (bear_index << total_indices) | (grid_size << (total_indices + 7)))
+        if entry is not None and entry[2] != self.LOWER_BOUND and entry[1] < 0:
+            return 1, 0
+        return 2, child_iced_mask.bit_count()
+
+    def _probe(self, key: int):
+        entry = self.table[key % self.table_size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def _store(self, key: int, value: int, flag: int, best_move: int, depth: int):
+        slot = key % self.table_size
+        entry = self.table[slot]
+        if self.replacement == 'always' or entry is None or entry[0] == key or entry[4] <= depth:
+            self.table[slot] = (key, value, flag, best_move, depth)
+
+    @staticmethod
+    def _score_to_table(score: int, ply: int):
+        """
+        Stores the score relative to the position instead of the root, so it can be reused from any ply
+        """
+        return score + ply if score > 0 else score - ply
+
+    @staticmethod
+    def _score_from_table(score: int, ply: int):
+        return score - ply if score > 0 else score + ply
@@ -0,0 +1,72 @@
+class Symmetry:
+    """
+    The 8 symmetries of the square grid (rotations and reflections, the dihedral group D4). Every game state is
+    represented by its canonical game state: the lexicographically smallest of its 8 transformations
+    """
+
+    # grid_size -> for each transform, (permutation, inverse permutation) where
+    # transformed_game_state[i] = game_state[permutation[i]] and game_state[i] = transformed_game_state[inverse[i]]
+    _permutations = {}
+
+    @classmethod
+    def get_permutations(cls, grid_size: int):
+        if grid_size in cls._permutations:
+            return cls._permutations[grid_size]
+
+        last = grid_size - 1
+        source_cells = [
+            lambda row, col: (row, col),
+            lambda row, col: (last - col, row),  # rotate clockwise
+            lambda row, col: (last - row, last - col),  # rotate 180
+            lambda row, col: (col, last - row),  # rotate anticlockwise
+            lambda row, col: (col, row),  # reflect on main diagonal
+            lambda row, col: (last - col, last - row),  # reflect on anti diagonal
+            lambda row, col: (row, last - col),  # reflect left-right
+            lambda row, col: (last - row, col),  # reflect top-bottom
+        ]
+        permutations = []
+        for source_cell in source_cells:
+            permutation = []
+            for block_index in range(grid_size ** 2):
+                source_row, source_col = source_cell(int(block_index / grid_size), block_index % grid_size)
+                permutation.append((source_row * grid_size) + source_col)
+            inverse = [0] * len(permutation)
+            for block_index, source_index in enumerate(permutation):
+                inverse[source_index] = block_index
+            permutations.append((tuple(permutation), tuple(inverse)))
+
+        cls._permutations[grid_size] = permutations
+        return permutations
+
+    @classmethod
+    def canonicalize_game_state(cls, game_state: str):
+        """
+        Returns:
+            (str, int) canonical game state, and the transform which maps game_state to it
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        canonical_game_state = game_state
+        canonical_transform = 0
+        for transform, (permutation, _) in enumerate(cls.get_permutations(grid_size)):
+            transformed_game_state = ''.join(map(game_state.__getitem__, permutation))
+            if transformed_game_state < canonical_game_state:
+                canonical_game_state = transformed_game_state
+                canonical_transform = transform
+        return canonical_game_state, canonical_transform
+
+    @classmethod
+    def canonicalize_move(cls, game_state: str, block_index: int):
+        """
+        Returns:
+            (str, int) canonical game state, and block_index of game_state mapped onto it
+        """
+        canonical_game_state, transform = cls.canonicalize_game_state(game_state)
+        return canonical_game_state, cls.to_canonical_move(block_index, int(len(game_state) ** 0.5), transform)
+
+    @classmethod
+    def to_canonical_move(cls, block_index: int, grid_size: int, transform: int):
+        return cls.get_permutations(grid_size)[transform][1][block_index]
+
+    @classmethod
+    def from_canonical_move(cls, block_index: int, grid_size: int, transform: int):
+        return cls.get_permutations(grid_size)[transform][0][block_index]
@@ -0,0 +1,142 @@
+import bisect
+import mmap
+import os
+import struct
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.solver import Solver
+from models.symmetry import Symmetry
+
+
+class Tablebase:
+    """
+    Solved positions stored in a memory-mapped file, keyed by canonical game state.
+    File format: header (magic, grid_size, key size, number of records) followed by records sorted by key. A record is
+    the key, i.e. the canonical game state encoded by IceBreaker.encode_game_state, and one byte whose highest bit is
+    set if the position is won and the other bits are the best move (NO_MOVE if none)
+    """
+
+    MAGIC = b'ICETB1'
+    HEADER = struct.Struct('>6sBBI')
+    NO_MOVE = 0x7f
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.grid_size, self.key_size, self.num_records = self.HEADER.unpack_from(self.data)
+        assert magic == self.MAGIC, f'{path} is not a tablebase'
+        self.record_size = self.key_size + 1
+        self._keys = _RecordKeys(self)
+
+    @classmethod
+    def get_path(cls, grid_size: int):
+        return f'icebreaker{grid_size}_tablebase.bin'
+
+    def close(self):
+        self.data.close()
+
+    def lookup(self, game_state: str):
+        """
+        Returns:
+            (bool, int|None)|None whether game_state is won and its best move, or None if it is not in the tablebase
+        """
+        canonical_game_state, transform = Symmetry.canonicalize_game_state(game_state)
+        key = BitIceBreaker.encode_game_state(canonical_game_state)
+        record_index = bisect.bisect_left(self._keys, key)
+        if record_index == self.num_records or self._keys[record_index] != key:
+            return None
+        value = self.data[self.HEADER.size + (record_index * self.record_size) + self.key_size]
+        move = value & self.NO_MOVE
+        if move == self.NO_MOVE:
+            return bool(value >> 7), None
+        return bool(value >> 7), Symmetry.from_canonical_move(move, self.grid_size, transform)
+
+    @classmethod
+    def generate(cls, grid_size: int, max_iced_blocks: int, path: str = None, solver: Solver = None):
+        """
+        Solves every position with at most max_iced_blocks iced blocks and writes them to path
+        Returns:
+            (int) number of positions
+        """
+        solver = solver or Solver(table_size=4000037)
+        canonical_game_states = sorted(cls._enumerate_canonical_game_states(grid_size, max_iced_blocks),
+                                       key=lambda game_state: game_state.count(str(BitIceBreaker.BlockState.ICED.value)))
+        records = []
+        # positions with fewer iced blocks are solved first, so the bigger ones find them in the transposition table
+        for canonical_game_state in canonical_game_states:
+            move, score = solver.get_best_move(canonical_game_state, exact=True)
+            value = (int(Solver.is_win(score)) << 7) | (cls.NO_MOVE if move is None else move)
+            records.append((BitIceBreaker.encode_game_state(canonical_game_state), value))
+        records.sort()
+
+        key_size = len(records[0][0])
+        path = path or cls.get_path(grid_size)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, grid_size, key_size, len(records)))
+            for key, value in records:
+                f.write(key)
+                f.write(bytes([value]))
+        os.replace(f'{path}.tmp', path)
+        return len(records)
+
+    @classmethod
+    def _enumerate_canonical_game_states(cls, grid_size: int, max_iced_blocks: int):
+        """
+        Enumerates the states which can occur in a game, i.e. in every 2x2 square of the grid the blocks which are not
+        uniced are none, 2 adjacent, 3 or all of them. Otherwise 2 diagonal uniced blocks would have collapsed the
+        others. The bear is only placed on the blocks which no symmetry can move elsewhere
+        """
+        total_indices = grid_size ** 2
+        not_uniced = [0] * total_indices
+        canonical_game_states = set()
+
+        def is_valid_square(row: int, col: int):
+            top_left, top_right = not_uniced[(row - 1) * grid_size + col - 1], not_uniced[(row - 1) * grid_size + col]
+            bottom_left, bottom_right = not_uniced[row * grid_size + col - 1], not_uniced[row * grid_size + col]
+            count = top_left + top_right + bottom_left + bottom_right
+            return count != 1 and not (count == 2 and ((top_left and bottom_right) or (top_right and bottom_left)))
+
+        def assign(block_index: int, iced_blocks: int, bear_index: int):
+            if block_index == total_indices:
+                game_state = ''.join(str(BitIceBreaker.BlockState.ICED.value) if block_state else
+                                     str(BitIceBreaker.BlockState.UNICED.value) for block_state in not_uniced)
+                game_state = f'{game_state[:bear_index]}{BitIceBreaker.BlockState.BEAR.value}' \
+                             f'{game_state[bear_index + 1:]}'
+                canonical_game_states.add(Symmetry.canonicalize_game_state(game_state)[0])
+                return
+            row = int(block_index / grid_size)
+            col = block_index % grid_size
+            if block_index == bear_index:
+                block_states = (1,)
+            elif iced_blocks < max_iced_blocks:
+                block_states = (0, 1)
+            else:
+                block_states = (0,)
+            for block_state in block_states:
+                not_uniced[block_index] = block_state
+                if row > 0 and col > 0 and not is_valid_square(row, col):
+                    continue
+                assign(block_index + 1, iced_blocks + (block_state and block_index != bear_index), bear_index)
+            not_uniced[block_index] = 0
+
+        max_col = int((grid_size - 1) / 2)
+        for bear_row in range(max_col + 1):
+            for bear_col in range(bear_row, max_col + 1):
+                assign(0, 0, (bear_row * grid_size) + bear_col)
+        return canonical_game_states
+
+
+class _RecordKeys:
+    """
+    Sequence view of the keys of the records, so that bisect can binary search the memory-mapped file
+    """
+
+    def __init__(self, tablebase: Tablebase):
+        self.tablebase = tablebase
+
+    def __len__(self):
+        return self.tablebase.num_records
+
+    def __getitem__(self, record_index: int):
+        offset = self.tablebase.HEADER.size + (record_index * self.tablebase.record_size)
+        return self.tablebase.data[offset:offset + self.tablebase.key_size]
@@ -0,0 +1,121 @@
+import glob
+import os
+import struct
+
+
+class TrajectoryLog:
+    """
+    Append-only binary log of finished training episodes, which Intellect.aggregate_trajectory_logs folds into the
+    q_table later, so that the training does not wait on the database.
+
+    The log is a sequence of files of at most max_bytes bytes, `icebreaker{N}_trajectories_{index}.bin` in directory.
+    A new file is started by every TrajectoryLog, so that a file is only ever written by one log, and a log which finds
+    its next file already created, e.g. by another process logging to the same directory, skips to the next index.
+    File format: header
+    (magic, grid_size) followed by one record per episode: initial bear block, experimentation, flags (bits 0-1 the id
+    of the winner, bits 2-3 the id of the player learning against minimax, 0 for self-play where both players learn,
+    bit 4 set if the plies explored follow the moves), number of moves and the moves, one byte each, then if flagged a
+    bitmask of the plies whose move was picked by exploring, one bit per ply. A record cut short by a crash is ignored
+    when reading
+    """
+
+    MAGIC = b'ICETL1'
+    HEADER = struct.Struct('>6sB')
+    RECORD = struct.Struct('>BBBB')
+    EXPLORED_PLIES_FLAG = 16
+
+    def __init__(self, directory: str, grid_size: int, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.grid_size = grid_size
+        self.max_bytes = max_bytes
+        paths = self.get_paths(directory, grid_size)
+        self.file_index = int(paths[-1].rsplit('_', 1)[1].split('.')[0]) + 1 if paths else 0
+        self.file = None
+        self.episodes = 0
+
+    @classmethod
+    def get_paths(cls, directory: str, grid_size: int):
+        """
+        Returns:
+            (list) files of the log in the order they were written
+        """
+        return sorted(glob.glob(os.path.join(directory, f'icebreaker{grid_size}_trajectories_*.bin')))
+
+    def append(self, bear_index: int, moves: list, winner_id: int, experimentation: int, optimal_player_id: int = 0,
+               explored_plies: list = ()):
+        """
+        explored_plies are the indices in moves of the moves picked by exploring, see Intellect.EXPLORATION_BRANCHES
+        """
+        if self.file is None or self.file.tell() >= self.max_bytes:
+            self._rotate()
+        flags = winner_id | (optimal_player_id << 2)
+        if explored_plies:
+            flags |= self.EXPLORED_PLIES_FLAG
+        self.file.write(self.RECORD.pack(bear_index, experimentation, flags, len(moves)))
+        self.file.write(bytes(moves))
+        if explored_plies:
+            self.file.write(sum(1 << ply for ply in explored_plies).to_bytes(self._get_bitmask_size(moves), 'little'))
+        self.episodes += 1
+
+    @staticmethod
+    def _get_bitmask_size(moves: list):
+        return (len(moves) + 7) // 8
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        os.makedirs(self.directory, exist_ok=True)
+        while self.file is None:
+            path = os.path.join(self.directory, f'icebreaker{self.grid_size}_trajectories_{self.file_index:06d}.bin')
+            self.file_index += 1
+            try:
+                # exclusive, so that two logs never write to the same file
+                self.file = open(path, 'xb')
+            except FileExistsError:
+                pass
+        self.file.write(self.HEADER.pack(self.MAGIC, self.grid_size))
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @classmethod
+    def read(cls, path: str):
+        """
+        Yields:
+            (int, list, int, int, int, list) initial bear block, moves, id of the winner, experimentation, id of the
+            player learning against minimax (0 for self-play) and the plies explored of each episode of the file
+        """
+        with open(path, 'rb') as f:
+            magic, _ = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            assert magic == cls.MAGIC, f'{path} is not a trajectory log'
+            while True:
+                record = f.read(cls.RECORD.size)
+                if len(record) < cls.RECORD.size:
+                    return
+                bear_index, experimentation, flags, num_moves = cls.RECORD.unpack(record)
+                moves = f.read(num_moves)
+                if len(moves) < num_moves:
+                    return
+                explored_plies = []
+                if flags & cls.EXPLORED_PLIES_FLAG:
+                    bitmask_size = cls._get_bitmask_size(moves)
+                    bitmask = f.read(bitmask_size)
+                    if len(bitmask) < bitmask_size:
+                        return
+                    bitmask = int.from_bytes(bitmask, 'little')
+                    explored_plies = [ply for ply in range(num_moves) if bitmask >> ply & 1]
+                yield bear_index, list(moves), flags & 3, experimentation, (flags >> 2) & 3, explored_plies
+
+    @classmethod
+    def get_grid_size(cls, path: str):
+        with open(path, 'rb') as f:
+            magic, grid_size = cls.HEADER.unpack(f.read(cls.HEADER.size))
+        assert magic == cls.MAGIC, f'{path} is not a trajectory log'
+        return grid_size
@@ -0,0 +1,25 @@
+import argparse
+import time
+
+from models.intellect import Intellect
+from models.trajectory_log import TrajectoryLog
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Folds trajectory logs written by `scripts.train --log-dir` into the'
+                                                 ' q_table.')
+    parser.add_argument('grid_size', type=int, choices=[4, 5, 6, 7, 8, 9], help='Size of grid (min: 4, max: 9)')
+    parser.add_argument('paths', nargs='*',
+                        help='Log files, in the order they were written. Default: every log file of the grid size in'
+                             ' --log-dir')
+    parser.add_argument('--log-dir', default='.', help='Default: current directory')
+    parser.add_argument('--chunk-episodes', type=int, default=100000,
+                        help='Episodes merged in memory before being written in one transaction. Default: 100000')
+    args = parser.parse_args()
+
+    paths = args.paths or TrajectoryLog.get_paths(args.log_dir, args.grid_size)
+    start = time.perf_counter()
+    episodes, rows = Intellect.aggregate_trajectory_logs(args.grid_size, paths, args.chunk_episodes)
+    elapsed = time.perf_counter() - start
+    print(f'{len(paths)} files: folded {episodes} episodes into {rows} q_table rows in {elapsed:.2f}s'
+          f' ({episodes / max(elapsed, 1e-9):.0f} episodes/s)')
@@ -0,0 +1,45 @@
+import argparse
+import json
+import random
+import time
+
+from urllib.request import Request, urlopen
+
+from scripts.load_test_api import get_game_states
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the batch endpoint of the optimal move API with sequential'
+                                                 ' requests. Run the API with --cache-size 0 to compare the lookups.')
+    parser.add_argument('--url', default='http://127.0.0.1:5003', help='Default: http://127.0.0.1:5003')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[5], help='Default: 5')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='Default: 1 10 100 1000')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for batch_size in args.batch_sizes:
+        game_states = [game_state for grid_size in args.grid_sizes
+                       for game_state in get_game_states(grid_size, batch_size)]
+        random.shuffle(game_states)
+        game_states = game_states[:batch_size]
+
+        start = time.perf_counter()
+        sequential_moves = []
+        for game_state in game_states:
+            with urlopen(f'{args.url}/?array={game_state}') as response:
+                sequential_moves.append(response.read())
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        request = Request(args.url, data=bytes(json.dumps(game_states), 'UTF-8'),
+                          headers={'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            batch_moves = json.loads(response.read())
+        batch_time = time.perf_counter() - start
+
+        assert len(batch_moves) == len(game_states)
+        print(f'batch size {batch_size}: sequential {sequential_time * 1000:.1f}ms'
+              f' ({len(game_states) / sequential_time:.0f} states/s), batch {batch_time * 1000:.1f}ms'
+              f' ({len(game_states) / batch_time:.0f} states/s), {sequential_time / batch_time:.1f}x')
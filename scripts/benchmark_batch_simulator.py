@@ -0,0 +1,106 @@
+import argparse
+import os
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('The batch simulator needs numpy, install it with `pip install -r requirements-batch.txt`') from e
+
+from models.batch_ice_breaker import BatchIceBreaker, QTablePlayer, RandomPlayer
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+
+
+def verify(grid_size: int, num_games: int, rng: np.random.Generator):
+    """
+    Replays the random moves of a batch in IceBreaker games, and checks that after every move the same games have
+    ended with the same winner, and the lakes of the others are the same
+    """
+    batch = BatchIceBreaker(grid_size, num_games, rng)
+    games = []
+    for game_state in batch.get_game_states():
+        game_obj = IceBreaker(grid_size)
+        game_obj.lake_array = list(map(int, game_state))
+        games.append(game_obj)
+
+    player = RandomPlayer(rng)
+    while not batch.game_ended.all():
+        moves = player.get_moves(batch)
+        # sometimes pick a block which is not iced, which should end the game as well
+        moves = np.where(rng.random(num_games) < 0.02, rng.integers(0, grid_size ** 2, num_games), moves)
+        for game_index in batch.get_active_game_indices():
+            games[game_index].pick_block(games[game_index].get_game_state(), int(moves[game_index]))
+        batch.pick_blocks(moves)
+        for game_index, (game_obj, game_state) in enumerate(zip(games, batch.get_game_states())):
+            assert game_obj.game_ended == batch.game_ended[game_index], game_index
+            if game_obj.game_ended:
+                assert game_obj.winner.id == batch.winners[game_index], game_index
+            else:
+                assert game_obj.get_game_state() == game_state, game_index
+
+
+def play_random_games(engine, grid_size: int, num_games: int):
+    for _ in range(num_games):
+        game_obj = engine(grid_size)
+        game_state = game_obj.get_game_state()
+        while not game_obj.game_ended:
+            possible_moves = engine.get_possible_moves(engine.get_position(game_state))
+            game_obj.pick_block(game_state, random.choice(possible_moves) if possible_moves else 0)
+            game_state = game_obj.get_game_state()
+
+
+def play_q_table_games(con, grid_size: int, num_games: int):
+    for _ in range(num_games):
+        game_obj = IceBreaker(grid_size)
+        game_state = game_obj.get_game_state()
+        while not game_obj.game_ended:
+            game_obj.pick_block(game_state, Intellect.get_optimal_move(con, game_state, 0, learn=False)[1])
+            game_state = game_obj.get_game_state()
+
+
+def measure(name: str, num_games: int, play):
+    start = time.perf_counter()
+    play()
+    elapsed = time.perf_counter() - start
+    print(f'  {name}: {elapsed:.2f}s, {num_games / elapsed:.0f} games/s')
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verifies the batch simulator against IceBreaker, and compares the'
+                                                 ' games per second of both. Needs numpy.')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[4, 5, 6, 7, 8, 9],
+                        help='Default: 4 5 6 7 8 9')
+    parser.add_argument('--games', type=int, default=10000, help='Games played per grid size. Default: 10000')
+    parser.add_argument('--verify-games', type=int, default=1000,
+                        help='Games replayed in IceBreaker per grid size. Default: 1000')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    for grid_size in args.grid_sizes:
+        verify(grid_size, args.verify_games, rng)
+        print(f'grid size {grid_size}: {args.verify_games} games identical to IceBreaker')
+
+        list_time = measure('random, IceBreaker loop', args.games,
+                            lambda: play_random_games(IceBreaker, grid_size, args.games))
+        bit_time = measure('random, BitIceBreaker loop', args.games,
+                           lambda: play_random_games(BitIceBreaker, grid_size, args.games))
+        batch_time = measure('random, batch', args.games,
+                             lambda: BatchIceBreaker(grid_size, args.games, rng).play(RandomPlayer(rng),
+                                                                                       RandomPlayer(rng)))
+        print(f'  batch is {list_time / batch_time:.1f}x IceBreaker, {bit_time / batch_time:.1f}x BitIceBreaker')
+
+        if os.path.exists(Intellect.get_db_path(grid_size)):
+            con = Intellect.get_read_only_db_conn(grid_size)
+            loop_time = measure('q_table, IceBreaker loop', args.games,
+                                lambda: play_q_table_games(con, grid_size, args.games))
+            batch_time = measure('q_table, batch', args.games,
+                                 lambda: BatchIceBreaker(grid_size, args.games, rng).play(QTablePlayer(con),
+                                                                                          QTablePlayer(con)))
+            print(f'  batch is {loop_time / batch_time:.1f}x IceBreaker')
+            con.close()
@@ -0,0 +1,101 @@
+import argparse
+import random
+import time
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+from models.solver import Solver
+
+
+def get_positions(grid_size: int, num_positions: int, max_iced_blocks: int):
+    """
+    Plays random moves which do not end the game until at most max_iced_blocks are left
+    """
+    positions = []
+    while len(positions) < num_positions:
+        game_obj = BitIceBreaker(grid_size)
+        position = (game_obj.iced_mask, game_obj.bear_index)
+        while position is not None and position[0].bit_count() > max_iced_blocks:
+            moves = BitIceBreaker.get_possible_moves(position)
+            random.shuffle(moves)
+            position = next((p for p in (BitIceBreaker.apply_move(position, m, grid_size) for m in moves) if p), None)
+        if position is not None:
+            positions.append(BitIceBreaker.get_game_state_from_position(position, grid_size))
+    return positions
+
+
+def get_legacy_minimax_move(game_state: str):
+    """
+    Previous minimax search without transposition table, kept to compare against the Solver. Its root window starts
+    with alpha > beta, so every position stops after its first move
+    """
+    grid_size = int(len(game_state) ** 0.5)
+    position = IceBreaker.get_position(game_state)
+
+    best_score = -10000000
+    best_move = None
+    for possible_move in IceBreaker.get_possible_moves(position):
+        score = alpha_beta_minimax(position, possible_move, grid_size, 10000000, 10000000, -10000000, True)
+        if score > best_score:
+            best_score = score
+            best_move = possible_move
+    return best_move
+
+
+def alpha_beta_minimax(position: list, picked_move: int, grid_size: int, depth: int, alpha: int, beta: int,
+                       maximizing_player: bool):
+    position = IceBreaker.apply_move(position, picked_move, grid_size) if depth else None
+    if position is None:
+        # the game is over
+        return -40 if maximizing_player else 40
+    if maximizing_player:
+        best_score = -10000000
+    else:
+        best_score = 10000000
+    for possible_move in IceBreaker.get_possible_moves(position):
+        score = alpha_beta_minimax(position, possible_move, grid_size, depth - 1, alpha, beta, not maximizing_player)
+        if maximizing_player:
+            best_score = max(best_score, score)
+            alpha = max(alpha, score)
+        else:
+            best_score = min(best_score, score)
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best_score
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the transposition table Solver with the previous minimax.')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[4, 5, 6, 7], help='Default: 4 5 6 7')
+    parser.add_argument('--positions', type=int, default=5, help='Positions per grid size. Default: 5')
+    parser.add_argument('--max-iced', type=int, default=22,
+                        help='Positions are played out until at most this many iced blocks are left. Default: 22')
+    parser.add_argument('--budget-ms', type=float, nargs='*', default=[],
+                        help='Also search with iterative deepening within these budgets, e.g. 50 200')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for grid_size in args.grid_sizes:
+        for game_state in get_positions(grid_size, args.positions, args.max_iced):
+            start = time.perf_counter()
+            legacy_move = get_legacy_minimax_move(game_state)
+            legacy_time = time.perf_counter() - start
+
+            solver = Solver()
+            start = time.perf_counter()
+            move, score = solver.get_best_move(game_state)
+            solver_time = time.perf_counter() - start
+            solver_nodes = solver.nodes
+            move_results = solver.get_move_results(game_state)
+
+            print(f'{grid_size}x{grid_size} {game_state}: win={Solver.is_win(score)}'
+                  f' | minimax {legacy_time * 1000:.1f}ms move={legacy_move} wins={move_results.get(legacy_move)}'
+                  f' | solver {solver_time * 1000:.1f}ms move={move} wins={move_results.get(move)}'
+                  f' nodes={solver_nodes}')
+            for budget_ms in args.budget_ms:
+                start = time.perf_counter()
+                budget_move, _, depth, proven = Solver().get_best_move_within(game_state, budget_ms)
+                print(f'    budget {budget_ms:g}ms: {(time.perf_counter() - start) * 1000:.1f}ms move={budget_move}'
+                      f' wins={move_results.get(budget_move)} depth={depth} proven={proven}')
@@ -0,0 +1,45 @@
+import argparse
+import random
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from models.parallel_solver import ParallelSolver
+from models.solver import Solver
+from scripts.benchmark_minimax import get_positions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the minimax solver with its search split across processes.')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[6, 7], help='Default: 6 7')
+    parser.add_argument('--positions', type=int, default=3, help='Positions per grid size. Default: 3')
+    parser.add_argument('--max-iced', type=int, default=26,
+                        help='Positions are played out until at most this many iced blocks are left. Default: 26')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Default: 1 2 4 8')
+    parser.add_argument('--split-depth', type=int, default=1, help='Default: 1')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    game_states = [game_state for grid_size in args.grid_sizes
+                   for game_state in get_positions(grid_size, args.positions, args.max_iced)]
+    serial_times = {}
+    for workers in args.workers:
+        total_time = 0
+        for game_state in game_states:
+            if workers == 1:
+                start = time.perf_counter()
+                move = Solver().get_best_move(game_state)[0]
+                elapsed = time.perf_counter() - start
+                serial_times[game_state] = elapsed
+            else:
+                # a new pool per position, so that no worker reuses the transposition table of a previous search
+                with ProcessPoolExecutor(workers) as executor:
+                    list(executor.map(abs, range(workers)))
+                    start = time.perf_counter()
+                    move = ParallelSolver(executor, workers, args.split_depth).get_best_move(game_state)
+                    elapsed = time.perf_counter() - start
+            total_time += elapsed
+            speedup = f' {serial_times[game_state] / elapsed:.2f}x' if game_state in serial_times else ''
+            print(f'workers {workers} {game_state}: {elapsed * 1000:.0f}ms move={move}{speedup}')
+        print(f'workers {workers}: total {total_time:.2f}s')
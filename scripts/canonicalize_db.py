@@ -0,0 +1,16 @@
+import argparse
+
+from models.intellect import Intellect
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merges q_table rows of states which are equivalent under rotation or'
+                                                 ' reflection of the grid.')
+    parser.add_argument('grid_size',
+                        type=int,
+                        choices=[4, 5, 6, 7, 8, 9],
+                        help='Size of grid whose database to migrate (min: 4, max: 9)')
+    args = parser.parse_args()
+
+    rows_before, rows_after = Intellect.canonicalize_q_table(args.grid_size)
+    print(f'q_table rows: {rows_before} -> {rows_after}')
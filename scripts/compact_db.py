@@ -0,0 +1,46 @@
+import argparse
+import json
+
+from models.intellect import Intellect
+
+
+def format_stats(stats: dict):
+    sizes = f'file {stats["file_bytes"] / 1048576:.1f}MB'
+    if stats['table_bytes'] is not None:
+        sizes += f', table {stats["table_bytes"] / 1048576:.1f}MB, index {stats["index_bytes"] / 1048576:.1f}MB'
+    lookup = '' if stats['lookup_us'] is None else f', lookup {stats["lookup_us"]:.1f}us'
+    return f'{stats["rows"]} rows ({stats["guaranteed_losses"]} guaranteed losses), {sizes}{lookup}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deletes the q_table rows played in few games, keeping the guaranteed'
+                                                 ' losses, and compacts the database.')
+    parser.add_argument('grid_size', type=int, choices=[4, 5, 6, 7, 8, 9], help='Size of grid (min: 4, max: 9)')
+    parser.add_argument('--min-games', type=int, default=2,
+                        help='Delete the rows played in fewer games. Default: 2')
+    parser.add_argument('--memory-mb', type=float, default=None,
+                        help='Raise --min-games until q_table and its index take at most this many MB')
+    parser.add_argument('--keep-recent', type=int, default=0,
+                        help='Keep the given number of rows updated last whatever their games. Default: 0')
+    parser.add_argument('--archive', default=None,
+                        help='Add the deleted rows to the q_table of this database instead of losing them')
+    parser.add_argument('--shards', type=int, nargs='+', default=None,
+                        help='Indices of the shards to compact if the q_table is sharded, see scripts.shard_db.'
+                             ' Default: all')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    memory_budget = None if args.memory_mb is None else int(args.memory_mb * 1048576)
+    report = Intellect.compact_q_table(args.grid_size, args.min_games, memory_budget, args.keep_recent, args.archive,
+                                       shards=args.shards)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f'Deleted {report["deleted_rows"]} rows played in fewer than {report["min_games"]} games')
+        print(f'before: {format_stats(report["before"])}')
+        print(f'after: {format_stats(report["after"])}')
+        after = report['after']
+        # with --shards, the budget bounds the compacted shards, which the stats of the whole q_table don't show
+        if memory_budget is not None and args.shards is None and after['table_bytes'] is not None and \
+                after['table_bytes'] + after['index_bytes'] > memory_budget:
+            print(f'q_table is still over {args.memory_mb}MB, the guaranteed losses and the recent rows are kept')
@@ -0,0 +1,40 @@
+import argparse
+import json
+
+from models.evaluation import Evaluation
+from models.intellect import Intellect
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluates the bot against minimax, with confidence intervals of its'
+                                                 ' win rate.')
+    parser.add_argument('grid_size', type=int, choices=[4, 5, 6, 7, 8, 9], help='Size of grid (min: 4, max: 9)')
+    parser.add_argument('--episodes', type=int, default=10000,
+                        help='Maximum number of episodes, rounded up to cover every bear block, rotation and first'
+                             ' player evenly. Default: 10000')
+    parser.add_argument('--target-width', type=float, default=None,
+                        help='Stop once the confidence interval of the win rate is at most this wide, e.g. 0.02')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Default: 0.95')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes playing episodes. Default: 1')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    parser.add_argument('--engine', default='bit', choices=list(Intellect.ENGINES), help='Default: bit')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+    Intellect.ENGINE = Intellect.ENGINES[args.engine]
+
+    report = Evaluation(args.grid_size, args.workers, args.seed, args.confidence).run(args.episodes,
+                                                                                     args.target_width)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        def format_line(name: str, summary: dict):
+            return (f'{name}: {summary["wins"]}/{summary["episodes"]} = {summary["win_rate"]:.2%}'
+                    f' [{summary["lower"]:.2%}, {summary["upper"]:.2%}]')
+
+        print(f'{args.grid_size}x{args.grid_size}, {args.confidence:.0%} confidence intervals'
+              f'{", stopped early" if report["stopped_early"] else ""}')
+        print(format_line('overall', report))
+        for first, summary in report['by_first'].items():
+            print(format_line(first, summary))
+        for bear_index, summary in report['by_bear_index'].items():
+            print(format_line(f'bear at {bear_index}', summary))
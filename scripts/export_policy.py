@@ -0,0 +1,32 @@
+import argparse
+import time
+
+from models.intellect import Intellect
+from models.policy import Policy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exports the best moves of the trained q_table to a read-only policy'
+                                                 ' file, which the API can serve instead of the database.')
+    parser.add_argument('grid_size',
+                        type=int,
+                        choices=[4, 5, 6, 7, 8, 9],
+                        help='Size of grid whose database to export (min: 4, max: 9)')
+    parser.add_argument('--coverage-episodes',
+                        type=int,
+                        default=100,
+                        help='Games against minimax played to measure the coverage of the policy, 0 to skip. Default:'
+                             ' 100')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    num_game_states, num_records = Intellect.export_policy(args.grid_size)
+    print(f'{num_records} of {num_game_states} states written to {Policy.get_path(args.grid_size)}'
+          f' in {time.perf_counter() - start:.1f}s')
+
+    if args.coverage_episodes:
+        policy = Policy(Policy.get_path(args.grid_size))
+        answered, total, wins = Intellect.get_policy_coverage(policy, args.coverage_episodes)
+        print(f'coverage: {answered} of {total} states of the policy player ({answered / total:.1%}),'
+              f' {wins} of {args.coverage_episodes} games won against minimax')
+        policy.close()
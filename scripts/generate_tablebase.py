@@ -0,0 +1,24 @@
+import argparse
+import time
+
+from models.tablebase import Tablebase
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solves the endgame positions of given size of grid.')
+    parser.add_argument('grid_size',
+                        type=int,
+                        choices=[4, 5, 6, 7, 8, 9],
+                        help='Size of grid (min: 4, max: 9)')
+    parser.add_argument('--max-iced',
+                        type=int,
+                        default=None,
+                        help='Solve the positions with at most this many iced blocks. Default: all positions, only'
+                             ' feasible for 4 and 5')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    max_iced = args.max_iced if args.max_iced is not None else args.grid_size ** 2
+    num_positions = Tablebase.generate(args.grid_size, max_iced)
+    print(f'{num_positions} positions written to {Tablebase.get_path(args.grid_size)}'
+          f' in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,58 @@
+import argparse
+import random
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from models.bit_ice_breaker import BitIceBreaker
+
+
+def get_game_states(grid_size: int, num_states: int):
+    """
+    States of random games, from their first move until their last
+    """
+    game_states = []
+    while len(game_states) < num_states:
+        game_obj = BitIceBreaker(grid_size)
+        while not game_obj.game_ended and len(game_states) < num_states:
+            game_state = game_obj.get_game_state()
+            game_states.append(game_state)
+            game_obj.pick_block(game_state, random.choice(BitIceBreaker.get_possible_moves(
+                (game_obj.iced_mask, game_obj.bear_index))))
+    return game_states
+
+
+def percentile(sorted_values: list, percent: float):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures latency of the optimal move API under concurrent clients.')
+    parser.add_argument('--url', default='http://127.0.0.1:5003', help='Default: http://127.0.0.1:5003')
+    parser.add_argument('--grid-size', type=int, default=5, help='Default: 5')
+    parser.add_argument('--clients', type=int, default=16, help='Number of concurrent clients. Default: 16')
+    parser.add_argument('--requests', type=int, default=2000, help='Total number of requests. Default: 2000')
+    parser.add_argument('--minimax', type=int, default=0, help='Percent of minimax requests. Default: 0')
+    parser.add_argument('--seed', type=int, default=0, help='Default: 0')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    urls = [f'{args.url}/?array={game_state}' + ('&minimax' if random.randint(1, 100) <= args.minimax else '')
+            for game_state in get_game_states(args.grid_size, args.requests)]
+
+    def request(url: str):
+        start = time.perf_counter()
+        with urlopen(url) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as executor:
+        latencies = sorted(executor.map(request, urls))
+    elapsed = time.perf_counter() - start
+
+    print(f'{len(latencies)} requests from {args.clients} clients in {elapsed:.2f}s'
+          f' ({len(latencies) / elapsed:.1f} requests/s)')
+    print(f'p50 {percentile(latencies, 50) * 1000:.1f}ms, p99 {percentile(latencies, 99) * 1000:.1f}ms,'
+          f' max {latencies[-1] * 1000:.1f}ms')
@@ -0,0 +1,29 @@
+import argparse
+import os
+
+from models.intellect import Intellect
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrates a database to the current schema version: the game states'
+                                                 ' stored as text are encoded, the guaranteed losses of moves which do'
+                                                 ' not end the game with the current collapse rule are deleted, and'
+                                                 ' the q_table rows are given an update time.')
+    parser.add_argument('grid_size',
+                        type=int,
+                        choices=[4, 5, 6, 7, 8, 9],
+                        help='Size of grid whose database to migrate (min: 4, max: 9)')
+    args = parser.parse_args()
+
+    size_before = os.path.getsize(Intellect.get_db_path(args.grid_size))
+    migrated_rows = Intellect.migrate_db(args.grid_size)
+    size_after = os.path.getsize(Intellect.get_db_path(args.grid_size))
+    if not migrated_rows:
+        print(f'Already at schema version {Intellect.SCHEMA_VERSION}')
+    if 2 in migrated_rows:
+        print(f'q_table rows migrated: {migrated_rows[2]}')
+    if 3 in migrated_rows:
+        print(f'invalid guaranteed losses deleted: {migrated_rows[3]}')
+    if 4 in migrated_rows:
+        print(f'q_table rows given an update time: {migrated_rows[4]}')
+    print(f'database size: {size_before} -> {size_after} bytes')
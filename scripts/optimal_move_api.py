@@ -1,29 +1,444 @@
+import argparse
+import functools
+import json
+import os
+import queue
+import random
+import signal
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
 from urllib.parse import urlparse, parse_qs
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
 from models.intellect import Intellect
+from models.metrics import Metrics
+from models.move_cache import MoveCache
+from models.opening_book import OpeningBook
+from models.parallel_solver import ParallelSolver
+from models.policy import Policy
+from models.symmetry import Symmetry
+from models.tablebase import Tablebase
+
+
+class InvalidGameState(ValueError):
+    """
+    Game state of a request which is not a valid state of a served grid size, index being its position in the request
+    """
+
+    def __init__(self, message: str, index: int):
+        super().__init__(message)
+        self.index = index
+
+
+class ConnectionPool:
+    """
+    Read-only SQLite connections per grid size, opened once and shared by the request threads. The connections to a
+    sharded q_table copy its first memory_shards shards into memory
+    """
+
+    def __init__(self, grid_sizes: list, connections_per_grid: int, memory_shards: int = 0):
+        self.pools = {}
+        for grid_size in grid_sizes:
+            # creates the database and its tables if they don't exist yet
+            Intellect.get_db_conn(grid_size).close()
+            pool = queue.Queue()
+            for _ in range(connections_per_grid):
+                pool.put(Intellect.get_read_only_db_conn(grid_size, check_same_thread=False,
+                                                         memory_shards=memory_shards))
+            self.pools[grid_size] = pool
+
+    @contextmanager
+    def connection(self, grid_size: int):
+        pool = self.pools[grid_size]
+        con = pool.get()
+        try:
+            yield con
+        finally:
+            pool.put(con)
+
+    def close(self):
+        for pool in self.pools.values():
+            while not pool.empty():
+                pool.get().close()
+
+
+class OptimalMoveServer(HTTPServer):
+    """
+    Handles every request in a bounded thread pool, and runs minimax and Monte Carlo tree searches in a process pool so
+    that they don't block the q_table lookups. With minimax_split_workers, a minimax search is split across that many
+    processes of the pool. Moves are cached per grid size and mode by canonical game state
+
+    With use_policy, the grid sizes having an exported policy are served from it instead of the database. With
+    memory_shards, the first shards of a sharded q_table are served from memory, see Intellect.get_read_only_db_conn
+
+    warm_up loads the files into the page cache and builds the opening books, whose moves are served before the
+    caches, and sets ready once done
+    """
+
+    # connections waiting to be accepted, the default of 5 makes concurrent clients wait for SYN retries
+    request_queue_size = 128
+
+    def __init__(self, server_address: tuple, grid_sizes: list, threads: int, minimax_workers: int,
+                 request_timeout: float, cache_size: int = 10000, cache_ttl: float = 300,
+                 minimax_split_workers: int = 1, use_policy: bool = False, memory_shards: int = 0):
+        super().__init__(server_address, OptimalMove)
+        self.grid_sizes = grid_sizes
+        self.request_timeout = request_timeout
+        self.minimax_split_workers = minimax_split_workers
+        self.policies = {grid_size: Policy(Policy.get_path(grid_size)) for grid_size in grid_sizes
+                         if use_policy and os.path.exists(Policy.get_path(grid_size))}
+        self.connection_pool = ConnectionPool([grid_size for grid_size in grid_sizes if grid_size not in self.policies],
+                                              threads, memory_shards)
+        # the layout of a database does not change while it is served
+        self.db_file_paths = {grid_size: Intellect.get_db_file_paths(grid_size) for grid_size in grid_sizes}
+        self.request_executor = ThreadPoolExecutor(threads)
+        self.minimax_executor = ProcessPoolExecutor(minimax_workers)
+        self.move_caches = {(grid_size, mode): MoveCache(cache_size, cache_ttl)
+                            for grid_size in grid_sizes for mode in ('q_table', 'minimax', 'mcts')}
+        # grid_size -> OpeningBook, added by warm_up
+        self.opening_books = {}
+        self.ready = threading.Event()
+        self.warm_up_seconds = None
+
+    def warm_up(self, book_plies: int = 2, book_minimax_ms: float = 0, book_reload_seconds: float = 0):
+        """
+        For every grid size, reads its database files (or policy) and tablebase into the page cache of the OS, and
+        builds its opening book of the states up to book_plies moves in, whose q_table moves are reloaded at most once
+        every book_reload_seconds when the database changes. With book_minimax_ms, the initial states are
+        also searched by minimax for about that many milliseconds each, and the proven moves added to the book, which
+        leaves the minimax processes with the searched positions in their transposition tables
+        """
+        start = time.perf_counter()
+        for grid_size in self.grid_sizes:
+            if grid_size in self.policies:
+                self._read_files([Policy.get_path(grid_size)])
+            else:
+                self._read_files([path for db_path in self.db_file_paths[grid_size]
+                                  for path in (db_path, f'{db_path}-wal')])
+            if Intellect.get_tablebase(grid_size) is not None:
+                self._read_files([Tablebase.get_path(grid_size)])
+
+            opening_book = OpeningBook(grid_size, book_plies, book_reload_seconds)
+            if grid_size not in self.policies:
+                self._load_opening_book(opening_book, self.get_db_version(grid_size))
+            if book_minimax_ms:
+                futures = {game_state: self.minimax_executor.submit(
+                    Metrics.collect, Metrics.enabled, Intellect.get_minimax_move_within, game_state, book_minimax_ms)
+                    for game_state in opening_book.get_opening_states(grid_size, 0)}
+                for game_state, future in futures.items():
+                    (move, _, proven), snapshot = future.result()
+                    if snapshot is not None:
+                        Metrics.merge(snapshot)
+                    if proven:
+                        opening_book.minimax_moves[game_state] = move
+            self.opening_books[grid_size] = opening_book
+        self.warm_up_seconds = time.perf_counter() - start
+        self.ready.set()
+
+    @staticmethod
+    def _read_files(paths: list):
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    while f.read(1048576):
+                        pass
+            except FileNotFoundError:
+                pass
+
+    def get_opening_book(self, grid_size: int, version=None):
+        """
+        Returns:
+            (OpeningBook|None) opening book of grid_size, None until warm_up has built it. With the version of the
+            database, the q_table moves of the book are reloaded in the background if they are of another version,
+            see OpeningBook.should_load
+        """
+        opening_book = self.opening_books.get(grid_size)
+        if opening_book is not None and version is not None and opening_book.should_load(version):
+            threading.Thread(target=self._load_opening_book, args=(opening_book, version), daemon=True).start()
+        return opening_book
+
+    def _load_opening_book(self, opening_book: OpeningBook, version):
+        with self.connection_pool.connection(opening_book.grid_size) as con:
+            opening_book.load_q_table_moves(con, version)
+
+    def get_db_version(self, grid_size: int):
+        """
+        Changes whenever the database, or any of its shard files, changes. It is in WAL mode, so the database file
+        itself is only modified at checkpoints and the WAL file has to be checked as well
+        """
+        return tuple(self._get_file_version(path) for db_path in self.db_file_paths[grid_size]
+                     for path in (db_path, f'{db_path}-wal'))
+
+    def get_move_cache(self, grid_size: int, mode: str, version=None):
+        """
+        The q_table cache is cleared when the version of the database changes, see get_db_version, version being
+        taken if not given
+        """
+        move_cache = self.move_caches[(grid_size, mode)]
+        if mode == 'q_table':
+            move_cache.validate(self.get_db_version(grid_size) if version is None else version)
+        return move_cache
+
+    @staticmethod
+    def _get_file_version(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_stats(self):
+        stats = {f'{grid_size}_{mode}': move_cache.get_stats()
+                 for (grid_size, mode), move_cache in self.move_caches.items()}
+        for grid_size, opening_book in self.opening_books.items():
+            stats[f'{grid_size}_opening_book'] = opening_book.get_stats()
+        return stats
+
+    def process_request(self, request, client_address):
+        self.request_executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """
+        Waits for the requests in progress before closing the pools
+        """
+        super().server_close()
+        self.request_executor.shutdown(wait=True)
+        self.minimax_executor.shutdown(wait=True, cancel_futures=True)
+        self.connection_pool.close()
+        for policy in self.policies.values():
+            policy.close()
 
 
 class OptimalMove(BaseHTTPRequestHandler):
 
-    def _get_optimal_move(self, game_state: str, use_minimax: bool = False):
-        if use_minimax:
-            sanitized_game_state = game_state
-            log_msg, optimal_move = 'minimax', Intellect.get_minimax_move(game_state)
-            sanitized_move = optimal_move
-        else:
-            sanitized_game_state = Intellect.sanitize_game_state(game_state)
-            grid_size = int(len(game_state) ** 0.5)
-            with Intellect.get_db_conn(grid_size) as con:
-                log_msg, optimal_move = Intellect.get_optimal_move(con, sanitized_game_state, experimentation=0)
-            con.close()
-            sanitized_move = Intellect.sanitize_move(game_state, optimal_move)
-        self.log_message('%s - %s (%s) - %s', sanitized_game_state, optimal_move, log_msg, sanitized_move)
-        return sanitized_move
-
-    def _set_headers(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
+    def _get_optimal_move(self, game_state: str, use_minimax: bool = False, budget_ms: float = None,
+                          use_mcts: bool = False):
+        log_msg, optimal_move, search = self._get_optimal_moves([game_state], use_minimax, budget_ms, use_mcts)[0]
+        self.log_message('%s - %s (%s%s)', game_state, optimal_move, log_msg,
+                         '' if search is None else ''.join(f' {key} {value}' for key, value in search.items()))
+        return optimal_move, search
+
+    def _get_optimal_moves(self, game_states: list, use_minimax: bool = False, budget_ms: float = None,
+                           use_mcts: bool = False):
+        """
+        With budget_ms, the minimax search of each state is limited to about budget_ms milliseconds. With use_mcts, the
+        states are searched by Monte Carlo tree search for budget_ms milliseconds, Intellect.MCTS_BUDGET_MS by default
+        Returns:
+            (list) (log message, optimal move, search) for each of game_states, in the same order. search is None
+            without budget_ms or use_mcts, otherwise the depth searched by minimax (None if not searched), or the
+            rollouts and win rate of mcts, and whether the move is proven
+        """
+        # the searches still running or waiting for a process at the deadline are stopped
+        deadline = time.monotonic() + self.server.request_timeout
+        canonical_game_states = {}
+        for index, game_state in enumerate(game_states):
+            grid_size = self._validate_game_state(game_state, index)
+            canonical_game_states.setdefault(grid_size, {})[game_state] = \
+                Symmetry.canonicalize_game_state(game_state)
+
+        optimal_moves = {}
+        for grid_size, grid_game_states in canonical_game_states.items():
+            for game_state in list(grid_game_states):
+                tablebase_move = Intellect.get_tablebase_move(game_state)
+                if tablebase_move is not None:
+                    if use_mcts:
+                        search = {'rollouts': 0, 'win_rate': None, 'proven': True}
+                    else:
+                        search = None if budget_ms is None else {'depth': None, 'proven': True}
+                    optimal_moves[game_state] = ('tablebase', tablebase_move, search)
+                    del grid_game_states[game_state]
+            if use_mcts:
+                optimal_moves.update(self._get_mcts_moves(grid_size, grid_game_states, budget_ms, deadline))
+            elif use_minimax or budget_ms is not None:
+                optimal_moves.update(self._get_minimax_moves(grid_size, grid_game_states, budget_ms, deadline))
+            else:
+                optimal_moves.update(self._get_q_table_moves(grid_size, grid_game_states))
+        return [optimal_moves[game_state] for game_state in game_states]
+
+    def _validate_game_state(self, game_state: str, index: int):
+        """
+        Returns:
+            (int) grid size of game_state
+        Raises:
+            InvalidGameState if game_state is not made of uniced, iced and exactly one bear block, of a served grid size
+        """
+        grid_size = int(len(game_state) ** 0.5)
+        if grid_size not in self.server.grid_sizes or grid_size ** 2 != len(game_state):
+            raise InvalidGameState(f'Unsupported grid size of game state {game_state!r}, the number of blocks should'
+                                   f' be the square of one of {self.server.grid_sizes}', index)
+        if set(game_state) - set('012'):
+            raise InvalidGameState(f'Invalid game state {game_state!r}, the blocks should be 0 (uniced), 1 (iced)'
+                                   f' or 2 (bear)', index)
+        if game_state.count('2') != 1:
+            raise InvalidGameState(f'Invalid game state {game_state!r}, there should be exactly one bear block (2)',
+                                   index)
+        return grid_size
+
+    def _get_minimax_moves(self, grid_size: int, canonical_game_states: dict, budget_ms: float = None,
+                           deadline: float = None):
+        """
+        Only proven moves are cached, so the moves of searches which ran out of budget are searched again. The
+        searches stop at deadline, a time.monotonic() value, and TimeoutError is raised
+        """
+        move_cache = self.server.get_move_cache(grid_size, 'minimax')
+        opening_book = self.server.get_opening_book(grid_size)
+        # canonical game state -> (canonical move, depth searched, proven)
+        results = {}
+        futures = {}
+        for canonical_game_state, _ in canonical_game_states.values():
+            canonical_move = None if opening_book is None else opening_book.minimax_moves.get(canonical_game_state)
+            if canonical_move is None:
+                canonical_move = move_cache.get(canonical_game_state)
+            if canonical_move is not None:
+                results[canonical_game_state] = (canonical_move, None, True)
+            elif canonical_game_state in futures or canonical_game_state in results:
+                continue
+            elif (budget_ms is None and self.server.minimax_split_workers > 1
+                  and ParallelSolver.is_worth_splitting(canonical_game_state)):
+                # the search itself submits its subtrees to the minimax processes, so it runs in this thread
+                results[canonical_game_state] = (Intellect.get_minimax_move(
+                    canonical_game_state, self.server.minimax_split_workers, self.server.minimax_executor,
+                    deadline=deadline), None, True)
+                move_cache.put(canonical_game_state, results[canonical_game_state][0])
+            elif budget_ms is None:
+                futures[canonical_game_state] = self.server.minimax_executor.submit(
+                    Metrics.collect, Metrics.enabled, functools.partial(Intellect.get_minimax_move, deadline=deadline),
+                    canonical_game_state)
+            else:
+                futures[canonical_game_state] = self.server.minimax_executor.submit(
+                    Metrics.collect, Metrics.enabled, Intellect.get_minimax_move_within, canonical_game_state,
+                    budget_ms, deadline)
+        for canonical_game_state, result, snapshot in self._get_results(futures, deadline):
+            if snapshot is not None:
+                Metrics.merge(snapshot)
+            results[canonical_game_state] = (result, None, True) if budget_ms is None else result
+            canonical_move, _, proven = results[canonical_game_state]
+            if proven:
+                move_cache.put(canonical_game_state, canonical_move)
+
+        optimal_moves = {}
+        for game_state, (canonical_game_state, transform) in canonical_game_states.items():
+            canonical_move, depth, proven = results[canonical_game_state]
+            optimal_moves[game_state] = ('minimax', Symmetry.from_canonical_move(canonical_move, grid_size, transform),
+                                         None if budget_ms is None else {'depth': depth, 'proven': proven})
+        return optimal_moves
+
+    def _get_mcts_moves(self, grid_size: int, canonical_game_states: dict, budget_ms: float = None,
+                        deadline: float = None):
+        """
+        Same as _get_minimax_moves with budget_ms, the q_table being the priors of the searches
+        """
+        move_cache = self.server.get_move_cache(grid_size, 'mcts')
+        # canonical game state -> (canonical move, rollouts, win rate, proven)
+        results = {}
+        futures = {}
+        for canonical_game_state, _ in canonical_game_states.values():
+            canonical_move = move_cache.get(canonical_game_state)
+            if canonical_move is not None:
+                results[canonical_game_state] = (canonical_move, 0, None, True)
+            elif canonical_game_state not in futures:
+                futures[canonical_game_state] = self.server.minimax_executor.submit(
+                    Metrics.collect, Metrics.enabled, Intellect.get_mcts_move_with_q_table, canonical_game_state,
+                    budget_ms, deadline)
+        for canonical_game_state, result, snapshot in self._get_results(futures, deadline):
+            if snapshot is not None:
+                Metrics.merge(snapshot)
+            results[canonical_game_state] = result
+            if result[3]:
+                move_cache.put(canonical_game_state, result[0])
+
+        optimal_moves = {}
+        for game_state, (canonical_game_state, transform) in canonical_game_states.items():
+            canonical_move, rollouts, win_rate, proven = results[canonical_game_state]
+            optimal_moves[game_state] = ('mcts', Symmetry.from_canonical_move(canonical_move, grid_size, transform),
+                                         {'rollouts': rollouts, 'win_rate': win_rate, 'proven': proven})
+        return optimal_moves
+
+    @staticmethod
+    def _get_results(futures: dict, deadline: float):
+        """
+        Yields the canonical game state, result and metrics snapshot of every search in futures. If a search times out,
+        the searches which have not started yet are cancelled, and the running ones stop on their own at deadline
+        """
+        try:
+            for canonical_game_state, future in futures.items():
+                yield canonical_game_state, *future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            for future in futures.values():
+                future.cancel()
+            raise
+
+    def _get_q_table_moves(self, grid_size: int, canonical_game_states: dict):
+        policy = self.server.policies.get(grid_size)
+        if policy is not None:
+            return self._get_policy_moves(policy, canonical_game_states)
+
+        version = self.server.get_db_version(grid_size)
+        move_cache = self.server.get_move_cache(grid_size, 'q_table', version)
+        opening_book = self.server.get_opening_book(grid_size, version)
+        best_moves = {}
+        for canonical_game_state, _ in canonical_game_states.values():
+            cached_moves = None
+            if opening_book is not None:
+                cached_moves = opening_book.get_q_table_moves(canonical_game_state, version)
+            if cached_moves is None:
+                cached_moves = move_cache.get(canonical_game_state)
+            if cached_moves is not None:
+                best_moves[canonical_game_state] = cached_moves
+        uncached_game_states = [canonical_game_state for canonical_game_state, _ in canonical_game_states.values()
+                                if canonical_game_state not in best_moves]
+        if uncached_game_states:
+            with self.server.connection_pool.connection(grid_size) as con:
+                for canonical_game_state, (_, moves) in Intellect.get_best_moves_of_states(
+                        con, uncached_game_states).items():
+                    best_moves[canonical_game_state] = moves
+                    if moves:
+                        move_cache.put(canonical_game_state, moves)
+
+        optimal_moves = {}
+        for game_state, (canonical_game_state, transform) in canonical_game_states.items():
+            if best_moves[canonical_game_state]:
+                # same random tie-breaking between the best moves as get_optimal_move
+                canonical_move = random.choice(best_moves[canonical_game_state])
+                optimal_moves[game_state] = ('optimal', Symmetry.from_canonical_move(canonical_move, grid_size,
+                                                                                     transform), None)
+            else:
+                with self.server.connection_pool.connection(grid_size) as con:
+                    optimal_moves[game_state] = (*Intellect.get_optimal_move(con, game_state, experimentation=0,
+                                                                             learn=False), None)
+        return optimal_moves
+
+    @staticmethod
+    def _get_policy_moves(policy: Policy, canonical_game_states: dict):
+        """
+        Same as _get_q_table_moves, but the moves are looked up in the policy, which is fast enough to not be cached.
+        The states which are not in the policy get a move which does not lose right away
+        """
+        optimal_moves = {}
+        for game_state, (canonical_game_state, transform) in canonical_game_states.items():
+            _, canonical_moves = policy.get_best_moves(canonical_game_state)
+            if canonical_moves:
+                optimal_moves[game_state] = ('policy', Symmetry.from_canonical_move(random.choice(canonical_moves),
+                                                                                    policy.grid_size, transform), None)
+            else:
+                optimal_moves[game_state] = (*Intellect.get_optimal_move(None, game_state, experimentation=0,
+                                                                         learn=False), None)
+        return optimal_moves
+
+    def _set_headers(self, status: int = 200, content_type: str = 'text/plain'):
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
 
@@ -31,20 +446,169 @@ class OptimalMove(BaseHTTPRequestHandler):
         self._set_headers()
 
     def do_GET(self):
-        self._set_headers()
-        query = urlparse(self.path).query
-        parsed_query = parse_qs(query)
-        if 'array' in parsed_query:
-            self.wfile.write(bytes(str(self._get_optimal_move(parsed_query['array'][0],
-                                                              'minimax' in parsed_query)), 'UTF-8'))
-        else:
+        parsed_url = urlparse(self.path)
+        if parsed_url.path == '/ready':
+            # 503 until the warm-up is done, so that load balancers only send requests to warm servers
+            ready = self.server.ready.is_set()
+            self._set_headers(200 if ready else 503, content_type='application/json')
+            self.wfile.write(bytes(json.dumps({'ready': ready, 'warm_up_seconds': self.server.warm_up_seconds}),
+                                   'UTF-8'))
+            return
+        if parsed_url.path == '/stats':
+            self._set_headers(content_type='application/json')
+            self.wfile.write(bytes(json.dumps(self.server.get_stats()), 'UTF-8'))
+            return
+        if parsed_url.path == '/metrics':
+            if not Metrics.enabled:
+                self._set_headers(404)
+                self.wfile.write(bytes('Metrics are disabled, start the server with --metrics', 'UTF-8'))
+                return
+            self._set_headers(content_type='text/plain; version=0.0.4')
+            self.wfile.write(bytes(Metrics.get_prometheus_text(), 'UTF-8'))
+            return
+        parsed_query = parse_qs(parsed_url.query, keep_blank_values=True)
+        if 'array' not in parsed_query:
+            self._set_headers()
             self.wfile.write(bytes('', 'UTF-8'))
+            return
+
+        def get_response():
+            budget_ms = self._get_budget_ms(parsed_query)
+            optimal_move, search = self._get_optimal_move(parsed_query['array'][0], 'minimax' in parsed_query,
+                                                          budget_ms, 'mcts' in parsed_query)
+            if search is None:
+                return str(optimal_move)
+            return json.dumps({'move': optimal_move, **search})
+
+        self._respond(get_response, 'text/plain' if 'budget_ms' not in parsed_query and 'mcts' not in parsed_query
+                      else 'application/json')
+
+    @staticmethod
+    def _get_budget_ms(parsed_query: dict):
+        """
+        Returns:
+            (float|None) milliseconds the search of a state may take, None if there is no limit
+        """
+        if 'budget_ms' not in parsed_query:
+            return None
+        try:
+            budget_ms = float(parsed_query['budget_ms'][0])
+        except ValueError:
+            raise ValueError('budget_ms should be a number')
+        if not budget_ms > 0:
+            raise ValueError('budget_ms should be positive')
+        return budget_ms
+
+    def do_POST(self):
+        """
+        Returns the optimal moves of many states at once. The body is either a JSON list of states, to which a JSON
+        list of moves is returned, or one state per line, to which one move per line is returned. With `budget_ms` or
+        `mcts` the JSON moves are objects with the search details, as for a single state
+        """
+        parsed_query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('UTF-8').strip()
+        is_json = body.startswith('[')
+
+        def get_response():
+            try:
+                game_states = json.loads(body) if is_json else body.split()
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Invalid JSON: {e}')
+            if not all(isinstance(game_state, str) for game_state in game_states):
+                raise ValueError('Game states should be strings')
+            budget_ms = self._get_budget_ms(parsed_query)
+            optimal_moves = self._get_optimal_moves(game_states, 'minimax' in parsed_query, budget_ms,
+                                                    'mcts' in parsed_query)
+            if 'mcts' in parsed_query:
+                mode = 'mcts'
+            elif 'minimax' in parsed_query or budget_ms is not None:
+                mode = 'minimax'
+            else:
+                mode = 'batch'
+            self.log_message('%s states - %s', len(game_states), mode)
+            if is_json:
+                return json.dumps([move if search is None else {'move': move, **search}
+                                   for _, move, search in optimal_moves])
+            return '\n'.join(str(move) for _, move, _ in optimal_moves)
+
+        self._respond(get_response, 'application/json' if is_json else 'text/plain')
+
+    def _respond(self, get_response, content_type: str = 'text/plain'):
+        start = Metrics.start()
+        try:
+            response = get_response()
+        except InvalidGameState as e:
+            status = 400
+            self._set_headers(status, content_type='application/json')
+            self.wfile.write(bytes(json.dumps({'error': str(e), 'index': e.index}), 'UTF-8'))
+        except ValueError as e:
+            status = 400
+            self._set_headers(status)
+            self.wfile.write(bytes(str(e), 'UTF-8'))
+        except TimeoutError:
+            status = 504
+            self._set_headers(status)
+            self.wfile.write(bytes('Timed out', 'UTF-8'))
+        else:
+            status = 200
+            self._set_headers(content_type=content_type)
+            self.wfile.write(bytes(response, 'UTF-8'))
+        Metrics.observe_since('request_seconds', start, method=self.command)
+        Metrics.increment('requests_total', method=self.command, status=status)
 
 
 if __name__ == '__main__':
-    server_address = ('', 5003)
-    httpd = HTTPServer(server_address, OptimalMove)
+    parser = argparse.ArgumentParser(description='Serves the optimal move for given state of game.')
+    parser.add_argument('--port', type=int, default=5003, help='Default: 5003')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[4, 5, 6, 7, 8, 9],
+                        help='Grid sizes to serve. Default: 4 5 6 7 8 9')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Number of requests handled concurrently, and connections per grid size. Default: 8')
+    parser.add_argument('--minimax-workers', type=int, default=2,
+                        help='Number of processes running minimax and mcts searches. Default: 2')
+    parser.add_argument('--minimax-split-workers', type=int, default=1,
+                        help='Number of minimax processes a single minimax search of a state with more than'
+                             f' {ParallelSolver.MIN_ICED_BLOCKS} iced blocks is split across. Default: 1')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Seconds after which a minimax or mcts request, whose searches are then stopped, or a'
+                             ' client not sending its request, times out. Default: 30')
+    parser.add_argument('--policy', action='store_true',
+                        help='Serve the grid sizes which have a policy exported by scripts.export_policy from it'
+                             ' instead of the database')
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='Number of moves cached per grid size and mode, 0 disables the cache. Default: 10000')
+    parser.add_argument('--cache-ttl', type=float, default=300,
+                        help='Seconds after which a cached move expires, 0 never expires. Default: 300')
+    parser.add_argument('--memory-shards', type=int, default=0,
+                        help='Copy the first shards of a sharded q_table into memory, e.g. 1 for the openings of the'
+                             ' shards by iced blocks, see scripts.shard_db. They are only refreshed on restart.'
+                             ' Default: 0')
+    parser.add_argument('--book-plies', type=int, default=2,
+                        help='Moves into the game up to which the opening book holds the q_table moves, from every'
+                             ' initial bear block. Default: 2')
+    parser.add_argument('--book-minimax-ms', type=float, default=0,
+                        help='Milliseconds of minimax search per initial state while warming up, the proven moves'
+                             ' being added to the opening book. Default: 0 (no search)')
+    parser.add_argument('--book-reload-seconds', type=float, default=10,
+                        help='Minimum seconds between two reloads of the q_table moves of the opening book, which are'
+                             ' not served while the database has changed since they were loaded. Default: 10')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Record request, lookup, engine and minimax timings, served at /metrics')
+    args = parser.parse_args()
+
+    Metrics.enabled = args.metrics
+    OptimalMove.timeout = args.timeout
+    httpd = OptimalMoveServer(('', args.port), args.grid_sizes, args.threads, args.minimax_workers, args.timeout,
+                              args.cache_size, args.cache_ttl, args.minimax_split_workers, args.policy,
+                              args.memory_shards)
+    # shutdown() waits for serve_forever() to stop, so it can't be called from the thread running it
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown).start())
+    # requests are served while warming up, /ready tells when it is done
+    threading.Thread(target=httpd.warm_up, args=(args.book_plies, args.book_minimax_ms, args.book_reload_seconds),
+                     daemon=True).start()
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
-        httpd.shutdown()
+        pass
+    finally:
+        httpd.server_close()
@@ -0,0 +1,32 @@
+import argparse
+
+from models.intellect import Intellect
+from models.shard_router import ShardRouter
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Partitions the q_table across shard files by the number of iced'
+                                                 ' blocks (the phase of the game) or by the bear block, or gathers it'
+                                                 ' back into the database file.')
+    parser.add_argument('grid_size',
+                        type=int,
+                        choices=[4, 5, 6, 7, 8, 9],
+                        help='Size of grid whose database to shard (min: 4, max: 9)')
+    parser.add_argument('--shards',
+                        type=int,
+                        default=4,
+                        help='Number of shard files, 1 gathers the q_table back into the database file. Default: 4')
+    parser.add_argument('--key',
+                        default='iced',
+                        choices=ShardRouter.SHARD_KEYS,
+                        help='Shard key, iced puts the openings in shard 0 and the endgames in the last shard.'
+                             ' Default: iced')
+    args = parser.parse_args()
+
+    rows_per_shard = Intellect.reshard_q_table(args.grid_size, args.key, args.shards)
+    if args.shards == 1:
+        print(f'q_table rows: {rows_per_shard[0]}')
+    else:
+        for shard_index, num_rows in enumerate(rows_per_shard):
+            path = ShardRouter.get_shard_path(Intellect.get_db_path(args.grid_size), shard_index)
+            print(f'{path}: {num_rows} q_table rows')
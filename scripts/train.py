@@ -1,7 +1,25 @@
 import argparse
-import timeit
+import json
+import threading
+import time
 
 from models.intellect import Intellect
+from models.metrics import Metrics
+from models.q_table import QTable
+from models.trajectory_log import TrajectoryLog
+
+
+def print_progress(interval: float, stopped: threading.Event):
+    """
+    Prints the episodes played so far and the rate since the previous line, every interval seconds until stopped
+    """
+    last_time = time.perf_counter()
+    last_episodes = 0
+    while not stopped.wait(interval):
+        now = time.perf_counter()
+        episodes = Metrics.get_counter('episodes_total')
+        print(f'{episodes} episodes, {(episodes - last_episodes) / (now - last_time):.1f} episodes/s', flush=True)
+        last_time, last_episodes = now, episodes
 
 
 if __name__ == '__main__':
@@ -19,11 +37,141 @@ if __name__ == '__main__':
                         type=bool,
                         default=False,
                         help='To train vs minimax algo. Default: False')
+    parser.add_argument('--opponent',
+                        default='minimax',
+                        choices=['minimax', 'mcts'],
+                        help='Opponent of the bot with --minimax, mcts searching --mcts-budget-ms per move. Default:'
+                             ' minimax')
+    parser.add_argument('--mcts-budget-ms',
+                        type=float,
+                        default=Intellect.MCTS_BUDGET_MS,
+                        help=f'Milliseconds the mcts opponent searches per move. Default: {Intellect.MCTS_BUDGET_MS}')
+    parser.add_argument('--engine',
+                        default='list',
+                        choices=list(Intellect.ENGINES),
+                        help='Game engine used to simulate moves. Default: list')
+    parser.add_argument('--episodes',
+                        type=int,
+                        default=50000,
+                        help='Number of episodes per run. Default: 50000')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=10,
+                        help='Number of runs. Default: 10')
+    parser.add_argument('--flush-episodes',
+                        type=int,
+                        default=0,
+                        help='Keep q_table in memory and store it every given number of episodes. Default: 0 (store'
+                             ' every episode)')
+    parser.add_argument('--flush-seconds',
+                        type=float,
+                        default=0,
+                        help='Keep q_table in memory and store it every given number of seconds. Default: 0')
+    parser.add_argument('--max-cached-states',
+                        type=int,
+                        default=QTable.MAX_STATES,
+                        help='With --flush-episodes, --flush-seconds, --workers or --log-dir, states of the q_table'
+                             ' kept in memory besides the states not yet stored, after which they are evicted, 0 for no'
+                             f' limit. Default: {QTable.MAX_STATES}')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='Number of processes playing self-play episodes in parallel, or with --minimax solving the'
+                             ' minimax moves in parallel. Default: 1')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=None,
+                        help='Seed for reproducible self-play training with --workers. Default: random')
+    parser.add_argument('--log-dir',
+                        default=None,
+                        help='Append the episodes to a trajectory log in this directory instead of storing them in the'
+                             ' database, see scripts.aggregate_logs')
+    parser.add_argument('--log-max-mb',
+                        type=float,
+                        default=64,
+                        help='Size in MB after which the trajectory log starts a new file. Default: 64')
+    parser.add_argument('--prune-min-games',
+                        type=int,
+                        default=0,
+                        help='After every run, delete the q_table rows played in fewer games, except guaranteed losses'
+                             ' and the rows of --prune-keep-recent, see scripts.compact_db. Default: 0 (never)')
+    parser.add_argument('--prune-memory-mb',
+                        type=float,
+                        default=None,
+                        help='After every run, delete the rows played in the fewest games until q_table and its index'
+                             ' take at most this many MB')
+    parser.add_argument('--prune-keep-recent',
+                        type=int,
+                        default=100000,
+                        help='Rows updated last which are never pruned, so that new states can be played again.'
+                             ' Default: 100000')
+    parser.add_argument('--metrics',
+                        action='store_true',
+                        help='Record the time spent in q_table lookups, the engine, minimax and commits, and the'
+                             ' decisions taken, and print their summary at the end')
+    parser.add_argument('--progress',
+                        type=float,
+                        default=0,
+                        help='Print the episodes played every given number of seconds, implies --metrics. With'
+                             ' --workers, the episodes of the workers are counted once their task is done. Default: 0')
+    parser.add_argument('--json',
+                        action='store_true',
+                        help='Print the runs, and the metrics with --metrics, as a single JSON object at the end')
     args = parser.parse_args()
+    Intellect.ENGINE = Intellect.ENGINES[args.engine]
+    QTable.MAX_STATES = args.max_cached_states
+    Metrics.enabled = args.metrics or args.progress > 0
+
+    trajectory_log = None
+    if args.log_dir:
+        trajectory_log = TrajectoryLog(args.log_dir, args.grid_size, int(args.log_max_mb * 1024 * 1024))
 
     def train():
-        if args.minimax:
-            Intellect.train_vs_minimax(args.grid_size, experimentation=args.exp)
+        if args.workers > 1 and not args.minimax:
+            Intellect.train_vs_self_parallel(args.grid_size, args.episodes, args.exp, args.workers, seed=args.seed,
+                                             trajectory_log=trajectory_log)
+        elif args.minimax:
+            Intellect.train_vs_minimax(args.grid_size, args.episodes, args.exp, args.flush_episodes,
+                                       args.flush_seconds, args.workers, trajectory_log, args.opponent,
+                                       args.mcts_budget_ms)
         else:
-            Intellect.train_vs_self(args.grid_size, experimentation=args.exp)
-    print(timeit.repeat(train, repeat=10, number=1))
+            Intellect.train_vs_self(args.grid_size, args.episodes, args.exp, args.flush_episodes, args.flush_seconds,
+                                    trajectory_log)
+        if trajectory_log is not None:
+            trajectory_log.flush()
+
+    stop_progress = threading.Event()
+    if args.progress > 0:
+        threading.Thread(target=print_progress, args=(args.progress, stop_progress), daemon=True).start()
+
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        train()
+        elapsed = time.perf_counter() - start
+        runs.append({'seconds': elapsed, 'episodes_per_second': args.episodes / elapsed})
+        if not args.json:
+            print(f'{elapsed:.2f}s, {args.episodes / elapsed:.1f} episodes/s')
+        if args.prune_min_games or args.prune_memory_mb is not None:
+            # the freed pages are reused by the next runs, so VACUUM would only slow the training down
+            report = Intellect.compact_q_table(
+                args.grid_size, args.prune_min_games,
+                None if args.prune_memory_mb is None else int(args.prune_memory_mb * 1048576),
+                args.prune_keep_recent, vacuum=False, lookup_samples=0)
+            runs[-1]['pruned_rows'] = report['deleted_rows']
+            if not args.json:
+                print(f'pruned {report["deleted_rows"]} rows played in fewer than {report["min_games"]} games,'
+                      f' {report["after"]["rows"]} rows left')
+    stop_progress.set()
+    if trajectory_log is not None:
+        trajectory_log.close()
+
+    summary = Metrics.get_summary() if Metrics.enabled else None
+    if args.json:
+        print(json.dumps({'runs': runs, 'metrics': summary}, indent=2))
+    elif summary is not None:
+        for name, value in summary['counters'].items():
+            print(f'{name}: {value}')
+        for name, histogram in summary['histograms'].items():
+            print(f'{name}: count {histogram["count"]}, total {histogram["sum"]:.2f}s,'
+                  f' mean {histogram["mean"] * 1000:.3f}ms, p50 <= {histogram["p50"]}s, p99 <= {histogram["p99"]}s')
@@ -0,0 +1,49 @@
+import random
+import sqlite3
+
+import pytest
+
+from models.intellect import Intellect
+
+GRID_SIZE = 4
+
+
+def get_db_rows(grid_size: int = GRID_SIZE):
+    """
+    Returns:
+        (list, list) rows of q_table and q_meta of the database of grid_size in the working directory, without the
+        progress of aggregate_trajectory_logs
+    """
+    con = sqlite3.connect(Intellect.get_db_path(grid_size))
+    rows = (con.execute('SELECT game_state, block_index, num_wins, num_games FROM q_table ORDER BY 1, 2').fetchall(),
+            con.execute("SELECT property, property_val FROM q_meta WHERE property NOT LIKE 'trajectory_log_%'"
+                        ' ORDER BY 1').fetchall())
+    con.close()
+    return rows
+
+
+def train_in_directory(tmp_path, name: str, train, seed: int = 1, grid_size: int = GRID_SIZE):
+    """
+    Calls train in the new directory tmp_path / name, after seeding random with seed and clearing the minimax
+    transposition table, so that the same train gives the same database
+    Returns:
+        (list, list) rows of the database of grid_size trained, see get_db_rows
+    """
+    path = tmp_path / name
+    path.mkdir()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(path)
+        random.seed(seed)
+        Intellect.get_solver().clear()
+        train()
+        return get_db_rows(grid_size)
+
+
+@pytest.fixture
+def trained_db(tmp_path, monkeypatch):
+    """
+    Database of GRID_SIZE in tmp_path, the working directory, trained on 100 seeded self-play episodes
+    """
+    monkeypatch.chdir(tmp_path)
+    random.seed(1)
+    Intellect.train_vs_self(GRID_SIZE, 100)
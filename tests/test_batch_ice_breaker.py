@@ -0,0 +1,54 @@
+import importlib
+import sys
+
+import pytest
+
+from models.ice_breaker import IceBreaker
+
+np = pytest.importorskip('numpy')
+from models.batch_ice_breaker import BatchIceBreaker, RandomPlayer  # noqa: E402
+
+
+@pytest.mark.parametrize('grid_size', range(4, 10))
+def test_lockstep_games_match_ice_breaker(grid_size):
+    rng = np.random.default_rng(grid_size)
+    num_games = 200
+    batch = BatchIceBreaker(grid_size, num_games, rng)
+    games = []
+    for game_state in batch.get_game_states():
+        game_obj = IceBreaker(grid_size, game_state.index('2'))
+        assert game_obj.get_game_state() == game_state
+        games.append(game_obj)
+
+    player = RandomPlayer(rng)
+    while not batch.game_ended.all():
+        moves = player.get_moves(batch)
+        # sometimes pick a block which is not iced, which ends the game as well
+        moves = np.where(rng.random(num_games) < 0.02, rng.integers(0, grid_size ** 2, num_games), moves)
+        for game_index in batch.get_active_game_indices():
+            games[game_index].pick_block(games[game_index].get_game_state(), int(moves[game_index]))
+        batch.pick_blocks(moves)
+        for game_index, (game_obj, game_state) in enumerate(zip(games, batch.get_game_states())):
+            assert game_obj.game_ended == batch.game_ended[game_index]
+            if game_obj.game_ended:
+                assert game_obj.winner.id == batch.winners[game_index]
+            else:
+                assert game_obj.get_game_state() == game_state
+    assert batch.num_moves.tolist() == [len(game_obj.p1.move_per_state) + len(game_obj.p2.move_per_state)
+                                        for game_obj in games]
+
+
+def test_from_game_states():
+    game_states = ['2111101111110110', '1211111111111111']
+    batch = BatchIceBreaker.from_game_states(game_states)
+    assert batch.get_game_states() == game_states
+    batch.pick_blocks(np.array([10, 0]))
+    assert batch.get_game_states() == ['2111000000000000', '0211111111111111']
+    assert not batch.game_ended.any()
+
+
+def test_missing_numpy_is_reported(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    monkeypatch.delitem(sys.modules, 'models.batch_ice_breaker')
+    with pytest.raises(ImportError, match='requirements-batch.txt'):
+        importlib.import_module('models.batch_ice_breaker')
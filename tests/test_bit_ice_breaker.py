@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+
+GRID_SIZES = range(4, 10)
+GAMES_PER_GRID_SIZE = 50
+
+
+def new_games(grid_size: int, seed: int):
+    """
+    Returns:
+        (IceBreaker, BitIceBreaker) new games of grid_size with the same bear block
+    """
+    random.seed(seed)
+    game = IceBreaker(grid_size)
+    random.seed(seed)
+    return game, BitIceBreaker(grid_size)
+
+
+@pytest.mark.parametrize('grid_size', GRID_SIZES)
+def test_random_games_match_ice_breaker(grid_size):
+    rng = random.Random(grid_size)
+    for _ in range(GAMES_PER_GRID_SIZE):
+        game, bit_game = new_games(grid_size, rng.random())
+        lake_array = IceBreaker.get_position(game.get_game_state())
+        position = BitIceBreaker.get_position(bit_game.get_game_state())
+        while True:
+            game_state = game.get_game_state()
+            assert bit_game.get_game_state() == game_state
+            assert BitIceBreaker.get_game_state_from_position(position, grid_size) == game_state
+            assert BitIceBreaker.get_position_from_lake_array(lake_array) == position
+            possible_moves = IceBreaker.get_possible_moves(lake_array)
+            assert BitIceBreaker.get_possible_moves(position) == possible_moves
+            assert BitIceBreaker._analyze_moves(game_state) == IceBreaker._analyze_moves(game_state)
+
+            block_index = rng.choice(possible_moves)
+            new_lake_array = IceBreaker.apply_move(lake_array, block_index, grid_size)
+            new_position = BitIceBreaker.apply_move(position, block_index, grid_size)
+            game.pick_block(game_state, block_index)
+            bit_game.pick_block(game_state, block_index)
+            assert bit_game.lake_array == game.lake_array
+            assert bit_game.game_ended == game.game_ended
+            if new_lake_array is None:
+                assert new_position is None
+                assert game.game_ended
+                assert bit_game.winner.id == game.winner.id
+                break
+            assert not game.game_ended
+            assert BitIceBreaker.get_game_state_from_position(new_position, grid_size) == \
+                ''.join(map(str, new_lake_array))
+            lake_array, position = new_lake_array, new_position
+
+
+@pytest.mark.parametrize('grid_size', GRID_SIZES)
+def test_register_uniced_block_matches_ice_breaker(grid_size):
+    rng = random.Random(grid_size)
+    for _ in range(GAMES_PER_GRID_SIZE):
+        game, _ = new_games(grid_size, rng.random())
+        while not game.game_ended:
+            block_index = rng.choice(IceBreaker.get_possible_moves(game.lake_array))
+            lake_array = list(game.lake_array)
+            result = BitIceBreaker.register_uniced_block(lake_array, block_index, grid_size)
+            game.pick_block(game.get_game_state(), block_index)
+            assert (result == -1) == game.game_ended
+            assert lake_array == game.lake_array
+
+
+def test_analysis_is_shared_by_the_engines():
+    game_state = IceBreaker(6, 14).get_game_state()
+    losing_moves, footprints = IceBreaker.analyze_moves(game_state)
+    assert BitIceBreaker.analyze_moves(game_state)[1] is footprints
+    assert losing_moves == () and footprints == {block_index: 1 << block_index for block_index in range(36)
+                                                 if block_index != 14}
+    with pytest.raises(TypeError):
+        footprints[14] = 0
@@ -0,0 +1,26 @@
+import pytest
+
+from models.evaluation import Evaluation
+from models.intellect import Intellect
+from models.solver import Solver
+from tests.conftest import GRID_SIZE
+
+
+@pytest.mark.usefixtures('trained_db')
+def test_results_do_not_depend_on_the_workers():
+    reports = [Evaluation(GRID_SIZE, workers, seed=3).run(96) for workers in (1, 2)]
+    assert reports[0]['episodes'] == 96
+    assert reports[0] == reports[1]
+
+
+@pytest.mark.usefixtures('trained_db')
+def test_transposition_table_is_cleared_once_per_task(monkeypatch):
+    clears = []
+    monkeypatch.setattr(Solver, 'clear', lambda solver: clears.append(solver))
+    monkeypatch.setattr(Evaluation, '_con', None)
+    evaluation = Evaluation(GRID_SIZE, cycles_per_task=2)
+    engine = next(name for name, engine in Intellect.ENGINES.items() if engine is Intellect.ENGINE)
+    results = evaluation._play_episodes(GRID_SIZE, engine, 0, evaluation._get_task_episodes(0))
+    Evaluation._con.close()
+    assert len(results) == evaluation.episodes_per_task > 1
+    assert clears == [Intellect.get_solver()]
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+from models.symmetry import Symmetry
+
+ENGINES = [IceBreaker, BitIceBreaker]
+
+
+def transform_game_state(game_state: str, transform: int):
+    permutation, _ = Symmetry.get_permutations(int(len(game_state) ** 0.5))[transform]
+    return ''.join(map(game_state.__getitem__, permutation))
+
+
+def play(engine, game_state: str, block_index: int):
+    """
+    Returns:
+        (str|None) game state after picking block_index, None if it ends the game
+    """
+    lake_array = list(map(int, game_state))
+    if engine.register_uniced_block(lake_array, block_index, int(len(game_state) ** 0.5)) == -1:
+        return None
+    return ''.join(map(str, lake_array))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('transform', range(8))
+def test_cascade_reaching_collapsed_block_does_not_end_game(engine, transform):
+    # in some orientations the cascade of block 10 reaches a block it has already collapsed, which used to end the game
+    game_state = transform_game_state('2111101111110110', transform)
+    block_index = Symmetry.to_canonical_move(10, 4, transform)
+    assert play(engine, game_state, block_index) == transform_game_state('2111000000000000', transform)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('grid_size', [4, 5, 6])
+def test_moves_do_not_depend_on_orientation(engine, grid_size):
+    rng = random.Random(grid_size)
+    for _ in range(30):
+        random.seed(rng.random())
+        game = IceBreaker(grid_size)
+        while not game.game_ended:
+            game_state = game.get_game_state()
+            possible_moves = IceBreaker.get_possible_moves(game.lake_array)
+            for block_index in possible_moves:
+                new_game_state = play(engine, game_state, block_index)
+                for transform in range(1, 8):
+                    transformed_game_state = play(engine, transform_game_state(game_state, transform),
+                                                  Symmetry.to_canonical_move(block_index, grid_size, transform))
+                    assert transformed_game_state == (None if new_game_state is None else
+                                                      transform_game_state(new_game_state, transform))
+            game.pick_block(game_state, rng.choice(possible_moves))
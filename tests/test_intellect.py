@@ -0,0 +1,65 @@
+import pytest
+
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+from models.shard_router import ShardRouter
+from models.symmetry import Symmetry
+
+GAME_STATE = Symmetry.canonicalize_game_state(IceBreaker(4, 5).get_game_state())[0]
+WINNING_MOVE = GAME_STATE.index(str(IceBreaker.BlockState.ICED.value))
+
+
+@pytest.fixture
+def con(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    con = Intellect.get_db_conn(4)
+    yield con
+    con.close()
+
+
+def add_winning_move(con):
+    with con:
+        con.execute('INSERT INTO q_table (game_state, block_index, num_wins, num_games) VALUES (?, ?, 1, 1)',
+                    (IceBreaker.encode_game_state(GAME_STATE), WINNING_MOVE))
+
+
+@pytest.mark.parametrize('experimentation, fallback, has_winning_move, branch', [
+    (0, None, True, 'optimal'),
+    (0, 'mcts', True, 'optimal'),
+    (100, None, True, 'unattempted'),
+    (0, None, False, 'unattempted'),
+    (0, 'mcts', False, 'mcts'),
+    (100, 'mcts', False, 'unattempted'),
+])
+def test_optimal_move_branches(con, experimentation, fallback, has_winning_move, branch):
+    if has_winning_move:
+        add_winning_move(con)
+    log_message, move = Intellect.get_optimal_move(con, GAME_STATE, experimentation, fallback=fallback)
+    assert log_message == branch
+    assert GAME_STATE[move] == str(IceBreaker.BlockState.ICED.value)
+    if branch == 'optimal':
+        assert move == WINNING_MOVE
+
+
+def test_compaction_keeps_the_rows_updated_last(con):
+    encoded_game_state = IceBreaker.encode_game_state(GAME_STATE)
+    with con:
+        con.executemany(ShardRouter.INSERT_SQL, [(encoded_game_state, block_index, 0, 1) for block_index in range(10)])
+        con.execute('UPDATE q_table SET last_updated = 1')
+        # the row inserted first is the one updated last
+        con.execute(ShardRouter.get_upsert_sql(Intellect.GUARANTEED_LOSS), (encoded_game_state, 0, 1, 1))
+    report = Intellect.compact_q_table(4, min_games=10, keep_recent_rows=1, lookup_samples=0)
+    assert report['deleted_rows'] == 9
+    assert con.execute('SELECT block_index, num_wins, num_games FROM q_table').fetchall() == [(0, 1, 2)]
+
+
+def test_resharding_keeps_the_update_times(con):
+    encoded_game_states = [IceBreaker.encode_game_state(game_state) for game_state in
+                           ('2111111111111111', '0211111111111111', '1011111111111112')]
+    with con:
+        con.executemany(ShardRouter.COPY_SQL, [(encoded_game_state, 1, 0, 1, last_updated)
+                                               for last_updated, encoded_game_state in enumerate(encoded_game_states)])
+    rows = con.execute('SELECT * FROM q_table ORDER BY 1').fetchall()
+    assert Intellect.reshard_q_table(4, 'bear', 2) == [1, 2]
+    assert Intellect.reshard_q_table(4) == [3]
+    assert con.execute('SELECT * FROM q_table ORDER BY 1').fetchall() == rows
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.ice_breaker import IceBreaker
+from models.intellect import Intellect
+from models.shard_router import ShardRouter
+from models.symmetry import Symmetry
+
+GRID_SIZE = 4
+# block 10 used to end the game in this orientation, although the bear is never reached
+STALE_GAME_STATE = '2111101111110110'
+LOSING_GAME_STATE = '2111011111111111'
+# q_table before schema version 4
+Q_TABLE_DDL = """
+    CREATE TABLE q_table (game_state BLOB NOT NULL, block_index INTEGER NOT NULL, num_wins INTEGER NOT NULL,
+                          num_games INTEGER NOT NULL, PRIMARY KEY (game_state, block_index));
+"""
+
+
+def get_rows():
+    """
+    Returns:
+        (list) q_table rows of the game states as text, the first being the stale guaranteed loss
+    """
+    losing_move = BitIceBreaker.analyze_moves(LOSING_GAME_STATE)[0][0]
+    return [(*Symmetry.canonicalize_move(STALE_GAME_STATE, 10), Intellect.GUARANTEED_LOSS, -Intellect.GUARANTEED_LOSS),
+            (*Symmetry.canonicalize_move(LOSING_GAME_STATE, losing_move), Intellect.GUARANTEED_LOSS,
+             -Intellect.GUARANTEED_LOSS),
+            (*Symmetry.canonicalize_move(STALE_GAME_STATE, 3), 2, 5)]
+
+
+def create_db(schema_version: int, shard_count: int = 1):
+    con = sqlite3.connect(Intellect.get_db_path(GRID_SIZE))
+    con.executescript('CREATE TABLE q_meta (property TEXT PRIMARY KEY NOT NULL, property_val INTEGER NOT NULL);'
+                      + Q_TABLE_DDL)
+    rows = get_rows()
+    if schema_version == 3:
+        rows = rows[1:]
+    if schema_version == 1:
+        con.executemany('INSERT INTO q_table VALUES (?, ?, ?, ?)', rows)
+    else:
+        con.execute("INSERT INTO q_meta VALUES ('schema_version', ?)", (schema_version,))
+        rows = [(IceBreaker.encode_game_state(game_state), *row) for game_state, *row in rows]
+        if shard_count == 1:
+            con.executemany('INSERT INTO q_table VALUES (?, ?, ?, ?)', rows)
+        else:
+            con.executemany('INSERT INTO q_meta VALUES (?, ?)', [('shard_key', 0), ('shard_count', shard_count)])
+            for shard_index in range(shard_count):
+                shard = sqlite3.connect(ShardRouter.get_shard_path(Intellect.get_db_path(GRID_SIZE), shard_index))
+                with shard:
+                    shard.executescript(Q_TABLE_DDL)
+                    shard.executemany('INSERT INTO q_table VALUES (?, ?, ?, ?)', [
+                        row for row in rows
+                        if ShardRouter.get_shard_index(row[0], GRID_SIZE, 'iced', shard_count) == shard_index])
+                shard.close()
+    con.commit()
+    con.close()
+
+
+def get_migrated_rows():
+    """
+    Returns:
+        (list) q_table rows of the game states as text, with their update time
+    """
+    con = Intellect.get_db_conn(GRID_SIZE)
+    tables = con.shards if isinstance(con, ShardRouter) else [con]
+    rows = sorted((IceBreaker.decode_game_state(row[0], GRID_SIZE), *row[1:]) for table in tables for row in
+                  table.execute('SELECT game_state, block_index, num_wins, num_games, last_updated FROM q_table'))
+    con.close()
+    return rows
+
+
+@pytest.mark.parametrize('schema_version, shard_count', [(1, 1), (2, 1), (2, 3), (3, 1), (3, 3)])
+def test_migrate_db(tmp_path, monkeypatch, schema_version, shard_count):
+    monkeypatch.chdir(tmp_path)
+    create_db(schema_version, shard_count)
+    with pytest.raises(RuntimeError, match='migrate_db'):
+        Intellect.get_db_conn(GRID_SIZE)
+
+    migrated_rows = Intellect.migrate_db(GRID_SIZE)
+    assert migrated_rows.get(2) == (3 if schema_version == 1 else None)
+    assert migrated_rows.get(3) == (1 if schema_version < 3 else None)
+    assert migrated_rows[4] == 2
+    assert get_migrated_rows() == sorted((*row, 0) for row in get_rows()[1:])
+    assert Intellect.migrate_db(GRID_SIZE) == {}
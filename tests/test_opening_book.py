@@ -0,0 +1,22 @@
+import pytest
+
+from models.intellect import Intellect
+from models.opening_book import OpeningBook
+from tests.conftest import GRID_SIZE
+
+
+@pytest.mark.usefixtures('trained_db')
+@pytest.mark.parametrize('reload_seconds, reloads', [(0, True), (60, False)])
+def test_reloads_are_throttled(reload_seconds, reloads):
+    opening_book = OpeningBook(GRID_SIZE, 1, reload_seconds)
+    assert opening_book.should_load(1)
+    con = Intellect.get_db_conn(GRID_SIZE)
+    opening_book.load_q_table_moves(con, 1)
+    con.close()
+    game_state = opening_book.game_states[0]
+    assert opening_book.get_q_table_moves(game_state, 1)
+    assert not opening_book.should_load(1)
+
+    # moves of another version are never served, whether they are reloaded yet or not
+    assert opening_book.should_load(2) == reloads
+    assert opening_book.get_q_table_moves(game_state, 2) is None
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from models.intellect import Intellect
+from scripts.optimal_move_api import OptimalMoveServer
+
+INITIAL_STATE = '2' + '1' * 80
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    httpd = OptimalMoveServer(('127.0.0.1', 0), [4, 9], threads=2, minimax_workers=1, request_timeout=0.5)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
+
+
+def get(httpd: OptimalMoveServer, query: str, body: str = None):
+    """
+    Returns:
+        (int, str) status and body of the response to GET ?query, or to POST ?query if body is given
+    """
+    request = Request(f'http://127.0.0.1:{httpd.server_address[1]}/?{query}',
+                      data=None if body is None else body.encode())
+    try:
+        with urlopen(request, timeout=30) as response:
+            return response.status, response.read().decode()
+    except HTTPError as e:
+        return e.code, e.read().decode()
+
+
+@pytest.mark.parametrize('game_state, error', [('1' * 81, 'exactly one bear'), ('1' * 79 + '22', 'exactly one bear'),
+                                               ('x' + '1' * 79 + '2', 'should be 0'), ('1112', 'grid size')])
+def test_invalid_game_state(server, game_state, error):
+    status, body = get(server, f'array={game_state}')
+    assert status == 400
+    assert json.loads(body)['index'] == 0 and error in json.loads(body)['error']
+
+    status, body = get(server, '', json.dumps([INITIAL_STATE, '1211111111111111', game_state]))
+    assert status == 400
+    assert json.loads(body)['index'] == 2 and error in json.loads(body)['error']
+    status, body = get(server, '', f'1211111111111111\n{game_state}')
+    assert status == 400 and json.loads(body)['index'] == 1
+
+
+def test_batch(server):
+    status, body = get(server, '', json.dumps(['1211111111111111', '1111111111111112']))
+    assert status == 200
+    assert all(move in range(16) for move in json.loads(body))
+
+
+@pytest.mark.parametrize('query', [f'array={INITIAL_STATE}&minimax', f'array={INITIAL_STATE}&mcts&budget_ms=60000',
+                                   f'array={INITIAL_STATE}&budget_ms=60000'])
+def test_timed_out_search_frees_its_process(server, query):
+    start = time.monotonic()
+    assert get(server, query)[0] == 504
+    # the search has stopped, so the only minimax process is free again
+    status, body = get(server, 'array=1111121111111111&minimax')
+    assert status == 200 and int(body) in range(16)
+    assert time.monotonic() - start < 5
+
+
+def test_search_past_deadline_does_not_start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deadline = time.monotonic() - 1
+    with pytest.raises(TimeoutError):
+        Intellect.get_minimax_move(INITIAL_STATE, deadline=deadline)
+    with pytest.raises(TimeoutError):
+        Intellect.get_minimax_move_within(INITIAL_STATE, 1000, deadline)
+    with pytest.raises(TimeoutError):
+        Intellect.get_mcts_move(INITIAL_STATE, 1000, deadline=deadline)
+
+
+def test_search_stops_at_deadline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        Intellect.get_minimax_move(INITIAL_STATE, deadline=start + 0.2)
+    move, _, _, _ = Intellect.get_mcts_move(INITIAL_STATE, 60000, deadline=time.monotonic() + 0.2)
+    assert move in range(81)
+    assert time.monotonic() - start < 3
@@ -0,0 +1,73 @@
+import random
+
+from concurrent.futures import Executor, Future
+
+import pytest
+
+from models.bit_ice_breaker import BitIceBreaker
+from models.intellect import Intellect
+from models.parallel_solver import ParallelSolver
+from models.solver import Solver
+from scripts.benchmark_minimax import get_positions
+
+
+class ImmediateExecutor(Executor):
+    """
+    Runs every task as soon as it is submitted, in this process
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, /, *args, **kwargs):
+        self.tasks.append(args)
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def is_won_after(game_state: str, move: int):
+    """
+    Returns:
+        (bool) whether the player to move in game_state wins by picking move
+    """
+    grid_size = int(len(game_state) ** 0.5)
+    position = BitIceBreaker.apply_move(BitIceBreaker.get_position(game_state), move, grid_size)
+    if position is None:
+        return False
+    return not Solver.is_win(Solver().get_best_move(BitIceBreaker.get_game_state_from_position(position,
+                                                                                                grid_size))[1])
+
+
+@pytest.mark.parametrize('split_depth', [1, 2])
+def test_moves_match_solver(split_depth):
+    random.seed(split_depth)
+    for game_state in get_positions(6, 6, 22):
+        executor = ImmediateExecutor()
+        move = ParallelSolver(executor, 2, split_depth).get_best_move(game_state)
+        assert is_won_after(game_state, move) == Solver.is_win(Solver().get_best_move(game_state)[1])
+        # a position reached by several move orders is solved once
+        searched_states = [game_state for game_state, _, _ in executor.tasks]
+        assert len(searched_states) == len(set(searched_states))
+
+
+def test_stopped_leaves_do_not_time_out(monkeypatch):
+    monkeypatch.setattr(ParallelSolver, '_solve_leaf', classmethod(lambda cls, *args: None))
+    random.seed(0)
+    game_state, = get_positions(6, 1, 22)
+    assert ParallelSolver(ImmediateExecutor(), 2).get_best_move(game_state) is not None
+
+
+def test_leaf_started_after_the_search_is_stopped():
+    random.seed(0)
+    game_state, = get_positions(6, 1, 22)
+    assert ParallelSolver._solve_leaf(game_state, 'icebreaker_split_removed', 0) is None
+
+
+def test_small_states_are_not_split():
+    random.seed(0)
+    game_state, = get_positions(6, 1, ParallelSolver.MIN_ICED_BLOCKS)
+    executor = ImmediateExecutor()
+    move = Intellect.get_minimax_move(game_state, 2, executor)
+    assert executor.tasks == []
+    assert is_won_after(game_state, move) == Solver.is_win(Solver().get_best_move(game_state)[1])
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from models.intellect import Intellect
+from models.q_table import QTable
+from tests.conftest import GRID_SIZE, train_in_directory
+
+
+def train_from_snapshots(num_episodes: int, workers: int, episodes_per_task: int, seed: int):
+    """
+    Plays the tasks of train_vs_self_parallel one after another, each of them on a fresh snapshot of the q_table
+    """
+    con = Intellect.get_db_conn(GRID_SIZE)
+    task_index = 0
+    remaining_episodes = num_episodes
+    while remaining_episodes > 0:
+        learnings = []
+        for _ in range(workers):
+            task_episodes = min(episodes_per_task, remaining_episodes)
+            if task_episodes <= 0:
+                break
+            remaining_episodes -= task_episodes
+            random.seed(seed + task_index)
+            snapshot_con = Intellect.get_read_only_db_conn(GRID_SIZE)
+            q_table = QTable(snapshot_con, Intellect.GUARANTEED_LOSS, flush_episodes=0, max_states=0)
+            for _ in range(task_episodes):
+                game_obj, _ = Intellect._play_vs_self(q_table, GRID_SIZE, 40)
+                q_table.add_episode(*Intellect._get_episode_data(game_obj, 40))
+            snapshot_con.close()
+            learnings.append((q_table.pending_q_table, q_table.pending_q_meta))
+            task_index += 1
+        with con:
+            for pending_q_table, pending_q_meta in learnings:
+                QTable.upsert(con, Intellect.GUARANTEED_LOSS, pending_q_table, pending_q_meta)
+    con.close()
+
+
+def test_parallel_training_matches_fresh_snapshots(tmp_path):
+    parallel = train_in_directory(tmp_path, 'parallel', lambda: Intellect.train_vs_self_parallel(
+        GRID_SIZE, 300, 40, workers=2, episodes_per_task=50, seed=7))
+    snapshots = train_in_directory(tmp_path, 'snapshots', lambda: train_from_snapshots(
+        300, workers=2, episodes_per_task=50, seed=7))
+    assert parallel[0]
+    assert parallel == snapshots
+
+
+@pytest.mark.usefixtures('trained_db')
+def test_worker_reuses_rows_of_its_round(monkeypatch):
+    for name in ('ENGINE', '_training_connection', '_training_q_table', '_training_round'):
+        monkeypatch.setattr(Intellect, name, getattr(Intellect, name))
+
+    Intellect._init_train_vs_self_worker(GRID_SIZE, 'list')
+    first = Intellect._train_vs_self_task(0, GRID_SIZE, 50, 40, seed=1)
+    cached_states = len(Intellect._training_q_table.q_table)
+    second = Intellect._train_vs_self_task(0, GRID_SIZE, 50, 40, seed=2)
+    assert len(Intellect._training_q_table.q_table) >= cached_states > 0
+    Intellect._training_connection.close()
+
+    Intellect._init_train_vs_self_worker(GRID_SIZE, 'list')
+    assert Intellect._train_vs_self_task(0, GRID_SIZE, 50, 40, seed=2) == second
+    assert Intellect._train_vs_self_task(1, GRID_SIZE, 50, 40, seed=1) == first
+    Intellect._training_connection.close()
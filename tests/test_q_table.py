@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from models.intellect import Intellect
+from models.q_table import QTable
+from tests.conftest import GRID_SIZE, train_in_directory
+
+
+def train_twice(**kwargs):
+    Intellect.train_vs_self(GRID_SIZE, 300, **kwargs)
+    random.seed(2)
+    Intellect.train_vs_self(GRID_SIZE, 300, **kwargs)
+
+
+@pytest.mark.parametrize('max_states', [0, 50])
+def test_batched_training_matches_direct_training(tmp_path, monkeypatch, max_states):
+    monkeypatch.setattr(QTable, 'MAX_STATES', max_states)
+    direct = train_in_directory(tmp_path, 'direct', train_twice)
+    batched = train_in_directory(tmp_path, 'batched', lambda: train_twice(flush_episodes=7))
+    assert direct[0]
+    assert batched == direct
+
+
+@pytest.mark.usefixtures('trained_db')
+def test_states_are_loaded_on_first_use():
+    con = Intellect.get_db_conn(GRID_SIZE)
+    (game_state, block_index, num_wins, num_games), = con.execute(
+        'SELECT game_state, block_index, num_wins, num_games FROM q_table WHERE num_wins >= 0 LIMIT 1').fetchall()
+    q_table = QTable(con, Intellect.GUARANTEED_LOSS, flush_episodes=0)
+    assert q_table.q_table == {}
+    assert (block_index, num_wins, num_games) in q_table.get_rows(game_state)
+    assert list(q_table.q_table) == [game_state]
+    assert q_table.get_rows(b'\xff\xff\xff') == []
+    con.close()
+
+
+@pytest.mark.usefixtures('trained_db')
+def test_reset_drops_pending_updates():
+    con = Intellect.get_db_conn(GRID_SIZE)
+    game_state, = con.execute('SELECT game_state FROM q_table LIMIT 1').fetchone()
+    q_table = QTable(con, Intellect.GUARANTEED_LOSS, flush_episodes=0)
+    rows = q_table.get_rows(game_state)
+    q_table.add_episode([(game_state, rows[0][0], 1, 1), (game_state, 99, 0, 1)], [('p1_wins',)])
+    assert q_table.get_rows(game_state) != rows
+    q_table.reset()
+    assert q_table.get_rows(game_state) == rows
+    assert q_table.pending_q_table == {} and q_table.pending_q_meta == {}
+    con.close()
+
+
+def train_on_q_table(q_table: QTable, num_episodes: int, max_cached_states: int):
+    for _ in range(num_episodes):
+        game_obj, _ = Intellect._play_vs_self(q_table, GRID_SIZE, 40)
+        q_table.add_episode(*Intellect._get_episode_data(game_obj, 40))
+        assert len(q_table.q_table) - len(q_table.pending_game_states) <= max_cached_states
+
+
+def test_cache_is_bounded_without_flushing(tmp_path):
+    direct = train_in_directory(tmp_path, 'direct', lambda: Intellect.train_vs_self(GRID_SIZE, 300))
+
+    def train_without_flushing():
+        con = Intellect.get_db_conn(GRID_SIZE)
+        q_table = QTable(con, Intellect.GUARANTEED_LOSS, flush_episodes=0, max_states=10)
+        train_on_q_table(q_table, 300, 10)
+        assert len(q_table.pending_game_states) > 10
+        q_table.flush()
+        con.close()
+
+    assert train_in_directory(tmp_path, 'cached', train_without_flushing) == direct
+
+
+@pytest.mark.usefixtures('trained_db')
+def test_cache_is_bounded_without_storing():
+    con = Intellect.get_db_conn(GRID_SIZE)
+    rows = con.execute('SELECT * FROM q_table ORDER BY 1, 2').fetchall()
+    q_table = QTable(con, Intellect.GUARANTEED_LOSS, flush_episodes=0, max_states=10, store=False)
+    train_on_q_table(q_table, 100, 10)
+    assert q_table.pending_q_table == {} and q_table.pending_q_meta == {}
+    q_table.flush()
+    assert con.execute('SELECT * FROM q_table ORDER BY 1, 2').fetchall() == rows
+    con.close()
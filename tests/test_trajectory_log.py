@@ -0,0 +1,77 @@
+from models.intellect import Intellect
+from models.trajectory_log import TrajectoryLog
+from tests.conftest import GRID_SIZE, train_in_directory
+
+
+def train_with_log(train):
+    """
+    Calls train with a trajectory log, and aggregates the log into the database
+    """
+    trajectory_log = TrajectoryLog('logs', GRID_SIZE)
+    try:
+        train(trajectory_log=trajectory_log)
+    finally:
+        trajectory_log.close()
+    Intellect.aggregate_trajectory_logs(GRID_SIZE, TrajectoryLog.get_paths('logs', GRID_SIZE))
+
+
+def assert_aggregation_matches_training(tmp_path, train):
+    direct = train_in_directory(tmp_path, 'direct', train, seed=3)
+    logged = train_in_directory(tmp_path, 'logged', lambda: train_with_log(train), seed=3)
+    assert any(num_wins == Intellect.GUARANTEED_LOSS for _, _, num_wins, _ in direct[0])
+    assert direct == logged
+
+
+def test_aggregated_self_play_matches_training(tmp_path):
+    assert_aggregation_matches_training(
+        tmp_path, lambda **kwargs: Intellect.train_vs_self(GRID_SIZE, 200, 40, **kwargs))
+
+
+def test_aggregated_training_vs_minimax_matches_training(tmp_path):
+    assert_aggregation_matches_training(
+        tmp_path, lambda **kwargs: Intellect.train_vs_minimax(GRID_SIZE, 20, 40, **kwargs))
+
+
+def test_aggregated_parallel_self_play_matches_training(tmp_path):
+    # a single round, as the rounds of a logged training all play against the database they started from
+    assert_aggregation_matches_training(
+        tmp_path,
+        lambda **kwargs: Intellect.train_vs_self_parallel(GRID_SIZE, 100, 40, workers=2, episodes_per_task=50, seed=5,
+                                                          **kwargs))
+
+
+def test_explored_plies_round_trip(tmp_path):
+    trajectory_log = TrajectoryLog(str(tmp_path), GRID_SIZE)
+    trajectory_log.append(5, [1, 2, 3], 1, 40)
+    trajectory_log.append(6, list(range(10)), 2, 40, 1, [0, 8, 9])
+    trajectory_log.close()
+    path, = TrajectoryLog.get_paths(str(tmp_path), GRID_SIZE)
+    assert list(TrajectoryLog.read(path)) == [
+        (5, [1, 2, 3], 1, 40, 0, []),
+        (6, list(range(10)), 2, 40, 1, [0, 8, 9]),
+    ]
+
+
+def test_record_cut_in_explored_plies_is_ignored(tmp_path):
+    trajectory_log = TrajectoryLog(str(tmp_path), GRID_SIZE)
+    trajectory_log.append(5, [1, 2, 3], 1, 40, 0, [1])
+    trajectory_log.append(6, list(range(10)), 2, 40, 0, [9])
+    trajectory_log.close()
+    path, = TrajectoryLog.get_paths(str(tmp_path), GRID_SIZE)
+    with open(path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 1)
+    assert list(TrajectoryLog.read(path)) == [(5, [1, 2, 3], 1, 40, 0, [1])]
+
+
+def test_logs_sharing_a_directory_write_different_files(tmp_path):
+    # both logs are created before either has started a file, like two processes started together
+    trajectory_logs = [TrajectoryLog(str(tmp_path), GRID_SIZE, max_bytes=20) for _ in range(2)]
+    for episode in range(3):
+        for bear_index, trajectory_log in enumerate(trajectory_logs):
+            trajectory_log.append(bear_index, list(range(10)), 1, 40, 0, [episode])
+    for trajectory_log in trajectory_logs:
+        trajectory_log.close()
+    paths = TrajectoryLog.get_paths(str(tmp_path), GRID_SIZE)
+    assert len(paths) == 6
+    assert sorted(episode for path in paths for episode in TrajectoryLog.read(path)) == sorted(
+        (bear_index, list(range(10)), 1, 40, 0, [episode]) for episode in range(3) for bear_index in range(2))